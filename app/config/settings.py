@@ -23,5 +23,128 @@ class Settings:
         # Clave para modelo Groq/LLaMA3
         self.GROQ_API_KEY = os.getenv("GROQ_API_KEY", None)
 
+        # Configuración de embeddings
+        self.EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "models/text-embedding-004")
+        self.EMBEDDING_CACHE_SIZE = int(os.getenv("EMBEDDING_CACHE_SIZE", 2048))
+        self.EMBEDDING_CACHE_TTL = float(os.getenv("EMBEDDING_CACHE_TTL", 3600))
+        self.EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", 100))
+        self.EMBEDDING_MAX_BATCH_CHARS = int(os.getenv("EMBEDDING_MAX_BATCH_CHARS", 200000))
+        self.EMBEDDING_MAX_CONCURRENCY = int(os.getenv("EMBEDDING_MAX_CONCURRENCY", 4))
+
+        # Directorio de datos (montado en /data dentro de Docker)
+        self.DATA_DIR = os.getenv("DATA_DIR", "/data")
+
+        # Directorio para caches persistentes (embeddings, texto extraído, etc.)
+        self.CACHE_DIR = os.getenv("CACHE_DIR", os.path.join(self.DATA_DIR, "cache"))
+
+        # Cache en disco del texto extraído de los PDFs
+        self.TEXT_CACHE_ENABLED = os.getenv("TEXT_CACHE_ENABLED", "true").lower() == "true"
+        self.TEXT_CACHE_DIR = os.getenv("TEXT_CACHE_DIR", os.path.join(self.CACHE_DIR, "text"))
+
+        # Texto de cada documento ingerido (UTF-8, leído con mmap); los chunks son offsets sobre él
+        self.TEXT_STORE_DIR = os.getenv("TEXT_STORE_DIR", os.path.join(self.CACHE_DIR, "documents"))
+
+        # Almacén persistente de embeddings para la ingesta
+        self.EMBEDDING_STORE_PATH = os.getenv(
+            "EMBEDDING_STORE_PATH", os.path.join(self.CACHE_DIR, "embeddings.sqlite")
+        )
+        self.EMBEDDING_STORE_MAX_ENTRIES = int(os.getenv("EMBEDDING_STORE_MAX_ENTRIES", 200000))
+
+        # Extracción de texto en paralelo durante la ingesta
+        self.INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", os.cpu_count() or 1))
+        self.EXTRACTION_TIMEOUT = float(os.getenv("EXTRACTION_TIMEOUT", 300))
+        # Chunks por lote de embeddings + upsert durante la ingesta
+        self.INGEST_BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", 64))
+
+        # Precarga de SDKs, proveedores de modelos y colección al arrancar la API:
+        # "background" (en un hilo, sin retrasar el arranque), "blocking" u "off"
+        self.STARTUP_WARMUP = os.getenv("STARTUP_WARMUP", "background").lower()
+
+        # Enrutamiento entre modelos en /chat: presupuesto de latencia por modelo
+        # ("gemini=30000,llama3=20000", en ms), failover al otro proveedor y hedging
+        # (segundo proveedor en paralelo si el primero supera su p95 reciente)
+        self.MODEL_LATENCY_BUDGETS_MS = os.getenv("MODEL_LATENCY_BUDGETS_MS", "gemini=30000,llama3=30000")
+        self.ROUTING_FAILOVER = os.getenv("ROUTING_FAILOVER", "true").lower() == "true"
+        self.ROUTING_HEDGING = os.getenv("ROUTING_HEDGING", "false").lower() == "true"
+        self.HEDGE_QUANTILE = float(os.getenv("HEDGE_QUANTILE", 0.95))
+        self.HEDGE_MIN_DELAY_MS = float(os.getenv("HEDGE_MIN_DELAY_MS", 500))
+        self.HEDGE_MIN_SAMPLES = int(os.getenv("HEDGE_MIN_SAMPLES", 20))
+
+        # Circuit breaker por proveedor: fallos seguidos que lo abren, segundos abierto
+        # y llamadas de prueba en half_open (un 429 con Retry-After lo abre de inmediato)
+        self.CIRCUIT_FAILURE_THRESHOLD = int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", 5))
+        self.CIRCUIT_RESET_TIMEOUT = float(os.getenv("CIRCUIT_RESET_TIMEOUT", 30))
+        self.CIRCUIT_HALF_OPEN_MAX_CALLS = int(os.getenv("CIRCUIT_HALF_OPEN_MAX_CALLS", 1))
+
+        # Límite adaptativo (AIMD) de llamadas simultáneas por proveedor
+        self.PROVIDER_CONCURRENCY_INITIAL = int(os.getenv("PROVIDER_CONCURRENCY_INITIAL", 8))
+        self.PROVIDER_CONCURRENCY_MIN = int(os.getenv("PROVIDER_CONCURRENCY_MIN", 1))
+        self.PROVIDER_CONCURRENCY_MAX = int(os.getenv("PROVIDER_CONCURRENCY_MAX", 64))
+        # Aumento del límite por cada "ronda" de respuestas rápidas (más alto = se adapta antes a ráfagas)
+        self.PROVIDER_CONCURRENCY_INCREASE = float(os.getenv("PROVIDER_CONCURRENCY_INCREASE", 1))
+        self.PROVIDER_LATENCY_TOLERANCE = float(os.getenv("PROVIDER_LATENCY_TOLERANCE", 2.0))
+        # Segundos que una llamada espera cupo antes de rechazarse
+        self.PROVIDER_QUEUE_TIMEOUT = float(os.getenv("PROVIDER_QUEUE_TIMEOUT", 5))
+
+        # Backend de recuperación para /chat: "chroma" o "numpy" (índice en proceso)
+        self.RETRIEVAL_BACKEND = os.getenv("RETRIEVAL_BACKEND", "chroma").lower()
+        self.VECTOR_INDEX_DIR = os.getenv("VECTOR_INDEX_DIR", os.path.join(self.CACHE_DIR, "vector_index"))
+        self.VECTOR_INDEX_DTYPE = os.getenv("VECTOR_INDEX_DTYPE", "float32")
+
+        # Índice léxico BM25 y búsqueda híbrida (fusión RRF con los resultados vectoriales)
+        self.LEXICAL_INDEX_ENABLED = os.getenv("LEXICAL_INDEX_ENABLED", "true").lower() == "true"
+        self.LEXICAL_INDEX_PATH = os.getenv(
+            "LEXICAL_INDEX_PATH", os.path.join(self.CACHE_DIR, "lexical_index.json.gz")
+        )
+        self.HYBRID_SEARCH = os.getenv("HYBRID_SEARCH", "true").lower() == "true"
+        self.HYBRID_CANDIDATES = int(os.getenv("HYBRID_CANDIDATES", 20))
+        self.RRF_K = int(os.getenv("RRF_K", 60))
+        # Tiempo máximo (ms) para el embedding de la consulta antes de responder
+        # solo con el índice léxico (0 = sin límite)
+        self.EMBEDDING_LATENCY_BUDGET_MS = float(os.getenv("EMBEDDING_LATENCY_BUDGET_MS", 1500))
+
+        # Cache semántico de respuestas de /chat (por similitud del embedding de la pregunta)
+        self.SEMANTIC_CACHE_ENABLED = os.getenv("SEMANTIC_CACHE_ENABLED", "true").lower() == "true"
+        self.SEMANTIC_CACHE_SIZE = int(os.getenv("SEMANTIC_CACHE_SIZE", 1000))
+        self.SEMANTIC_CACHE_TTL = float(os.getenv("SEMANTIC_CACHE_TTL", 86400))
+        self.SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", 0.95))
+
+        # Cache exacto de respuestas de /chat (memoria + SQLite; ruta vacía = solo memoria)
+        self.RESPONSE_CACHE_ENABLED = os.getenv("RESPONSE_CACHE_ENABLED", "true").lower() == "true"
+        self.RESPONSE_CACHE_SIZE = int(os.getenv("RESPONSE_CACHE_SIZE", 512))
+        self.RESPONSE_CACHE_TTL = float(os.getenv("RESPONSE_CACHE_TTL", 86400))
+        self.RESPONSE_CACHE_PATH = os.getenv(
+            "RESPONSE_CACHE_PATH", os.path.join(self.CACHE_DIR, "responses.sqlite")
+        )
+        self.RESPONSE_CACHE_DISK_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_DISK_MAX_ENTRIES", 10000))
+
+        # Endpoint /chat/batch: preguntas por request y generaciones simultáneas
+        self.BATCH_MAX_QUESTIONS = int(os.getenv("BATCH_MAX_QUESTIONS", 100))
+        self.BATCH_MAX_CONCURRENCY = int(os.getenv("BATCH_MAX_CONCURRENCY", 4))
+
+        # Presupuesto de tokens (estimados) del contexto del prompt según el modo de respuesta
+        self.CONTEXT_TOKEN_BUDGET_BRIEF = int(os.getenv("CONTEXT_TOKEN_BUDGET_BRIEF", 1000))
+        self.CONTEXT_TOKEN_BUDGET_EXTENDED = int(os.getenv("CONTEXT_TOKEN_BUDGET_EXTENDED", 3000))
+        # Texto vecino (bytes por lado) que se agrega a cada chunk si queda presupuesto (0 = no ampliar)
+        self.CONTEXT_NEIGHBOUR_CHARS = int(os.getenv("CONTEXT_NEIGHBOUR_CHARS", 0))
+
+        # Chunks por página al recorrer la colección completa (catálogo, índices, verificación)
+        self.SCAN_PAGE_SIZE = int(os.getenv("SCAN_PAGE_SIZE", 1000))
+
+        # Catálogo de fuentes para /sources (lo escribe la ingesta)
+        self.SOURCE_CATALOG_PATH = os.getenv(
+            "SOURCE_CATALOG_PATH", os.path.join(self.CACHE_DIR, "source_catalog.json")
+        )
+
+        # Sello de versión del corpus (lo actualiza la ingesta; invalida los caches de respuestas)
+        self.CORPUS_VERSION_PATH = os.getenv(
+            "CORPUS_VERSION_PATH", os.path.join(self.CACHE_DIR, "corpus_version")
+        )
+
+        # Manifiesto de ingesta incremental
+        self.INGEST_MANIFEST_PATH = os.getenv(
+            "INGEST_MANIFEST_PATH", os.path.join(self.CACHE_DIR, "ingest_manifest.json")
+        )
+
 # Crear instancia global de Settings
 settings = Settings()
@@ -1,10 +1,18 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import PlainTextResponse
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from config.settings import settings
-from rag.chroma_manager import add_document
+from rag.metrics import (
+    REGISTRY, record_cache_lookup, record_chat_request, stage, start_request_timings, track_request
+)
+from rag.singleflight import SingleFlight
+import asyncio
+import json
 import logging
+import threading
+import time
 from pathlib import Path
+from typing import Optional
 
 # Configurar logging
 logging.basicConfig(level=logging.INFO)
@@ -23,15 +31,53 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Server-Timing"],  # Desglose de tiempos legible desde el frontend
 )
 
+@app.on_event("startup")
+def load_vector_index():
+    """Carga (mmap) el índice vectorial en proceso si es el backend activo."""
+    if settings.RETRIEVAL_BACKEND == "numpy":
+        try:
+            from rag.vector_index import get_vector_index
+            if not get_vector_index().ensure_loaded():
+                logger.warning("⚠️ No hay snapshot del índice vectorial; /chat usará ChromaDB")
+        except Exception as e:
+            logger.error(f"Error cargando índice vectorial: {e}", exc_info=True)
+
+def warm_up():
+    """
+    Importa los SDKs y crea los proveedores de modelos y la colección para que
+    la primera request de /chat no pague ese costo.
+    """
+    started = time.perf_counter()
+    try:
+        from rag.models import get_model_manager
+        from rag.embeddings import get_genai
+        from rag.chroma_manager import get_or_create_collection
+        
+        get_model_manager()
+        get_genai()
+        get_or_create_collection("documentos_ucaldas")
+        logger.info(f"✅ Precarga completada en {time.perf_counter() - started:.2f}s")
+    except Exception as e:
+        logger.warning(f"⚠️ Precarga incompleta: {e}")
+
+@app.on_event("startup")
+def start_warm_up():
+    """Lanza la precarga según STARTUP_WARMUP (background, blocking u off)."""
+    if settings.STARTUP_WARMUP == "blocking":
+        warm_up()
+    elif settings.STARTUP_WARMUP == "background":
+        threading.Thread(target=warm_up, name="warm-up", daemon=True).start()
+
 @app.get("/")
 def read_root():
     # Conexión rápida para probar que Chroma funciona
     try:
         from rag.chroma_client import get_chroma_client
         client = get_chroma_client()
-        client.list_collections()
+        client.heartbeat()
         status = "Conexión exitosa a ChromaDB"
     except Exception as e:
         status = f"Error conectando a ChromaDB: {e}"
@@ -46,6 +92,8 @@ def read_root():
 @app.post("/ingest_test")
 def ingest_test():
     try:
+        from rag.chroma_manager import add_document
+        
         texto = "La Universidad de Caldas es una institución pública ubicada en Manizales, Colombia, reconocida por su excelencia académica."
         resultado = add_document(
             collection_name="documentos_ucaldas",
@@ -60,14 +108,21 @@ def ingest_test():
 
 # 🚀 Endpoint para ingerir todo el corpus
 @app.post("/ingest_all")
-def ingest_all():
+def ingest_all(force: bool = False):
     """
     Endpoint para ingerir todos los documentos del corpus en ChromaDB.
-    Lee corpus_metadata.json y procesa todos los archivos.
+    Lee corpus_metadata.json y procesa solo los archivos nuevos o modificados
+    (usar ?force=true para reprocesar todo).
     """
     try:
         from rag.ingest_all import ingest_all_documents
-        result = ingest_all_documents()
+        from rag.metrics import INGEST_IN_PROGRESS
+        
+        INGEST_IN_PROGRESS.inc()
+        try:
+            result = ingest_all_documents(force=force)
+        finally:
+            INGEST_IN_PROGRESS.dec()
         
         if result.get("success"):
             return {
@@ -76,7 +131,10 @@ def ingest_all():
                 "summary": {
                     "total_documents": result.get("total_documents", 0),
                     "successful": result.get("successful", 0),
-                    "failed": result.get("failed", 0)
+                    "failed": result.get("failed", 0),
+                    "skipped": result.get("skipped", 0),
+                    "removed": result.get("removed", 0),
+                    "orphans_deleted": result.get("orphans_deleted", 0)
                 },
                 "details": result.get("results", [])
             }
@@ -88,117 +146,587 @@ def ingest_all():
         raise HTTPException(status_code=500, detail=str(e))
 
 
+# 🧩 Helpers compartidos por /chat y /chat/stream
+def build_prompt_context(results: dict, response_mode: str) -> str:
+    """Texto del contexto del prompt (igual para todos los modelos)."""
+    from rag.context_builder import build_context, format_context
+    
+    # Construir contexto: chunks del mismo documento unidos y sin solapamiento,
+    # recortado al presupuesto de tokens del modo
+    blocks = build_context(results, response_mode)
+    return format_context(blocks) if blocks else "No se encontró contexto relevante."
+
+
+def build_prompt(question: str, results: dict, model_id: str, response_mode: str,
+                 context: Optional[str] = None) -> str:
+    """
+    Construye el prompt con el contexto recuperado según el modelo y el modo.
+    `context` permite reutilizar el de build_prompt_context (p.ej. armado en el executor).
+    """
+    if context is None:
+        context = build_prompt_context(results, response_mode)
+    
+    # Instrucción adicional según el modo (para Gemini)
+    mode_instruction = ""
+    if response_mode == "brief":
+        mode_instruction = "\n\nIMPORTANTE: Proporciona una respuesta BREVE y CONCISA (máximo 150 palabras)."
+    else:
+        mode_instruction = "\n\nIMPORTANTE: Proporciona una respuesta DETALLADA y COMPLETA (entre 400-600 palabras)."
+    
+    # Generar prompt según el modelo
+    if model_id == "gemini":
+        return f"""Eres un asistente académico de la Universidad de Caldas especializado en normativas de Inteligencia Artificial.
+
+Basándote ÚNICAMENTE en el siguiente contexto de los documentos oficiales, responde la pregunta del usuario de manera precisa y académica.{mode_instruction}
+
+CONTEXTO:
+{context}
+
+PREGUNTA: {question}
+
+RESPUESTA:"""
+    else:  # LLaMA3
+        return f"""Basándote ÚNICAMENTE en el siguiente contexto de los documentos oficiales, responde la pregunta del usuario de manera precisa y académica.{mode_instruction}
+
+CONTEXTO:
+{context}
+
+PREGUNTA: {question}
+
+RESPUESTA:"""
+
+
+def format_sources(results: dict) -> list:
+    """Prepara los metadatos de los documentos citados."""
+    cited_docs = []
+    if results['metadatas'] and results['metadatas'][0]:
+        for i, metadata in enumerate(results['metadatas'][0]):
+            cited_docs.append({
+                "title": metadata.get('titulo', 'Sin título'),
+                "source": metadata.get('organismo', 'Fuente desconocida'),
+                "category": metadata.get('categoria', ''),
+                "year": metadata.get('anio', 'N/A'),
+                "file_path": metadata.get('ruta_archivo', '')
+            })
+    return cited_docs
+
+
+def parse_chat_query(query: dict) -> dict:
+    """Valida el body de /chat y aplica los valores por defecto."""
+    params = {
+        "question": query.get("question", ""),
+        "top_k": query.get("top_k", 3),
+        "model_id": query.get("model", "gemini"),  # Default a Gemini
+        "response_mode": query.get("mode", "extended"),  # Default a extendido
+        "use_cache": not query.get("no_cache", False),
+        "include_timings": bool(query.get("timings", False))
+    }
+    
+    # Validar modo de respuesta
+    if params["response_mode"] not in ["brief", "extended"]:
+        raise HTTPException(
+            status_code=400, 
+            detail="El modo debe ser 'brief' o 'extended'"
+        )
+    
+    top_k = params["top_k"]
+    if isinstance(top_k, bool) or not isinstance(top_k, int) or top_k < 1:
+        raise HTTPException(status_code=400, detail="'top_k' debe ser un número entero positivo")
+    
+    if params["question"] and not isinstance(params["question"], str):
+        raise HTTPException(status_code=400, detail="La pregunta debe ser un texto")
+    
+    if not params["question"] or len(params["question"].strip()) == 0:
+        raise HTTPException(status_code=400, detail="La pregunta no puede estar vacía")
+    
+    return params
+
+
+def lookup_exact_cache(question: str, top_k: int, model_id: str, response_mode: str, use_cache: bool) -> dict:
+    """
+    Consulta el cache exacto de respuestas.
+    
+    Retorna un contexto con la respuesta cacheada en "hit" (o None), el tipo de
+    cache y lo necesario para guardar la respuesta nueva con store_chat_cache.
+    """
+    from rag.corpus_version import get_corpus_version
+    
+    ctx = {
+        "hit": None,
+        "cache_type": None,
+        "similarity": None,
+        "corpus_version": get_corpus_version(),
+        "query_embedding": None,
+        "embedded": False,
+        "cache_group": (model_id, response_mode, top_k),
+        "use_cache": use_cache,
+        "response_cache": None,
+        "semantic_cache": None
+    }
+    
+    # Cache exacto: misma pregunta normalizada con los mismos parámetros
+    if use_cache and settings.RESPONSE_CACHE_ENABLED:
+        from rag.response_cache import get_response_cache, response_key
+        
+        ctx["response_cache"] = get_response_cache()
+        ctx["cache_key"] = response_key(question, top_k, model_id, response_mode, ctx["corpus_version"])
+        with stage("response_cache"):
+            cached_response = ctx["response_cache"].get(ctx["cache_key"])
+        record_cache_lookup("response", cached_response is not None)
+        if cached_response is not None:
+            ctx.update(hit=cached_response, cache_type="exact")
+    return ctx
+
+
+def lookup_semantic_cache(ctx: dict, query_embedding) -> dict:
+    """Registra el embedding de la pregunta y consulta el cache semántico."""
+    ctx["query_embedding"] = query_embedding
+    ctx["embedded"] = True
+    
+    # Cache semántico: preguntas equivalentes con el mismo modelo, modo y top_k
+    if ctx["use_cache"] and settings.SEMANTIC_CACHE_ENABLED and query_embedding is not None:
+        from rag.semantic_cache import get_semantic_cache
+        
+        ctx["semantic_cache"] = get_semantic_cache()
+        with stage("semantic_cache"):
+            hit = ctx["semantic_cache"].get(query_embedding, ctx["cache_group"], ctx["corpus_version"])
+        record_cache_lookup("semantic", hit is not None)
+        if hit is not None:
+            cached_response, similarity = hit
+            logger.info(f"Respuesta servida desde el cache semántico (similitud {similarity:.3f})")
+            if ctx["response_cache"] is not None:
+                ctx["response_cache"].set(ctx["cache_key"], cached_response, ctx["corpus_version"])
+            ctx.update(hit=cached_response, cache_type="semantic", similarity=round(similarity, 4))
+    return ctx
+
+
+def lookup_chat_cache(question: str, top_k: int, model_id: str, response_mode: str, use_cache: bool) -> dict:
+    """
+    Consulta los caches de respuestas (exacto y luego semántico).
+    
+    El contexto retornado incluye además el embedding de la pregunta, que se
+    reutiliza para recuperar contexto.
+    """
+    from rag.retrieval import embed_query
+    
+    ctx = lookup_exact_cache(question, top_k, model_id, response_mode, use_cache)
+    if ctx["hit"] is not None:
+        return ctx
+    
+    # Embedding de la pregunta (None si excede el presupuesto de latencia)
+    return lookup_semantic_cache(ctx, embed_query(question))
+
+
+def cached_chat_response(ctx: dict, question: str) -> dict:
+    """Respuesta de /chat a partir de un acierto de cache."""
+    response = {**ctx["hit"], "question": question, "cached": True, "cache_type": ctx["cache_type"]}
+    if ctx["similarity"] is not None:
+        response["similarity"] = ctx["similarity"]
+    return response
+
+
+def store_chat_cache(ctx: dict, response: dict) -> None:
+    """Guarda una respuesta nueva en los caches consultados por lookup_chat_cache."""
+    cacheable = {key: value for key, value in response.items() if key not in ("question", "cached")}
+    if ctx["semantic_cache"] is not None:
+        ctx["semantic_cache"].set(ctx["query_embedding"], ctx["cache_group"], ctx["corpus_version"], cacheable)
+    if ctx["response_cache"] is not None:
+        ctx["response_cache"].set(ctx["cache_key"], cacheable, ctx["corpus_version"])
+
+
+async def answer_chat(params: dict) -> dict:
+    """Recupera contexto y genera la respuesta de /chat (consultando los caches)."""
+    question = params["question"]
+    top_k = params["top_k"]
+    model_id = params["model_id"]
+    response_mode = params["response_mode"]
+    
+    # Importar componentes necesarios
+    from rag.retrieval import aretrieve
+    from rag.routing import get_model_router
+    
+    cache_ctx = await asyncio.to_thread(
+        lookup_chat_cache, question, top_k, model_id, response_mode, params["use_cache"]
+    )
+    if cache_ctx["hit"] is not None:
+        return cached_chat_response(cache_ctx, question)
+    
+    # Buscar documentos relevantes (ChromaDB o índice en proceso según RETRIEVAL_BACKEND)
+    logger.info(f"Buscando contexto relevante para: {question}")
+    results = await aretrieve(
+        question,
+        top_k=top_k,
+        query_embedding=cache_ctx["query_embedding"],
+        embedded=cache_ctx["embedded"]
+    )
+    
+    # El contexto lee los textos del almacén: se arma una vez y fuera del event loop
+    with stage("prompt_build"):
+        context = await asyncio.to_thread(build_prompt_context, results, response_mode)
+    
+    def prompt_for(candidate: str) -> str:
+        return build_prompt(question, results, candidate, response_mode, context=context)
+    
+    # Generar respuesta con el modelo seleccionado (con failover/hedging según el router)
+    logger.info(f"Generando respuesta con {model_id} en modo {response_mode}...")
+    answer, routing = await get_model_router().agenerate(model_id, prompt_for, response_mode)
+    
+    # Preparar metadatos de los documentos citados
+    cited_docs = format_sources(results)
+    
+    response = {
+        "status": "ok",
+        "answer": answer,
+        "question": question,
+        "model_used": routing["model_used"],
+        "response_mode": response_mode,
+        "sources": cited_docs,
+        "context_used": len(cited_docs),
+        "cached": False
+    }
+    if routing["model_used"] != model_id or routing["failed"]:
+        response["routing"] = routing
+        # La respuesta no es del modelo pedido: no se guarda bajo su clave de cache
+        return response
+    await asyncio.to_thread(store_chat_cache, cache_ctx, response)
+    return response
+
+
+# Coalescencia de requests idénticas en curso para /chat
+chat_flights = SingleFlight()
+REGISTRY.gauge(
+    "chatbot_chat_single_flight_in_flight",
+    "Ejecuciones de /chat en curso compartidas por requests idénticas",
+    callback=lambda: [((), chat_flights.stats()["in_flight"])]
+)
+
+
 # 🚀 Endpoint de chat con RAG
 @app.post("/chat")
-def chat(query: dict):
+async def chat(query: dict):
     """
     Endpoint para realizar consultas al chatbot con RAG.
     
+    Es asíncrono: mientras el modelo genera, la request no ocupa un hilo del
+    threadpool. El trabajo bloqueante (caches en disco, embedding) se delega
+    al executor y ChromaDB se consulta con el cliente asíncrono.
+    
     Body esperado:
     {
         "question": "¿Cuál es la normativa sobre IA en Colombia?",
         "top_k": 3,  // opcional, número de documentos a recuperar
         "model": "gemini",  // opcional, modelo a usar: "gemini" o "llama3"
-        "mode": "extended"  // opcional, modo de respuesta: "brief" o "extended"
+        "mode": "extended",  // opcional, modo de respuesta: "brief" o "extended"
+        "no_cache": false,  // opcional, ignora los caches de respuestas
+        "timings": false  // opcional, incluye el desglose por etapa en la respuesta
     }
+    
+    Todas las respuestas incluyen el header Server-Timing con la duración de
+    cada etapa (client, embedding, vector_query, prompt_build, generation...).
     """
-    try:
-        question = query.get("question", "")
-        top_k = query.get("top_k", 3)
-        model_id = query.get("model", "gemini")  # Default a Gemini
-        response_mode = query.get("mode", "extended")  # Default a extendido
-        
-        # Validar modo de respuesta
-        if response_mode not in ["brief", "extended"]:
-            raise HTTPException(
-                status_code=400, 
-                detail="El modo debe ser 'brief' o 'extended'"
+    # Un body inválido responde 400 sin contar como request ni como error de /chat
+    params = parse_chat_query(query)
+    request_timings = start_request_timings()
+    with track_request("chat"):
+        try:
+            # Requests idénticas en curso (misma clave de cache) comparten una sola ejecución
+            from rag.corpus_version import get_corpus_version
+            from rag.response_cache import response_key
+            
+            flight_key = (
+                response_key(params["question"], params["top_k"], params["model_id"], params["response_mode"], get_corpus_version()),
+                params["use_cache"]
             )
-        
-        if not question or len(question.strip()) == 0:
-            raise HTTPException(status_code=400, detail="La pregunta no puede estar vacía")
-        
-        # Importar componentes necesarios
-        from rag.chroma_manager import get_or_create_collection
-        from rag.models import model_manager
-        
-        # Obtener colección
-        collection = get_or_create_collection("documentos_ucaldas")
-        
-        # Buscar documentos relevantes
-        logger.info(f"Buscando contexto relevante para: {question}")
-        results = collection.query(
-            query_texts=[question],
-            n_results=top_k
-        )
-        
-        # Construir contexto
-        context_parts = []
-        if results['documents'] and len(results['documents'][0]) > 0:
-            for i, doc in enumerate(results['documents'][0]):
-                metadata = results['metadatas'][0][i] if results['metadatas'] else {}
-                context_parts.append(f"[Documento {i+1}]: {doc}")
-        
-        context = "\n\n".join(context_parts) if context_parts else "No se encontró contexto relevante."
-        
-        # Instrucción adicional según el modo (para Gemini)
-        mode_instruction = ""
-        if response_mode == "brief":
-            mode_instruction = "\n\nIMPORTANTE: Proporciona una respuesta BREVE y CONCISA (máximo 150 palabras)."
-        else:
-            mode_instruction = "\n\nIMPORTANTE: Proporciona una respuesta DETALLADA y COMPLETA (entre 400-600 palabras)."
-        
-        # Generar prompt según el modelo
-        if model_id == "gemini":
-            prompt = f"""Eres un asistente académico de la Universidad de Caldas especializado en normativas de Inteligencia Artificial.
+            if chat_flights.in_flight(flight_key):
+                request_timings.mark("coalesced")
+            response = await chat_flights.do(flight_key, lambda: answer_chat(params))
+            record_chat_request("chat", params["model_id"], params["response_mode"], "cached" if response.get("cached") else "ok")
+            
+            if not params["use_cache"]:
+                request_timings.mark("cache", "bypass")
+            else:
+                request_timings.mark("cache", response.get("cache_type") or "miss")
+            body = {**response, "question": params["question"]}
+            if params["include_timings"]:
+                body["timings"] = request_timings.as_dict()
+            with stage("serialization"):
+                json_response = JSONResponse(body)
+            json_response.headers["Server-Timing"] = request_timings.server_timing()
+            return json_response
+            
+        except HTTPException:
+            raise
+        except Exception as e:
+            logger.error(f"Error en /chat: {e}", exc_info=True)
+            record_chat_request("chat", params["model_id"], params["response_mode"], "error")
+            raise HTTPException(status_code=500, detail=str(e))
 
-Basándote ÚNICAMENTE en el siguiente contexto de los documentos oficiales, responde la pregunta del usuario de manera precisa y académica.{mode_instruction}
 
-CONTEXTO:
-{context}
+def sse_event(event: str, data: dict) -> str:
+    """Formatea un evento Server-Sent Events con datos JSON."""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
 
-PREGUNTA: {question}
 
-RESPUESTA:"""
-        else:  # LLaMA3
-            prompt = f"""Basándote ÚNICAMENTE en el siguiente contexto de los documentos oficiales, responde la pregunta del usuario de manera precisa y académica.{mode_instruction}
+def tracked_stream(endpoint: str, chunks):
+    """Cuenta la request como en curso mientras se envía la respuesta en streaming."""
+    with track_request(endpoint):
+        yield from chunks
 
-CONTEXTO:
-{context}
 
-PREGUNTA: {question}
+async def atracked_stream(endpoint: str, chunks):
+    """Versión asíncrona de tracked_stream."""
+    with track_request(endpoint):
+        async for chunk in chunks:
+            yield chunk
 
-RESPUESTA:"""
-        
-        # Generar respuesta con el modelo seleccionado
-        logger.info(f"Generando respuesta con {model_id} en modo {response_mode}...")
-        answer = model_manager.generate_response(prompt, model_id, response_mode)
-        
-        # Preparar metadatos de los documentos citados
-        cited_docs = []
-        if results['metadatas'] and results['metadatas'][0]:
-            for i, metadata in enumerate(results['metadatas'][0]):
-                cited_docs.append({
-                    "title": metadata.get('titulo', 'Sin título'),
-                    "source": metadata.get('organismo', 'Fuente desconocida'),
-                    "category": metadata.get('categoria', ''),
-                    "year": metadata.get('anio', 'N/A'),
-                    "file_path": metadata.get('ruta_archivo', '')
+
+# 📡 Endpoint de chat con respuesta en streaming (Server-Sent Events)
+@app.post("/chat/stream")
+def chat_stream(query: dict):
+    """
+    Igual que /chat, pero la respuesta llega como Server-Sent Events:
+    
+        event: sources  → fuentes recuperadas (antes de generar)
+        event: token    → fragmentos de la respuesta a medida que llegan
+        event: done     → tiempos (ms) y uso de tokens
+        event: error    → error durante la generación
+    """
+    params = parse_chat_query(query)
+    question = params["question"]
+    top_k = params["top_k"]
+    model_id = params["model_id"]
+    response_mode = params["response_mode"]
+    
+    def events():
+        started = time.perf_counter()
+        timings = {}
+        try:
+            from rag.retrieval import retrieve
+            from rag.routing import get_model_router
+            
+            cache_ctx = lookup_chat_cache(question, top_k, model_id, response_mode, params["use_cache"])
+            if cache_ctx["hit"] is not None:
+                cached = cache_ctx["hit"]
+                yield sse_event("sources", {
+                    "sources": cached["sources"],
+                    "context_used": cached["context_used"],
+                    "model_used": cached["model_used"],
+                    "response_mode": cached["response_mode"]
                 })
+                yield sse_event("token", {"text": cached["answer"]})
+                record_chat_request("chat_stream", model_id, response_mode, "cached")
+                timings["total_ms"] = round((time.perf_counter() - started) * 1000, 1)
+                yield sse_event("done", {
+                    "cached": True,
+                    "cache_type": cache_ctx["cache_type"],
+                    "timings": timings,
+                    "usage": None
+                })
+                return
+            
+            logger.info(f"Buscando contexto relevante para: {question}")
+            results = retrieve(
+                question,
+                top_k=top_k,
+                query_embedding=cache_ctx["query_embedding"],
+                embedded=cache_ctx["embedded"]
+            )
+            cited_docs = format_sources(results)
+            timings["retrieval_ms"] = round((time.perf_counter() - started) * 1000, 1)
+            yield sse_event("sources", {
+                "sources": cited_docs,
+                "context_used": len(cited_docs),
+                "model_used": model_id,
+                "response_mode": response_mode
+            })
+            
+            def prompt_for(candidate: str) -> str:
+                with stage("prompt_build"):
+                    return build_prompt(question, results, candidate, response_mode)
+            
+            logger.info(f"Generando respuesta en streaming con {model_id} en modo {response_mode}...")
+            usage = {}
+            routing = {}
+            answer_parts = []
+            generation_started = time.perf_counter()
+            for text in get_model_router().stream(model_id, prompt_for, response_mode, usage=usage, info=routing):
+                if not answer_parts:
+                    timings["ttft_ms"] = round((time.perf_counter() - started) * 1000, 1)
+                answer_parts.append(text)
+                yield sse_event("token", {"text": text})
+            
+            timings["generation_ms"] = round((time.perf_counter() - generation_started) * 1000, 1)
+            timings["total_ms"] = round((time.perf_counter() - started) * 1000, 1)
+            done = {"cached": False, "timings": timings, "usage": usage or None, "model_used": routing["model_used"]}
+            if routing["model_used"] != model_id or routing["failed"]:
+                done["routing"] = routing
+            else:
+                store_chat_cache(cache_ctx, {
+                    "status": "ok",
+                    "answer": "".join(answer_parts),
+                    "model_used": model_id,
+                    "response_mode": response_mode,
+                    "sources": cited_docs,
+                    "context_used": len(cited_docs)
+                })
+            record_chat_request("chat_stream", model_id, response_mode, "ok")
+            yield sse_event("done", done)
         
-        return {
-            "status": "ok",
-            "answer": answer,
-            "question": question,
-            "model_used": model_id,
-            "response_mode": response_mode,
-            "sources": cited_docs,
-            "context_used": len(cited_docs)
-        }
-        
-    except Exception as e:
-        logger.error(f"Error en /chat: {e}", exc_info=True)
-        raise HTTPException(status_code=500, detail=str(e))
+        except Exception as e:
+            logger.error(f"Error en /chat/stream: {e}", exc_info=True)
+            record_chat_request("chat_stream", model_id, response_mode, "error")
+            yield sse_event("error", {"detail": str(e)})
+    
+    return StreamingResponse(
+        tracked_stream("chat_stream", events()),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+# 📦 Endpoint de chat por lotes (respuestas en JSON Lines)
+@app.post("/chat/batch")
+async def chat_batch(query: dict):
+    """
+    Responde varias preguntas en una sola request.
+    
+    Los embeddings de todas las preguntas se calculan en un request por lotes,
+    el contexto se recupera con una sola consulta multi-pregunta y las
+    generaciones corren con concurrencia acotada. Cada resultado se envía como
+    una línea JSON (application/x-ndjson) en cuanto está listo, con el campo
+    "index" de la pregunta original.
+    
+    Body esperado:
+    {
+        "questions": ["¿Pregunta 1?", "¿Pregunta 2?"],
+        "top_k": 3,  // opcional, igual que /chat (aplica a todas)
+        "model": "gemini",  // opcional
+        "mode": "extended",  // opcional
+        "no_cache": false,  // opcional
+        "concurrency": 4  // opcional, generaciones simultáneas (máx. BATCH_MAX_CONCURRENCY)
+    }
+    """
+    questions = query.get("questions")
+    if not isinstance(questions, list) or not questions:
+        raise HTTPException(status_code=400, detail="'questions' debe ser una lista no vacía")
+    if len(questions) > settings.BATCH_MAX_QUESTIONS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Máximo {settings.BATCH_MAX_QUESTIONS} preguntas por request"
+        )
+    items = [parse_chat_query({**query, "question": question}) for question in questions]
+    try:
+        concurrency = int(query.get("concurrency", settings.BATCH_MAX_CONCURRENCY))
+    except (TypeError, ValueError):
+        raise HTTPException(status_code=400, detail="'concurrency' debe ser un número entero")
+    concurrency = max(1, min(concurrency, settings.BATCH_MAX_CONCURRENCY))
+    top_k = items[0]["top_k"]
+    model_id = items[0]["model_id"]
+    response_mode = items[0]["response_mode"]
+    
+    def line(data: dict) -> str:
+        return json.dumps(data, ensure_ascii=False) + "\n"
+    
+    async def lines():
+        from rag.embeddings import embedding_function
+        from rag.retrieval import aretrieve_many
+        from rag.routing import get_model_router
+        
+        # 1. Cache exacto
+        contexts = await asyncio.to_thread(
+            lambda: [
+                lookup_exact_cache(item["question"], top_k, model_id, response_mode, item["use_cache"])
+                for item in items
+            ]
+        )
+        pending = []
+        for index, (item, ctx) in enumerate(zip(items, contexts)):
+            if ctx["hit"] is not None:
+                record_chat_request("chat_batch", model_id, response_mode, "cached")
+                yield line({"index": index, **cached_chat_response(ctx, item["question"])})
+            else:
+                pending.append(index)
+        if not pending:
+            return
+        
+        try:
+            # 2. Embeddings de todas las preguntas pendientes en requests por lotes
+            pending_questions = [items[index]["question"] for index in pending]
+            embeddings = await asyncio.to_thread(embedding_function.embed_batch, pending_questions)
+            
+            # 3. Cache semántico
+            to_generate = []
+            for index, embedding in zip(pending, embeddings):
+                ctx = await asyncio.to_thread(lookup_semantic_cache, contexts[index], embedding)
+                if ctx["hit"] is not None:
+                    record_chat_request("chat_batch", model_id, response_mode, "cached")
+                    yield line({"index": index, **cached_chat_response(ctx, items[index]["question"])})
+                else:
+                    to_generate.append(index)
+            if not to_generate:
+                return
+            
+            # 4. Una sola consulta de recuperación para todas las preguntas
+            logger.info(f"Recuperando contexto para {len(to_generate)} preguntas del lote")
+            all_results = await aretrieve_many(
+                [items[index]["question"] for index in to_generate],
+                [contexts[index]["query_embedding"] for index in to_generate],
+                top_k=top_k
+            )
+        except Exception as e:
+            logger.error(f"Error en /chat/batch: {e}", exc_info=True)
+            for index in pending:
+                if contexts[index]["hit"] is None:
+                    record_chat_request("chat_batch", model_id, response_mode, "error")
+                    yield line({"index": index, "question": items[index]["question"], "status": "error", "detail": str(e)})
+            return
+        
+        # 5. Generaciones con concurrencia acotada
+        semaphore = asyncio.Semaphore(concurrency)
+        
+        async def generate(index: int, results: dict) -> dict:
+            question = items[index]["question"]
+            try:
+                with stage("prompt_build"):
+                    context = await asyncio.to_thread(build_prompt_context, results, response_mode)
+                
+                def prompt_for(candidate: str) -> str:
+                    return build_prompt(question, results, candidate, response_mode, context=context)
+                
+                async with semaphore:
+                    answer, routing = await get_model_router().agenerate(model_id, prompt_for, response_mode)
+                cited_docs = format_sources(results)
+                response = {
+                    "status": "ok",
+                    "answer": answer,
+                    "question": question,
+                    "model_used": routing["model_used"],
+                    "response_mode": response_mode,
+                    "sources": cited_docs,
+                    "context_used": len(cited_docs),
+                    "cached": False
+                }
+                if routing["model_used"] != model_id or routing["failed"]:
+                    response["routing"] = routing
+                else:
+                    await asyncio.to_thread(store_chat_cache, contexts[index], response)
+                record_chat_request("chat_batch", model_id, response_mode, "ok")
+                return {"index": index, **response}
+            except Exception as e:
+                logger.error(f"Error generando respuesta del lote ({index}): {e}")
+                record_chat_request("chat_batch", model_id, response_mode, "error")
+                return {"index": index, "question": question, "status": "error", "detail": str(e)}
+        
+        tasks = [asyncio.ensure_future(generate(index, results)) for index, results in zip(to_generate, all_results)]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                yield line(await next_done)
+        finally:
+            # Cliente desconectado: no seguir generando
+            for task in tasks:
+                task.cancel()
+    
+    return StreamingResponse(atracked_stream("chat_batch", lines()), media_type="application/x-ndjson")
 
 
 # 🔍 Endpoint para ver estadísticas de la colección
@@ -207,6 +735,9 @@ def get_collection_stats():
     """Retorna estadísticas de la colección de documentos."""
     try:
         from rag.chroma_manager import get_or_create_collection
+        from rag.embeddings import embedding_function
+        from rag.semantic_cache import get_semantic_cache
+        from rag.response_cache import get_response_cache
         
         collection = get_or_create_collection("documentos_ucaldas")
         
@@ -217,6 +748,10 @@ def get_collection_stats():
             "status": "ok",
             "collection": "documentos_ucaldas",
             "total_chunks": count,
+            "embedding_cache": embedding_function.cache_stats(),
+            "semantic_cache": get_semantic_cache().stats(),
+            "response_cache": get_response_cache().stats(),
+            "chat_single_flight": chat_flights.stats(),
             "message": f"Colección contiene {count} chunks de documentos"
         }
         
@@ -225,13 +760,22 @@ def get_collection_stats():
         raise HTTPException(status_code=500, detail=str(e))
 
 
+# 📈 Endpoint de métricas (formato de texto de Prometheus)
+@app.get("/metrics")
+def get_metrics():
+    """Latencias por etapa, requests por modelo/modo, caches, errores de proveedores e ingesta."""
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+
 # 🤖 Endpoint para listar modelos disponibles
 @app.get("/models")
 def get_available_models():
     """Retorna lista de modelos disponibles y modos de respuesta."""
     try:
-        from rag.models import model_manager
+        from rag.models import get_model_manager
+        from rag.routing import get_model_router
         
+        model_manager = get_model_manager()
         models = model_manager.get_available_models()
         default_model = model_manager.get_default_model()
         
@@ -254,7 +798,9 @@ def get_available_models():
                     "max_tokens": 800
                 }
             ],
-            "default_mode": "extended"
+            "default_mode": "extended",
+            "providers": model_manager.get_provider_status(),
+            "routing": get_model_router().stats()
         }
         
     except Exception as e:
@@ -264,63 +810,31 @@ def get_available_models():
 
 # 📚 Endpoint para obtener todas las fuentes disponibles
 @app.get("/sources")
-def get_sources():
+def get_sources(request: Request):
     """
     Retorna todas las fuentes documentales disponibles en la base de datos,
     agrupadas por categoría y deduplicadas por título.
+    
+    Se sirve desde el catálogo que escribe la ingesta (con ETag: si el cliente
+    envía If-None-Match con el mismo valor se responde 304 sin cuerpo).
     """
     try:
-        from rag.chroma_manager import get_all_sources
-        from collections import defaultdict
-        
-        # Obtener todas las fuentes
-        all_sources = get_all_sources()
+        from rag.source_catalog import get_source_catalog, write_catalog
         
-        # Agrupar por categoría y deduplicar por título
-        sources_by_category = defaultdict(dict)  # Cambio: dict en lugar de list
-        for source in all_sources:
-            category = source.get("category", "sin_categoria")
-            title = source["title"]
+        catalog = get_source_catalog()
+        data = catalog.get()
+        if data is None:
+            # Sin catálogo (corpus ingerido antes de existir): construirlo desde la colección
+            from rag.chroma_manager import iter_sources
             
-            # Solo agregar si no existe (deduplicación por título)
-            if title not in sources_by_category[category]:
-                sources_by_category[category][title] = {
-                    "title": title,
-                    "source": source["source"],
-                    "year": source["year"]
-                }
-        
-        # Convertir a formato de respuesta
-        categories = []
-        category_names = {
-            "colombia": "Colombia",
-            "internacional": "Internacional",
-            "universidad": "Universidad de Caldas",
-            "sin_categoria": "Sin Categoría"
-        }
-        
-        total_unique_sources = 0
-        for category, sources_dict in sources_by_category.items():
-            sources_list = list(sources_dict.values())
-            total_unique_sources += len(sources_list)
-            
-            categories.append({
-                "category": category,
-                "category_name": category_names.get(category, category.capitalize()),
-                "sources": sources_list,
-                "count": len(sources_list)
-            })
-        
-        # Ordenar categorías (colombia, internacional, universidad, otros)
-        category_order = ["colombia", "internacional", "universidad"]
-        categories.sort(key=lambda x: category_order.index(x["category"]) if x["category"] in category_order else 999)
+            logger.info("Catálogo de fuentes no encontrado, construyéndolo desde la colección")
+            data = write_catalog(iter_sources())
+            catalog.set(data)
         
-        return {
-            "status": "ok",
-            "total_sources": total_unique_sources,  # Ahora muestra documentos únicos
-            "total_categories": len(categories),
-            "categories": categories
-        }
+        headers = {"ETag": data["etag"], "Cache-Control": "no-cache"}
+        if request.headers.get("if-none-match") == data["etag"]:
+            return Response(status_code=304, headers=headers)
+        return JSONResponse(content=data["catalog"], headers=headers)
         
     except Exception as e:
         logger.error(f"Error obteniendo fuentes: {e}", exc_info=True)
@@ -359,7 +873,7 @@ def get_policy():
 def test_gemini(query: dict):
     """Endpoint de prueba para Gemini sin contexto RAG."""
     try:
-        from rag.models import model_manager
+        from rag.models import get_model_manager
         
         question = query.get("question", "¿Qué es la inteligencia artificial?")
         mode = query.get("mode", "brief")
@@ -367,7 +881,7 @@ def test_gemini(query: dict):
         # Prompt simple sin contexto
         simple_prompt = f"Responde brevemente: {question}"
         
-        answer = model_manager.generate_response(simple_prompt, "gemini", mode)
+        answer = get_model_manager().generate_response(simple_prompt, "gemini", mode)
         
         return {
             "status": "ok",
@@ -1,25 +1,41 @@
 """
 app/rag
 Módulo RAG para el chatbot de Universidad de Caldas
+
+Los nombres exportados se importan en el primer acceso (PEP 562): importar
+`rag` o cualquiera de sus submódulos no carga ChromaDB ni los SDKs de los
+modelos hasta que realmente se usan.
 """
 
-from .chroma_client import get_chroma_client
-from .chroma_manager import get_or_create_collection, add_document
-from .embeddings import embedding_function, GeminiEmbeddingFunction
-from .file_loader import FileLoader, load_file, load_directory
-from .ingest_all import ingest_all_documents
-from .models import model_manager, ModelManager
-
-__all__ = [
-    'get_chroma_client',
-    'get_or_create_collection',
-    'add_document',
-    'embedding_function',
-    'GeminiEmbeddingFunction',
-    'FileLoader',
-    'load_file',
-    'load_directory',
-    'ingest_all_documents',
-    'model_manager',
-    'ModelManager'
-]
+import importlib
+
+# Nombre exportado -> submódulo que lo define
+_EXPORTS = {
+    'get_chroma_client': 'chroma_client',
+    'get_or_create_collection': 'chroma_manager',
+    'invalidate_collection': 'chroma_manager',
+    'add_document': 'chroma_manager',
+    'embedding_function': 'embeddings',
+    'GeminiEmbeddingFunction': 'embeddings',
+    'FileLoader': 'file_loader',
+    'load_file': 'file_loader',
+    'load_directory': 'file_loader',
+    'ingest_all_documents': 'ingest_all',
+    'model_manager': 'models',
+    'get_model_manager': 'models',
+    'ModelManager': 'models'
+}
+
+__all__ = list(_EXPORTS)
+
+
+def __getattr__(name):
+    module_name = _EXPORTS.get(name)
+    if module_name is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    module = importlib.import_module(f".{module_name}", __name__)
+    return getattr(module, name)
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
@@ -1,13 +1,24 @@
+import asyncio
 import time
-import chromadb
-from chromadb.config import Settings
+import threading
 from config.settings import settings
 
-def get_chroma_client(retries=5, delay=2):
+# Cliente único por proceso. chromadb.HttpClient mantiene internamente una
+# sesión HTTP con keep-alive, así que reutilizarlo reutiliza las conexiones
+# TCP abiertas hacia chroma_db en lugar de abrir una nueva por request.
+_client = None
+_client_lock = threading.Lock()
+
+
+def _create_chroma_client(retries=5, delay=2):
     """
-    Inicializa y retorna un cliente conectado a ChromaDB.
+    Crea un cliente nuevo conectado a ChromaDB.
     Incluye reintentos para esperar a que Chroma esté disponible.
     """
+    # El SDK de ChromaDB se importa al crear el primer cliente, no al importar el módulo
+    import chromadb
+    from chromadb.config import Settings
+
     for attempt in range(1, retries + 1):
         try:
             client = chromadb.HttpClient(
@@ -19,10 +30,68 @@ def get_chroma_client(retries=5, delay=2):
                 )
             )
             # Validar conexión
-            client.list_collections()
+            client.heartbeat()
             print(f"✅ Conexión exitosa a ChromaDB en el intento {attempt}")
             return client
         except Exception as e:
             print(f"⚠️ Intento {attempt} fallido al conectar a ChromaDB: {e}")
             time.sleep(delay)
     raise ConnectionError("❌ No se pudo conectar a ChromaDB después de varios intentos.")
+
+
+def get_chroma_client(retries=5, delay=2):
+    """
+    Retorna el cliente compartido del proceso conectado a ChromaDB.
+    Se crea en el primer uso (thread-safe) y se reutiliza en los siguientes.
+    """
+    global _client
+    client = _client
+    if client is not None:
+        return client
+
+    with _client_lock:
+        if _client is None:
+            _client = _create_chroma_client(retries=retries, delay=delay)
+        return _client
+
+
+# Cliente asíncrono (chromadb.AsyncHttpClient) para el camino async de /chat.
+# Se crea dentro del event loop en el primer uso.
+_async_client = None
+_async_client_lock = None
+
+
+async def _create_async_chroma_client(retries=5, delay=2):
+    """Crea un cliente asíncrono conectado a ChromaDB, con reintentos."""
+    import chromadb
+    from chromadb.config import Settings
+
+    for attempt in range(1, retries + 1):
+        try:
+            client = await chromadb.AsyncHttpClient(
+                host=settings.CHROMA_HOST,
+                port=settings.CHROMA_PORT,
+                settings=Settings(anonymized_telemetry=False)
+            )
+            await client.heartbeat()
+            print(f"✅ Conexión asíncrona exitosa a ChromaDB en el intento {attempt}")
+            return client
+        except Exception as e:
+            print(f"⚠️ Intento {attempt} fallido al conectar (async) a ChromaDB: {e}")
+            await asyncio.sleep(delay)
+    raise ConnectionError("❌ No se pudo conectar a ChromaDB después de varios intentos.")
+
+
+async def get_async_chroma_client(retries=5, delay=2):
+    """Retorna el cliente asíncrono compartido del proceso (se crea en el primer uso)."""
+    global _async_client, _async_client_lock
+    client = _async_client
+    if client is not None:
+        return client
+
+    if _async_client_lock is None:
+        _async_client_lock = asyncio.Lock()
+    async with _async_client_lock:
+        if _async_client is None:
+            _async_client = await _create_async_chroma_client(retries=retries, delay=delay)
+        return _async_client
@@ -1,24 +1,142 @@
-from rag.chroma_client import get_chroma_client
+import asyncio
+import threading
+from rag.chroma_client import get_chroma_client, get_async_chroma_client
 from rag.embeddings import embedding_function  # ✅ ahora importamos la instancia de la clase
+from rag.collection_scan import iter_records, log_progress
+from rag.source_catalog import source_from_metadata
 
-def get_or_create_collection(collection_name="documentos_ucaldas"):
-    client = get_chroma_client()
-
-    # Buscar si ya existe
-    collection_names = [col.name for col in client.list_collections()]
-    if collection_name in collection_names:
-        # CRITICAL: Usar get_collection con embedding_function explícito
-        # para que ChromaDB use Gemini embeddings en las queries
-        return client.get_collection(
-            name=collection_name,
+# Cache de handles de colección por nombre. En este proceso se invalida al
+# recrear la colección (ver invalidate_collection); si la recrea otro
+# proceso (scripts/recreate_collection.py) el handle se renueva en la
+# primera llamada que falle (ver _CollectionHandle).
+_collections = {}
+_collections_lock = threading.Lock()
+# Handles de colección del cliente asíncrono
+_async_collections = {}
+_async_collections_lock = None
+
+
+def is_missing_collection(error: BaseException) -> bool:
+    """True si ChromaDB indica que la colección del handle ya no existe."""
+    return type(error).__name__ in ("NotFoundError", "InvalidCollectionException")
+
+
+class _CollectionHandle:
+    """
+    Handle cacheado de una colección de ChromaDB.
+
+    Si la colección se borró y se recreó desde otro proceso, la colección
+    vieja ya no existe en el servidor: ante ese error se obtiene el handle de
+    la colección actual y la llamada se reintenta una vez.
+    """
+
+    def __init__(self, name, collection):
+        self._name = name
+        self._collection = collection
+
+    def _refresh(self):
+        print(f"⚠️ La colección '{self._name}' fue recreada; renovando el handle")
+        self._collection = get_chroma_client().get_or_create_collection(
+            name=self._name,
             embedding_function=embedding_function
         )
 
-    # Crear la colección usando Gemini como función de embeddings
-    return client.create_collection(
-        name=collection_name,
-        embedding_function=embedding_function
-    )
+    def __getattr__(self, attr):
+        value = getattr(self._collection, attr)
+        if not callable(value):
+            return value
+
+        def call(*args, **kwargs):
+            try:
+                return getattr(self._collection, attr)(*args, **kwargs)
+            except Exception as e:
+                if not is_missing_collection(e):
+                    raise
+            self._refresh()
+            return getattr(self._collection, attr)(*args, **kwargs)
+        return call
+
+
+class _AsyncCollectionHandle(_CollectionHandle):
+    """Versión de _CollectionHandle para las colecciones del cliente asíncrono."""
+
+    async def _arefresh(self):
+        print(f"⚠️ La colección '{self._name}' fue recreada; renovando el handle asíncrono")
+        client = await get_async_chroma_client()
+        self._collection = await client.get_or_create_collection(
+            name=self._name,
+            embedding_function=embedding_function
+        )
+
+    def __getattr__(self, attr):
+        value = getattr(self._collection, attr)
+        if not callable(value):
+            return value
+
+        async def call(*args, **kwargs):
+            try:
+                return await getattr(self._collection, attr)(*args, **kwargs)
+            except Exception as e:
+                if not is_missing_collection(e):
+                    raise
+            await self._arefresh()
+            return await getattr(self._collection, attr)(*args, **kwargs)
+        return call
+
+
+def get_or_create_collection(collection_name="documentos_ucaldas"):
+    collection = _collections.get(collection_name)
+    if collection is not None:
+        return collection
+
+    with _collections_lock:
+        collection = _collections.get(collection_name)
+        if collection is None:
+            client = get_chroma_client()
+            # CRITICAL: Pasar embedding_function explícito
+            # para que ChromaDB use Gemini embeddings en las queries
+            collection = _CollectionHandle(collection_name, client.get_or_create_collection(
+                name=collection_name,
+                embedding_function=embedding_function
+            ))
+            _collections[collection_name] = collection
+        return collection
+
+
+async def aget_or_create_collection(collection_name="documentos_ucaldas"):
+    """Versión asíncrona de get_or_create_collection (usa AsyncHttpClient)."""
+    global _async_collections_lock
+    collection = _async_collections.get(collection_name)
+    if collection is not None:
+        return collection
+
+    if _async_collections_lock is None:
+        _async_collections_lock = asyncio.Lock()
+    async with _async_collections_lock:
+        collection = _async_collections.get(collection_name)
+        if collection is None:
+            client = await get_async_chroma_client()
+            collection = _AsyncCollectionHandle(collection_name, await client.get_or_create_collection(
+                name=collection_name,
+                embedding_function=embedding_function
+            ))
+            _async_collections[collection_name] = collection
+        return collection
+
+
+def invalidate_collection(collection_name=None):
+    """
+    Elimina del cache el handle de una colección (o de todas si no se indica).
+    Debe llamarse cuando la colección se borra o se recrea.
+    """
+    with _collections_lock:
+        if collection_name is None:
+            _collections.clear()
+            _async_collections.clear()
+        else:
+            _collections.pop(collection_name, None)
+            _async_collections.pop(collection_name, None)
+
 
 def add_document(collection_name: str, document_id: str, text: str, metadata=None):
     collection = get_or_create_collection(collection_name)
@@ -30,29 +148,26 @@ def add_document(collection_name: str, document_id: str, text: str, metadata=Non
     )
     return f"Documento {document_id} agregado correctamente a la colección '{collection_name}'."
 
+def iter_sources(collection_name="documentos_ucaldas", page_size=None):
+    """
+    Recorre la colección por páginas (solo metadatos) y produce la información
+    de la fuente de cada chunk, sin cargar toda la colección en memoria.
+    """
+    collection = get_or_create_collection(collection_name)
+    records = iter_records(
+        collection,
+        include=["metadatas"],
+        page_size=page_size,
+        progress=log_progress("Leyendo fuentes")
+    )
+    for record in records:
+        # Extraer campos relevantes
+        yield source_from_metadata(record["metadata"] or {})
+
+
 def get_all_sources(collection_name="documentos_ucaldas"):
     """
     Obtiene todos los documentos de la colección y extrae sus metadatos.
     Retorna una lista de diccionarios con la información de cada fuente.
     """
-    collection = get_or_create_collection(collection_name)
-    
-    # Obtener todos los documentos (sin límite)
-    results = collection.get(
-        include=["metadatas"]  # Solo necesitamos los metadatos
-    )
-    
-    sources = []
-    if results and results.get("metadatas"):
-        for metadata in results["metadatas"]:
-            # Extraer campos relevantes
-            source_info = {
-                "title": metadata.get("titulo", "Sin título"),
-                "source": metadata.get("organismo", "Sin fuente"),
-                "category": metadata.get("categoria", "sin_categoria"),
-                "year": metadata.get("anio", "N/A"),
-                "file_path": metadata.get("ruta_archivo", "")
-            }
-            sources.append(source_info)
-    
-    return sources
+    return list(iter_sources(collection_name))
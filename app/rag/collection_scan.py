@@ -0,0 +1,104 @@
+"""
+app/rag/collection_scan.py
+Recorrido paginado de una colección de ChromaDB. En lugar de un único
+collection.get() sin límite, pide páginas con limit/offset y solo los campos
+necesarios, para que los procesos sobre toda la colección usen memoria constante.
+"""
+
+import logging
+import time
+from typing import Callable, Dict, Iterator, Optional, Sequence
+from config.settings import settings
+
+logger = logging.getLogger(__name__)
+
+FIELDS = ("documents", "metadatas", "embeddings")
+
+# progress(procesados, total): total es None si no se conoce (p.ej. con filtro where)
+ProgressCallback = Callable[[int, Optional[int]], None]
+
+
+def log_progress(label: str, every: int = 5000) -> ProgressCallback:
+    """Callback de progreso que registra en el log cada `every` chunks (y al final)."""
+    state = {"next": every, "started": time.perf_counter()}
+
+    def report(scanned: int, total: Optional[int]) -> None:
+        if scanned < state["next"] and scanned != total:
+            return
+        state["next"] = scanned + every
+        elapsed = time.perf_counter() - state["started"]
+        of_total = f"/{total}" if total is not None else ""
+        logger.info(f"📄 {label}: {scanned}{of_total} chunks ({elapsed:.1f}s)")
+
+    return report
+
+
+def iter_collection(collection, include: Sequence[str] = ("metadatas",),
+                    page_size: Optional[int] = None, limit: Optional[int] = None,
+                    offset: int = 0, where: Optional[Dict] = None,
+                    progress: Optional[ProgressCallback] = None) -> Iterator[Dict]:
+    """
+    Recorre la colección por páginas.
+
+    Args:
+        collection: Colección de ChromaDB (síncrona)
+        include: Campos a traer además de los ids ("documents", "metadatas", "embeddings")
+        page_size: Chunks por página (por defecto settings.SCAN_PAGE_SIZE)
+        limit: Máximo de chunks a recorrer (None = hasta el final)
+        offset: Posición inicial
+        where: Filtro de metadatos opcional
+        progress: Callback progress(procesados, total) llamado tras cada página
+
+    Yields:
+        Páginas con el formato de collection.get ({"ids", "documents", ...}).
+        Los consumidores deben procesar cada página y descartarla.
+
+    Nota: la paginación por offset asume que la colección no cambia durante el
+    recorrido; una escritura concurrente puede duplicar u omitir chunks.
+    """
+    unknown = [field for field in include if field not in FIELDS]
+    if unknown:
+        raise ValueError(f"Campos no soportados en el recorrido: {unknown}")
+    page_size = page_size or settings.SCAN_PAGE_SIZE
+    if page_size <= 0:
+        raise ValueError("page_size debe ser mayor que 0")
+
+    total = None
+    if progress is not None and where is None:
+        total = max(collection.count() - offset, 0)
+        if limit is not None:
+            total = min(total, limit)
+
+    scanned = 0
+    while limit is None or scanned < limit:
+        size = page_size if limit is None else min(page_size, limit - scanned)
+        kwargs = {"include": list(include), "limit": size, "offset": offset + scanned}
+        if where:
+            kwargs["where"] = where
+        page = collection.get(**kwargs)
+        page_ids = page.get("ids") or []
+        if not page_ids:
+            break
+
+        scanned += len(page_ids)
+        yield page
+        if progress is not None:
+            progress(scanned, total)
+        if len(page_ids) < size:
+            break
+
+
+def iter_records(collection, include: Sequence[str] = ("metadatas",),
+                 **kwargs) -> Iterator[Dict]:
+    """
+    Igual que iter_collection pero chunk a chunk: {"id", "document", "metadata", "embedding"}
+    (solo los campos pedidos en include).
+    """
+    singular = {"documents": "document", "metadatas": "metadata", "embeddings": "embedding"}
+    for page in iter_collection(collection, include=include, **kwargs):
+        columns = [(singular[field], page.get(field)) for field in include]
+        for i, chunk_id in enumerate(page["ids"]):
+            record = {"id": chunk_id}
+            for name, values in columns:
+                record[name] = values[i] if values is not None else None
+            yield record
@@ -0,0 +1,233 @@
+"""
+app/rag/context_builder.py
+Arma el contexto del prompt a partir de los chunks recuperados:
+    - Une los chunks consecutivos (o repetidos) de un mismo documento y quita
+      el texto solapado entre ellos (CHUNK_OVERLAP de la ingesta)
+    - Agrupa por documento, del más relevante al menos relevante, con los
+      fragmentos en el orden del documento
+    - Recorta a un presupuesto de tokens según el modo de respuesta,
+      descartando primero los chunks menos relevantes
+
+Si el texto del documento está en el almacén de textos (rag/text_store.py),
+en la versión sobre la que se calcularon los offsets, los chunks se unen
+por sus offsets y, con CONTEXT_NEIGHBOUR_CHARS, se amplían con el texto
+vecino mientras quepa en el presupuesto. Los demás chunks se unen
+comparando su texto.
+"""
+
+import logging
+from typing import Dict, List, Optional, Tuple
+from config.settings import settings
+from rag.text_store import DocumentText, Span, get_text_store
+
+logger = logging.getLogger(__name__)
+
+# Caracteres del inicio de un chunk que se buscan al final del anterior para
+# detectar el solapamiento (menos que esto no se considera solapamiento)
+OVERLAP_PROBE_CHARS = 32
+
+# Separador entre fragmentos no consecutivos de un mismo documento
+EXCERPT_SEPARATOR = "\n[...]\n"
+
+
+def estimate_tokens(text: str) -> int:
+    """Estimación rápida de tokens (~4 caracteres por token en español)."""
+    return (len(text) + 3) // 4
+
+
+def context_budget(response_mode: str) -> int:
+    """Presupuesto de tokens del contexto para el modo de respuesta."""
+    if response_mode == "brief":
+        return settings.CONTEXT_TOKEN_BUDGET_BRIEF
+    return settings.CONTEXT_TOKEN_BUDGET_EXTENDED
+
+
+def overlap_length(previous: str, following: str) -> int:
+    """Largo del mayor sufijo de `previous` que es prefijo de `following`."""
+    probe = following[:OVERLAP_PROBE_CHARS]
+    if len(probe) < OVERLAP_PROBE_CHARS:
+        return 0
+    tail_start = max(0, len(previous) - len(following))
+    position = previous.find(probe, tail_start)
+    while position != -1:
+        if following.startswith(previous[position:]):
+            return len(previous) - position
+        position = previous.find(probe, position + 1)
+    return 0
+
+
+def _chunks(results: Dict) -> List[Dict]:
+    """Chunks del resultado de retrieve en orden de relevancia."""
+    documents = (results.get("documents") or [[]])[0] or []
+    metadatas = (results.get("metadatas") or [[]])[0] or [None] * len(documents)
+    ids = (results.get("ids") or [[]])[0] or [None] * len(documents)
+    chunks = []
+    for rank, (chunk_id, document, metadata) in enumerate(zip(ids, documents, metadatas)):
+        if not document:
+            continue
+        metadata = metadata or {}
+        chunk_index = metadata.get("chunk_index")
+        start, end = metadata.get("text_start"), metadata.get("text_end")
+        chunks.append({
+            "rank": rank,
+            # Los chunks sin documento de origen (p.ej. /ingest_test) van solos
+            "doc_id": metadata.get("id") or chunk_id or f"chunk_{rank}",
+            "chunk_index": chunk_index if isinstance(chunk_index, int) else None,
+            "span": (start, end) if isinstance(start, int) and isinstance(end, int) else None,
+            "text_version": metadata.get("text_version"),
+            "title": metadata.get("titulo", "Sin título"),
+            "text": document.strip()
+        })
+    return chunks
+
+
+def _merge_spans(document: DocumentText, spans: List[Span], expand: int = 0) -> List[str]:
+    """Une los intervalos que se solapan o tocan y materializa su texto."""
+    merged: List[List[int]] = []
+    for start, end in sorted(document.expand(span, expand) for span in spans):
+        if merged and start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return [document.text(start, end) for start, end in merged]
+
+
+def _merge_texts(doc_chunks: List[Dict]) -> List[str]:
+    """Une por texto los chunks consecutivos (según chunk_index) quitando el solapamiento."""
+    doc_chunks = sorted(
+        doc_chunks, key=lambda chunk: (chunk["chunk_index"] is None, chunk["chunk_index"] or 0, chunk["rank"])
+    )
+    excerpts: List[str] = []
+    previous_index: Optional[int] = None
+    for chunk in doc_chunks:
+        index = chunk["chunk_index"]
+        if excerpts and index is not None and index == previous_index:
+            # Mismo chunk recuperado dos veces
+            continue
+        if excerpts and index is not None and previous_index is not None and index == previous_index + 1:
+            overlap = overlap_length(excerpts[-1], chunk["text"])
+            excerpts[-1] += ("" if overlap else "\n") + chunk["text"][overlap:]
+        else:
+            excerpts.append(chunk["text"])
+        previous_index = index
+    return excerpts
+
+
+def _document_text(doc_id: str, doc_chunks: List[Dict],
+                   documents: Dict[Tuple[str, str], Optional[DocumentText]]) -> Optional[DocumentText]:
+    """
+    Texto del documento en el almacén, si todos sus chunks tienen offsets
+    calculados sobre la versión publicada del texto.
+
+    Durante una reingesta (o si falló) los chunks pueden mezclar versiones o
+    apuntar a una que no se publicó: en ese caso se usa el texto de los chunks.
+    """
+    if any(chunk["span"] is None for chunk in doc_chunks):
+        return None
+    versions = {chunk["text_version"] for chunk in doc_chunks}
+    if len(versions) != 1 or None in versions:
+        return None
+    key = (doc_id, versions.pop())
+    if key not in documents:
+        documents[key] = get_text_store().open(*key)
+    document = documents[key]
+    if document is None or not all(document.valid(chunk["span"]) for chunk in doc_chunks):
+        return None
+    return document
+
+
+def _merge(chunks: List[Dict], documents: Dict[Tuple[str, str], Optional[DocumentText]], expand: int = 0) -> Tuple[List[Dict], int]:
+    """
+    Une los chunks seleccionados en un bloque por documento.
+
+    Args:
+        chunks: Chunks seleccionados
+        documents: Textos del almacén ya abiertos, por (doc_id, versión) (se completa al usarse)
+        expand: Bytes de texto vecino a agregar a cada lado de cada chunk (solo con offsets)
+
+    Returns:
+        (bloques ordenados por relevancia del documento, caracteres solapados quitados)
+    """
+    by_doc: Dict[str, List[Dict]] = {}
+    for chunk in sorted(chunks, key=lambda chunk: chunk["rank"]):
+        by_doc.setdefault(chunk["doc_id"], []).append(chunk)
+
+    blocks = []
+    removed = 0
+    for doc_id, doc_chunks in by_doc.items():
+        document = _document_text(doc_id, doc_chunks, documents)
+        if document is not None:
+            excerpts = _merge_spans(document, [chunk["span"] for chunk in doc_chunks], expand)
+        else:
+            excerpts = _merge_texts(doc_chunks)
+        removed += max(0, sum(len(chunk["text"]) for chunk in doc_chunks) - sum(len(text) for text in excerpts))
+        blocks.append({
+            "doc_id": doc_id,
+            "title": doc_chunks[0]["title"],
+            "chunks": len(doc_chunks),
+            "text": EXCERPT_SEPARATOR.join(excerpts)
+        })
+    return blocks, removed
+
+
+def _truncate(text: str, max_tokens: int) -> str:
+    """Corta el texto al presupuesto, en un espacio si es posible."""
+    max_chars = max_tokens * 4
+    if len(text) <= max_chars:
+        return text
+    cut = text[:max_chars]
+    last_space = cut.rfind(" ")
+    if last_space > max_chars // 2:
+        cut = cut[:last_space]
+    return cut.rstrip() + " [...]"
+
+
+def build_context(results: Dict, response_mode: str = "extended", budget: Optional[int] = None) -> List[Dict]:
+    """
+    Arma los bloques de contexto (uno por documento) dentro del presupuesto.
+
+    Args:
+        results: Resultado de retrieve (formato de collection.query)
+        response_mode: 'brief' o 'extended' (define el presupuesto por defecto)
+        budget: Presupuesto de tokens (None = el del modo)
+
+    Returns:
+        Lista de {"doc_id", "title", "chunks", "text"} en orden de relevancia
+    """
+    budget = context_budget(response_mode) if budget is None else budget
+    chunks = _chunks(results)
+    documents: Dict[Tuple[str, str], Optional[DocumentText]] = {}
+
+    # Agregar chunks por relevancia mientras el contexto (ya sin solapamientos) quepa
+    selected: List[Dict] = []
+    blocks: List[Dict] = []
+    removed = 0
+    for chunk in chunks:
+        candidate_blocks, candidate_removed = _merge(selected + [chunk], documents)
+        if sum(estimate_tokens(block["text"]) for block in candidate_blocks) <= budget:
+            selected.append(chunk)
+            blocks, removed = candidate_blocks, candidate_removed
+        elif not selected:
+            # Ni el chunk más relevante cabe completo: recortarlo (sin offsets)
+            selected.append({**chunk, "span": None, "text": _truncate(chunk["text"], budget)})
+            blocks, removed = _merge(selected, documents)
+
+    # Con presupuesto libre, ampliar cada chunk con el texto que lo rodea en el documento
+    if settings.CONTEXT_NEIGHBOUR_CHARS > 0 and len(selected) == len(chunks):
+        expanded, _ = _merge(selected, documents, expand=settings.CONTEXT_NEIGHBOUR_CHARS)
+        if sum(estimate_tokens(block["text"]) for block in expanded) <= budget:
+            blocks = expanded
+
+    total_tokens = sum(estimate_tokens(block["text"]) for block in blocks)
+    logger.debug(
+        f"Contexto: {len(selected)}/{len(chunks)} chunks en {len(blocks)} documentos, "
+        f"~{total_tokens} tokens (presupuesto {budget}), {removed} caracteres solapados quitados"
+    )
+    return blocks
+
+
+def format_context(blocks: List[Dict]) -> str:
+    """Texto del contexto para el prompt."""
+    return "\n\n".join(
+        f"[Documento {i + 1}] {block['title']}:\n{block['text']}" for i, block in enumerate(blocks)
+    )
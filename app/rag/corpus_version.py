@@ -0,0 +1,57 @@
+"""
+app/rag/corpus_version.py
+Sello de versión del corpus ingerido. La ingesta lo incrementa cada vez que
+cambia el contenido de la colección; los caches de respuestas lo incluyen en
+sus claves para invalidarse. Se guarda en disco para que el cambio hecho por
+un script de ingesta lo vea también el proceso de la API.
+"""
+
+import logging
+import os
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Optional
+from config.settings import settings
+
+logger = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+_cached_version: Optional[str] = None
+_cached_mtime: Optional[float] = None
+
+
+def get_corpus_version() -> str:
+    """Retorna la versión actual del corpus ("0" si nunca se ha ingerido)."""
+    global _cached_version, _cached_mtime
+    path = Path(settings.CORPUS_VERSION_PATH)
+    try:
+        mtime = os.stat(path).st_mtime
+    except FileNotFoundError:
+        return "0"
+    if mtime == _cached_mtime and _cached_version is not None:
+        return _cached_version
+
+    with _lock:
+        try:
+            version = path.read_text(encoding="utf-8").strip() or "0"
+        except FileNotFoundError:
+            return "0"
+        _cached_version, _cached_mtime = version, mtime
+        return version
+
+
+def bump_corpus_version() -> str:
+    """Genera y persiste una nueva versión del corpus (escritura atómica)."""
+    global _cached_version, _cached_mtime
+    version = f"{int(time.time())}-{uuid.uuid4().hex[:8]}"
+    path = Path(settings.CORPUS_VERSION_PATH)
+    with _lock:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(path.name + ".tmp")
+        tmp_path.write_text(version, encoding="utf-8")
+        os.replace(tmp_path, path)
+        _cached_version, _cached_mtime = version, os.stat(path).st_mtime
+    logger.info(f"Versión del corpus actualizada: {version}")
+    return version
@@ -0,0 +1,179 @@
+"""
+app/rag/embedding_store.py
+Almacén persistente (SQLite) de embeddings direccionado por contenido.
+La clave es SHA-256(modelo + texto del chunk), de modo que una reingesta
+solo llama a la API de embeddings para chunks que nunca se habían visto.
+"""
+
+import hashlib
+import logging
+import sqlite3
+import threading
+import time
+from array import array
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+from config.settings import settings
+
+logger = logging.getLogger(__name__)
+
+
+def content_key(text: str, model_name: str) -> str:
+    """Clave del almacén: SHA-256 del id de modelo y el texto del chunk."""
+    digest = hashlib.sha256()
+    digest.update(model_name.encode("utf-8"))
+    digest.update(b"\0")
+    digest.update(text.encode("utf-8"))
+    return digest.hexdigest()
+
+
+class EmbeddingStore:
+    """
+    Almacén de embeddings en SQLite con límite de tamaño.
+
+    Los vectores se guardan como float32 empaquetados; cuando se supera
+    `max_entries` se expulsan las entradas usadas hace más tiempo.
+    """
+
+    def __init__(self, path: Path, max_entries: int = 200000):
+        self.path = Path(path)
+        self.max_entries = max_entries
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS embeddings (
+                key TEXT PRIMARY KEY,
+                model TEXT NOT NULL,
+                vector BLOB NOT NULL,
+                last_used REAL NOT NULL
+            )
+            """
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_embeddings_last_used ON embeddings(last_used)"
+        )
+        self._conn.commit()
+
+    def get_many(self, keys: Iterable[str]) -> Dict[str, List[float]]:
+        """Retorna los embeddings encontrados para las claves dadas."""
+        keys = list(keys)
+        found = {}
+        if not keys:
+            return found
+
+        now = time.time()
+        with self._lock:
+            # SQLite limita el número de parámetros por sentencia
+            for i in range(0, len(keys), 500):
+                part = keys[i:i + 500]
+                placeholders = ",".join("?" * len(part))
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})",
+                    part
+                ).fetchall()
+                for key, blob in rows:
+                    vector = array("f")
+                    vector.frombytes(blob)
+                    found[key] = vector.tolist()
+                if rows:
+                    self._conn.execute(
+                        f"UPDATE embeddings SET last_used = ? WHERE key IN ({placeholders})",
+                        [now, *part]
+                    )
+            self._conn.commit()
+        return found
+
+    def put_many(self, items: Dict[str, List[float]], model_name: str) -> None:
+        """Guarda embeddings nuevos y aplica el límite de tamaño."""
+        if not items:
+            return
+
+        now = time.time()
+        rows = [
+            (key, model_name, array("f", vector).tobytes(), now)
+            for key, vector in items.items()
+        ]
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, model, vector, last_used) VALUES (?, ?, ?, ?)",
+                rows
+            )
+            self._evict()
+            self._conn.commit()
+
+    def _evict(self) -> None:
+        """Expulsa las entradas menos usadas si se supera max_entries."""
+        if self.max_entries <= 0:
+            return
+        count = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        excess = count - self.max_entries
+        if excess > 0:
+            self._conn.execute(
+                """
+                DELETE FROM embeddings WHERE key IN (
+                    SELECT key FROM embeddings ORDER BY last_used ASC LIMIT ?
+                )
+                """,
+                (excess,)
+            )
+            logger.info(f"🧹 Almacén de embeddings: {excess} entradas expulsadas")
+
+    def stats(self) -> Dict[str, int]:
+        """Retorna número de entradas y límite configurado."""
+        with self._lock:
+            count = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        return {"entries": count, "max_entries": self.max_entries}
+
+
+_store: Optional[EmbeddingStore] = None
+_store_lock = threading.Lock()
+
+
+def get_embedding_store() -> EmbeddingStore:
+    """Retorna el almacén compartido del proceso (se crea en el primer uso)."""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = EmbeddingStore(
+                settings.EMBEDDING_STORE_PATH,
+                max_entries=settings.EMBEDDING_STORE_MAX_ENTRIES
+            )
+        return _store
+
+
+def embed_with_store(texts: List[str], embedding_fn, store: EmbeddingStore = None) -> Tuple[List[list], Dict[str, int]]:
+    """
+    Retorna embeddings para `texts` consultando primero el almacén.
+
+    Los textos idénticos (dentro de la lista o ya vistos en otros documentos)
+    se embeben una sola vez; solo los textos nuevos llegan a la API.
+
+    Returns:
+        (embeddings en el orden de entrada, estadísticas reused/computed)
+    """
+    store = store or get_embedding_store()
+    model_name = embedding_fn.model_name
+
+    keys = [content_key(text, model_name) for text in texts]
+    unique = dict(zip(keys, texts))
+
+    vectors = store.get_many(unique.keys())
+    missing_keys = [key for key in unique if key not in vectors]
+
+    if missing_keys:
+        missing_texts = [unique[key] for key in missing_keys]
+        computed = embedding_fn(missing_texts)
+        new_items = dict(zip(missing_keys, computed))
+        store.put_many(new_items, model_name)
+        vectors.update(new_items)
+
+    stats = {
+        "chunks": len(texts),
+        "unique": len(unique),
+        "reused": len(unique) - len(missing_keys),
+        "computed": len(missing_keys)
+    }
+    return [vectors[key] for key in keys], stats
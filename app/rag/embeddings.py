@@ -1,33 +1,135 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import List
 from config.settings import settings
-import google.generativeai as genai
 from chromadb.api.types import EmbeddingFunction
+from rag.cache import TTLLRUCache, normalize_text
+from rag.metrics import record_cache_lookup
+
+# SDK de Gemini: se importa y configura en el primer embedding, no al importar el módulo
+_genai = None
+_genai_lock = threading.Lock()
+
+
+def get_genai():
+    """Retorna el módulo google.generativeai configurado con la API key."""
+    global _genai
+    if _genai is not None:
+        return _genai
+
+    with _genai_lock:
+        if _genai is None:
+            import google.generativeai as genai
+            genai.configure(api_key=settings.GEMINI_API_KEY)
+            _genai = genai
+        return _genai
 
-# Configurar Gemini API
-genai.configure(api_key=settings.GEMINI_API_KEY)
 
 class GeminiEmbeddingFunction(EmbeddingFunction):
     """
     Función de embeddings compatible con ChromaDB,
     utilizando el modelo de Gemini.
+
+    Los embeddings de textos repetidos (p.ej. preguntas frecuentes) se sirven
+    desde un cache LRU en memoria con TTL, evitando el round-trip a la API.
+    Las listas de varios textos (ingesta) se envían en requests por lotes.
     """
 
+    def __init__(self, model_name: str = None, cache_size: int = None, cache_ttl: float = None):
+        self.model_name = model_name or settings.EMBEDDING_MODEL
+        self.cache = TTLLRUCache(
+            max_size=settings.EMBEDDING_CACHE_SIZE if cache_size is None else cache_size,
+            ttl_seconds=settings.EMBEDDING_CACHE_TTL if cache_ttl is None else cache_ttl
+        )
+        self.batch_size = settings.EMBEDDING_BATCH_SIZE
+        self.max_batch_chars = settings.EMBEDDING_MAX_BATCH_CHARS
+        self.max_concurrency = settings.EMBEDDING_MAX_CONCURRENCY
+
     def __call__(self, input: str) -> list:
         if isinstance(input, list):
             # Si recibe una lista de textos
-            return [self._embed_text(text) for text in input]
+            if len(input) == 1:
+                return [self._embed_text(input[0])]
+            return self.embed_batch(input)
         # Si recibe un solo texto
         return [self._embed_text(input)]
 
+    def embed_batch(self, texts: List[str]) -> List[list]:
+        """
+        Genera embeddings para varios textos usando requests por lotes.
+
+        Los textos se agrupan respetando EMBEDDING_BATCH_SIZE (textos por request)
+        y EMBEDDING_MAX_BATCH_CHARS (tamaño por request); los lotes se ejecutan
+        con concurrencia acotada y el resultado conserva el orden de entrada.
+        """
+        for text in texts:
+            if not text or text.strip() == "":
+                raise ValueError("El texto para embedding no puede estar vacío.")
+
+        batches = self._make_batches(texts)
+        if len(batches) == 1:
+            return self._embed_batch_request(batches[0])
+
+        workers = max(1, min(self.max_concurrency, len(batches)))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            batch_results = list(executor.map(self._embed_batch_request, batches))
+
+        return [embedding for batch in batch_results for embedding in batch]
+
+    def _make_batches(self, texts: List[str]) -> List[List[str]]:
+        """Agrupa textos en lotes consecutivos bajo los límites de tamaño."""
+        batches = []
+        current = []
+        current_chars = 0
+        for text in texts:
+            if current and (
+                len(current) >= self.batch_size
+                or current_chars + len(text) > self.max_batch_chars
+            ):
+                batches.append(current)
+                current = []
+                current_chars = 0
+            current.append(text)
+            current_chars += len(text)
+        if current:
+            batches.append(current)
+        return batches
+
+    def _embed_batch_request(self, texts: List[str]) -> List[list]:
+        """Realiza un único request de embeddings para un lote de textos."""
+        response = get_genai().embed_content(
+            model=self.model_name,
+            content=texts
+        )
+        embeddings = response["embedding"]
+        if len(embeddings) != len(texts):
+            raise RuntimeError(
+                f"La API retornó {len(embeddings)} embeddings para {len(texts)} textos."
+            )
+        return embeddings
+
     def _embed_text(self, text: str) -> list:
         if not text or text.strip() == "":
             raise ValueError("El texto para embedding no puede estar vacío.")
 
+        cache_key = (self.model_name, normalize_text(text))
+        embedding = self.cache.get(cache_key)
+        record_cache_lookup("embedding", embedding is not None)
+        if embedding is not None:
+            return embedding
+
         # Usar directamente genai.embed_content en lugar de GenerativeModel
-        response = genai.embed_content(
-            model="models/text-embedding-004",
+        response = get_genai().embed_content(
+            model=self.model_name,
             content=text
         )
-        return response["embedding"]
+        embedding = response["embedding"]
+        self.cache.set(cache_key, embedding)
+        return embedding
+
+    def cache_stats(self) -> dict:
+        """Retorna hits/misses del cache de embeddings."""
+        return {"model": self.model_name, **self.cache.stats()}
 
 # Instancia única para usar en todo el proyecto
 embedding_function = GeminiEmbeddingFunction()
@@ -5,9 +5,14 @@ Prioridad: PDF, con soporte extensible para TXT, DOCX, MD.
 """
 
 import os
-from typing import Dict, List, Optional
+import time
+import multiprocessing
+from multiprocessing.connection import Connection, wait
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
 from pathlib import Path
 import logging
+from config.settings import settings
+from utils.text_cache import TextCache
 
 # PDF processing
 try:
@@ -32,6 +37,9 @@ except ImportError:
 
 logger = logging.getLogger(__name__)
 
+# Método de arranque de los procesos de extracción (ver iter_load_files)
+_START_METHOD = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+
 
 class FileLoader:
     """
@@ -41,8 +49,16 @@ class FileLoader:
     
     SUPPORTED_EXTENSIONS = {'.pdf', '.txt', '.md', '.docx', '.png', '.jpg', '.jpeg'}
     
-    def __init__(self):
-        """Inicializa el loader y verifica dependencias disponibles."""
+    def __init__(self, text_cache: Optional[TextCache] = None):
+        """
+        Inicializa el loader y verifica dependencias disponibles.
+        
+        Args:
+            text_cache: Cache de texto extraído; por defecto el configurado en settings
+        """
+        if text_cache is None and settings.TEXT_CACHE_ENABLED:
+            text_cache = TextCache(settings.TEXT_CACHE_DIR, root=settings.DATA_DIR)
+        self.text_cache = text_cache
         self.available_loaders = {
             'pdf': PDF_AVAILABLE or PDFPLUMBER_AVAILABLE,
             'txt': True,  # Siempre disponible
@@ -137,34 +153,102 @@ class FileLoader:
                 'error': str(e)
             }
     
+    def iter_pages(self, file_path: str) -> Iterator[str]:
+        """
+        Produce el texto del archivo página por página, sin acumular el documento.
+        
+        Los PDFs se leen del cache de texto si existe; si no, se extraen en
+        streaming y se guardan en el cache a medida que se leen. Los demás
+        formatos se producen como una única página.
+        """
+        path = Path(file_path)
+        extension = path.suffix.lower()
+        
+        if extension not in self.SUPPORTED_EXTENSIONS:
+            raise ValueError(f'Extensión no soportada: {extension}')
+        
+        if extension == '.pdf':
+            yield from self._iter_pdf_pages(path)
+        elif extension in ['.txt', '.md']:
+            yield self._load_text(path)
+        elif extension == '.docx':
+            yield self._load_docx(path)
+        else:
+            logger.warning(f"No se puede procesar imagen {path.name} sin OCR configurado")
+            yield f"[Archivo de imagen: {path.name}]"
+    
+    def prefetch(self, file_path: str) -> Dict:
+        """
+        Extrae un archivo para dejarlo en el cache de texto, sin retornar su texto.
+        Si el cache está deshabilitado equivale a load_file.
+        """
+        path = Path(file_path)
+        if self.text_cache is None or path.suffix.lower() != '.pdf':
+            return self.load_file(file_path)
+        
+        try:
+            pages = 0
+            for _ in self._iter_pdf_pages(path):
+                pages += 1
+            return {'metadata': {'filename': path.name, 'pages': pages}, 'success': True, 'error': None}
+        except Exception as e:
+            logger.error(f"Error procesando {file_path}: {str(e)}")
+            return {'text': '', 'metadata': {'filename': path.name}, 'success': False, 'error': str(e)}
+    
     def _load_pdf(self, path: Path) -> str:
-        """Extrae texto de PDF usando pdfplumber (preferido) o PyPDF2."""
+        """Extrae texto de PDF, reutilizando el cache de texto si está disponible."""
+        return '\n\n'.join(page for page in self._iter_pdf_pages(path) if page)
+    
+    def _iter_pdf_pages(self, path: Path) -> Iterator[str]:
+        """Páginas de un PDF desde el cache de texto o mediante extracción en streaming."""
+        if self.text_cache is None:
+            yield from self._extract_pdf_pages(path)
+            return
+        
+        cached = self.text_cache.iter_pages(path)
+        if cached is not None:
+            yield from cached
+            return
+        
+        try:
+            self.text_cache.cache_dir.mkdir(parents=True, exist_ok=True)
+        except OSError as e:
+            logger.warning(f"Cache de texto no disponible ({e}), extrayendo sin cache")
+            yield from self._extract_pdf_pages(path)
+            return
+        
+        yield from self.text_cache.write_through(path, self._extract_pdf_pages(path))
+    
+    def _extract_pdf_pages(self, path: Path) -> Iterator[str]:
+        """Extrae el texto de cada página usando pdfplumber (preferido) o PyPDF2."""
         
         # Intentar con pdfplumber primero (más robusto)
+        yielded = 0
         if PDFPLUMBER_AVAILABLE:
             try:
                 import pdfplumber
-                text_parts = []
                 with pdfplumber.open(path) as pdf:
                     for page in pdf.pages:
-                        page_text = page.extract_text()
-                        if page_text:
-                            text_parts.append(page_text)
-                return '\n\n'.join(text_parts)
+                        page_text = page.extract_text() or ''
+                        # Liberar los objetos de la página ya procesada
+                        page.close()
+                        yielded += 1
+                        yield page_text
+                return
             except Exception as e:
+                if yielded:
+                    # Ya se entregaron páginas: no se puede reintentar con otra librería
+                    raise
                 logger.warning(f"pdfplumber falló para {path.name}, intentando PyPDF2: {e}")
         
         # Fallback a PyPDF2
         if PDF_AVAILABLE:
             try:
-                text_parts = []
                 with open(path, 'rb') as file:
                     pdf_reader = PyPDF2.PdfReader(file)
                     for page in pdf_reader.pages:
-                        page_text = page.extract_text()
-                        if page_text:
-                            text_parts.append(page_text)
-                return '\n\n'.join(text_parts)
+                        yield page.extract_text() or ''
+                return
             except Exception as e:
                 logger.error(f"PyPDF2 también falló: {e}")
                 raise
@@ -193,13 +277,16 @@ class FileLoader:
         text_parts = [paragraph.text for paragraph in doc.paragraphs if paragraph.text.strip()]
         return '\n\n'.join(text_parts)
     
-    def load_directory(self, directory_path: str, recursive: bool = True) -> List[Dict]:
+    def load_directory(self, directory_path: str, recursive: bool = True,
+                       max_workers: int = 1, timeout: Optional[float] = None) -> List[Dict]:
         """
         Carga todos los archivos soportados de un directorio.
         
         Args:
             directory_path: Ruta al directorio
             recursive: Si buscar recursivamente en subdirectorios
+            max_workers: Procesos de extracción en paralelo (1 = secuencial)
+            timeout: Segundos máximos por archivo (solo en modo paralelo)
             
         Returns:
             Lista de diccionarios con resultados de carga
@@ -214,10 +301,14 @@ class FileLoader:
         # Patrón de búsqueda
         pattern = '**/*' if recursive else '*'
         
-        for file_path in path.glob(pattern):
-            if file_path.is_file() and file_path.suffix.lower() in self.SUPPORTED_EXTENSIONS:
-                result = self.load_file(str(file_path))
-                results.append(result)
+        file_paths = [
+            str(file_path) for file_path in path.glob(pattern)
+            if file_path.is_file() and file_path.suffix.lower() in self.SUPPORTED_EXTENSIONS
+        ]
+        
+        # Conservar el orden del directorio aunque la extracción sea paralela
+        loaded = dict(iter_load_files(file_paths, max_workers=max_workers, timeout=timeout, loader=self))
+        results = [loaded[file_path] for file_path in file_paths]
         
         successful = sum(1 for r in results if r['success'])
         logger.info(f"Directorio procesado: {successful}/{len(results)} archivos exitosos")
@@ -225,6 +316,173 @@ class FileLoader:
         return results
 
 
+def _extraction_worker(tasks: Connection, results: Connection, prefetch: bool = False) -> None:
+    """
+    Punto de entrada de cada proceso de extracción: recibe rutas por `tasks`
+    hasta recibir None y, por cada una, envía None al empezar y luego el resultado.
+    """
+    loader = FileLoader()
+    while True:
+        try:
+            file_path = tasks.recv()
+        except EOFError:
+            break
+        if file_path is None:
+            break
+        # Inicio de la extracción: el timeout se mide desde aquí
+        results.send(None)
+        try:
+            result = loader.prefetch(file_path) if prefetch else loader.load_file(file_path)
+        except Exception as e:
+            result = _failed_result(file_path, str(e))
+        results.send(result)
+
+
+def _failed_result(file_path: str, error: str) -> Dict:
+    return {
+        'text': '',
+        'metadata': {'filename': Path(file_path).name},
+        'success': False,
+        'error': error
+    }
+
+
+class _ExtractionWorker:
+    """Proceso de extracción reutilizable, con un Pipe propio para tareas y otro para resultados."""
+    
+    def __init__(self, ctx, prefetch: bool):
+        task_receiver, self.tasks = ctx.Pipe(duplex=False)
+        self.results, result_sender = ctx.Pipe(duplex=False)
+        self.process = ctx.Process(
+            target=_extraction_worker, args=(task_receiver, result_sender, prefetch), daemon=True
+        )
+        self.process.start()
+        # Sin las copias del padre, recv() detecta el cierre si el proceso muere
+        task_receiver.close()
+        result_sender.close()
+        self.file_path: Optional[str] = None
+        self.started: Optional[float] = None
+    
+    def assign(self, file_path: str) -> None:
+        self.file_path = file_path
+        self.started = None
+        self.tasks.send(file_path)
+    
+    def receive(self) -> Optional[Dict]:
+        """
+        Lee los mensajes disponibles. Retorna el resultado del archivo asignado,
+        o None si solo llegó el aviso de inicio. Lanza EOFError si el proceso murió.
+        """
+        message = self.results.recv()
+        if message is None:
+            self.started = time.monotonic()
+            if not self.results.poll():
+                return None
+            message = self.results.recv()
+        self.file_path = None
+        self.started = None
+        return message
+    
+    def close(self) -> None:
+        if self.file_path is None and self.process.is_alive():
+            try:
+                self.tasks.send(None)
+            except OSError:
+                pass
+            self.process.join(timeout=5)
+        if self.process.is_alive():
+            self.process.terminate()
+            self.process.join()
+        self.tasks.close()
+        self.results.close()
+
+
+def iter_load_files(file_paths: Iterable[str], max_workers: int = 1,
+                    timeout: Optional[float] = None,
+                    loader: Optional["FileLoader"] = None,
+                    prefetch: bool = False) -> Iterator[Tuple[str, Optional[Dict]]]:
+    """
+    Extrae varios archivos y produce (ruta, resultado) a medida que terminan.
+    
+    Con max_workers > 1 los archivos se reparten entre a lo sumo max_workers
+    procesos reutilizables (pdfplumber es CPU-bound). El timeout cuenta solo
+    la extracción: desde que el proceso empieza el archivo hasta que su
+    resultado está disponible, aunque el consumidor tarde en pedir el
+    siguiente. Si un archivo supera `timeout` segundos su proceso se termina
+    (y se reemplaza) y el archivo se reporta como fallido, sin bloquear al resto.
+    
+    Con prefetch=True los procesos solo dejan el texto en el cache (ver
+    FileLoader.prefetch) y en modo secuencial no se extrae nada: el resultado
+    es None y el consumidor lee las páginas en streaming con iter_pages.
+    """
+    file_paths = list(file_paths)
+    
+    if max_workers <= 1 or len(file_paths) <= 1:
+        loader = loader or FileLoader()
+        for file_path in file_paths:
+            yield file_path, None if prefetch else loader.load_file(file_path)
+        return
+    
+    # Los procesos no se crean con fork: /ingest_all corre dentro del proceso
+    # de uvicorn (con hilos) y el hijo heredaría locks tomados por otros hilos.
+    # Cada proceso tiene sus propios Pipes: terminar uno por timeout no puede
+    # dejar a medio escribir un canal compartido con los demás.
+    ctx = multiprocessing.get_context(_START_METHOD)
+    pending = list(reversed(file_paths))
+    pool_size = min(max_workers, len(file_paths))
+    workers: List[_ExtractionWorker] = []
+    
+    try:
+        while pending or any(worker.file_path is not None for worker in workers):
+            # Asignar archivos a los procesos libres (creando los que falten)
+            for worker in workers:
+                if pending and worker.file_path is None:
+                    worker.assign(pending.pop())
+            while pending and len(workers) < pool_size:
+                worker = _ExtractionWorker(ctx, prefetch)
+                worker.assign(pending.pop())
+                workers.append(worker)
+            
+            # Leer todo lo disponible antes de revisar timeouts: un resultado
+            # que llegó mientras el consumidor procesaba el anterior no es un timeout
+            finished: List[Tuple[str, Dict]] = []
+            busy = {worker.results: worker for worker in workers if worker.file_path is not None}
+            for receiver in wait(list(busy), timeout=0.5):
+                worker = busy[receiver]
+                file_path = worker.file_path
+                try:
+                    result = worker.receive()
+                except EOFError:
+                    # El proceso terminó sin reportar resultado (p.ej. crash nativo)
+                    worker.process.join()
+                    logger.error(f"❌ El proceso de extracción terminó inesperadamente: {file_path}")
+                    result = _failed_result(file_path, f'Proceso de extracción terminó con código {worker.process.exitcode}')
+                    worker.file_path = None
+                    worker.close()
+                    workers.remove(worker)
+                if result is not None:
+                    finished.append((file_path, result))
+            
+            if timeout is not None:
+                now = time.monotonic()
+                for worker in list(workers):
+                    if worker.started is None or now - worker.started <= timeout:
+                        continue
+                    if worker.results.poll():
+                        # Terminó (o está enviando el resultado): se lee en la próxima vuelta
+                        continue
+                    file_path = worker.file_path
+                    worker.close()
+                    workers.remove(worker)
+                    logger.error(f"⏱️ Extracción cancelada por timeout ({timeout}s): {file_path}")
+                    finished.append((file_path, _failed_result(file_path, f'Timeout de extracción ({timeout}s)')))
+            
+            yield from finished
+    finally:
+        for worker in workers:
+            worker.close()
+
+
 # Función helper para uso directo
 def load_file(file_path: str) -> Optional[Dict]:
     """Helper function para cargar un archivo directamente."""
@@ -232,7 +490,8 @@ def load_file(file_path: str) -> Optional[Dict]:
     return loader.load_file(file_path)
 
 
-def load_directory(directory_path: str, recursive: bool = True) -> List[Dict]:
+def load_directory(directory_path: str, recursive: bool = True,
+                   max_workers: int = 1, timeout: Optional[float] = None) -> List[Dict]:
     """Helper function para cargar un directorio completo."""
     loader = FileLoader()
-    return loader.load_directory(directory_path, recursive)
+    return loader.load_directory(directory_path, recursive, max_workers=max_workers, timeout=timeout)
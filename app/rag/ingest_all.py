@@ -7,10 +7,20 @@ Lee corpus_metadata.json y carga todos los documentos.
 import os
 import json
 import logging
+import time
 from pathlib import Path
-from typing import List, Dict, Optional
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
 from rag.chroma_manager import get_or_create_collection
-from rag.file_loader import FileLoader
+from rag.embeddings import embedding_function
+from rag.embedding_store import embed_with_store
+from rag.file_loader import FileLoader, iter_load_files
+from config.settings import settings
+from rag.manifest import load_manifest, file_fingerprint, metadata_hash, IngestManifest
+from rag.lexical_index import get_lexical_index
+from rag.corpus_version import bump_corpus_version
+from rag.source_catalog import write_catalog, source_from_metadata
+from rag.text_store import get_text_store
+from rag import metrics
 
 # Configurar logging
 logging.basicConfig(level=logging.INFO)
@@ -21,49 +31,10 @@ CORPUS_PATH = Path("/data/corpus")  # Ruta absoluta para Docker
 METADATA_FILE = CORPUS_PATH / "corpus_metadata.json"
 COLLECTION_NAME = "documentos_ucaldas"
 
-# Configuración de chunks
-CHUNK_SIZE = 1000  # Caracteres por chunk
+# Configuración de chunks (offsets en bytes UTF-8 sobre el texto del almacén)
+CHUNK_SIZE = 1000  # Bytes por chunk (~caracteres en español)
 CHUNK_OVERLAP = 200  # Solapamiento entre chunks
-
-
-def chunk_text(text: str, chunk_size: int = CHUNK_SIZE, overlap: int = CHUNK_OVERLAP) -> List[str]:
-    """
-    Divide texto en chunks con solapamiento.
-    
-    Args:
-        text: Texto a dividir
-        chunk_size: Tamaño de cada chunk
-        overlap: Caracteres de solapamiento entre chunks
-        
-    Returns:
-        Lista de chunks
-    """
-    if len(text) <= chunk_size:
-        return [text]
-    
-    chunks = []
-    start = 0
-    
-    while start < len(text):
-        end = start + chunk_size
-        chunk = text[start:end]
-        
-        # Intentar cortar en un espacio o salto de línea
-        if end < len(text):
-            last_space = chunk.rfind('\n\n')
-            if last_space == -1:
-                last_space = chunk.rfind('\n')
-            if last_space == -1:
-                last_space = chunk.rfind(' ')
-            
-            if last_space > chunk_size // 2:  # Asegurar que no sea muy corto
-                chunk = chunk[:last_space]
-                end = start + last_space
-        
-        chunks.append(chunk.strip())
-        start = end - overlap
-    
-    return [chunk for chunk in chunks if chunk]  # Filtrar chunks vacíos
+CHUNKING_PARAMS = {"chunk_size": CHUNK_SIZE, "chunk_overlap": CHUNK_OVERLAP, "offsets": "utf-8"}
 
 
 def load_corpus_metadata() -> List[Dict]:
@@ -117,10 +88,18 @@ def build_file_path(metadata: Dict) -> Optional[Path]:
     return file_path
 
 
-def ingest_single_document(metadata: Dict, collection, loader: FileLoader) -> Dict:
+def ingest_single_document(metadata: Dict, collection, loader: FileLoader,
+                           loaded: Optional[Dict] = None, lexical_index=None) -> Dict:
     """
     Ingesta un solo documento con su metadata.
     
+    Args:
+        metadata: Entrada del documento en corpus_metadata.json
+        collection: Colección de ChromaDB destino
+        loader: FileLoader para extraer el texto
+        loaded: Resultado de la etapa de extracción (pool de procesos), si la hubo
+        lexical_index: Índice BM25 que se actualiza con los mismos chunks (opcional)
+    
     Returns:
         Dict con resultado de la operación
     """
@@ -140,30 +119,26 @@ def ingest_single_document(metadata: Dict, collection, loader: FileLoader) -> Di
             "message": f"Archivo no encontrado: {file_path}"
         }
     
-    # Cargar archivo
-    result = loader.load_file(str(file_path))
-    
-    if not result.get('success'):
-        logger.error(f"❌ Error cargando archivo {file_path}: {result.get('error')}")
-        return {
-            "success": False,
-            "document_id": doc_id,
-            "message": result.get('error', 'Unknown error')
-        }
-    
-    text = result.get('text', '')
-    
-    if len(text.strip()) < 50:  # Validar que haya contenido suficiente
-        logger.warning(f"⚠️  Texto demasiado corto para {doc_id}")
+    # Fuente de páginas: texto ya extraído (pool de procesos sin cache) o
+    # lectura en streaming desde el cache / el archivo
+    if loaded is not None and not loaded.get('success'):
+        logger.error(f"❌ Error cargando archivo {file_path}: {loaded.get('error')}")
         return {
             "success": False,
             "document_id": doc_id,
-            "message": "Texto extraído muy corto o vacío"
+            "message": loaded.get('error', 'Unknown error')
         }
-    
-    # Dividir en chunks
-    chunks = chunk_text(text)
-    logger.info(f"  → Dividido en {len(chunks)} chunks")
+    read_stats = {"pages": 0}
+    if loaded is not None and 'text' in loaded:
+        pages = [loaded['text']]
+        read_stats["pages"] = loaded.get('metadata', {}).get('pages', 1)
+    else:
+        def counted(pages: Iterable[str]) -> Iterator[str]:
+            for page in pages:
+                read_stats["pages"] += 1
+                yield page
+        
+        pages = counted(loader.iter_pages(str(file_path)))
     
     # Preparar metadatos base
     # ChromaDB solo acepta tipos primitivos: str, int, float, bool, None
@@ -185,43 +160,107 @@ def ingest_single_document(metadata: Dict, collection, loader: FileLoader) -> Di
             base_metadata[key] = str(value)
     
     # Agregar metadatos adicionales
-    base_metadata['filename'] = result['metadata'].get('filename', file_path.name)
-    base_metadata['size_bytes'] = result['metadata'].get('size_bytes', 0)
-    base_metadata['chunks_total'] = len(chunks)
-    
-    # Agregar cada chunk a ChromaDB
-    ids_to_add = []
-    documents_to_add = []
-    metadatas_to_add = []
-    
-    for i, chunk in enumerate(chunks):
-        chunk_id = f"{doc_id}_chunk_{i}"
-        chunk_metadata = {
+    base_metadata['filename'] = file_path.name
+    base_metadata['size_bytes'] = file_path.stat().st_size
+    
+    def chunk_metadata(i: int, span: Tuple[int, int], length: int, chunks_total: Optional[int] = None) -> Dict:
+        meta = {
             **base_metadata,
             'chunk_index': i,
-            'chunk_text_length': len(chunk)
+            'chunk_text_length': length,
+            'text_start': span[0],
+            'text_end': span[1],
+            # Los offsets solo valen sobre esta versión del texto (ver TextStore)
+            'text_version': staged.version
         }
-        
-        ids_to_add.append(chunk_id)
-        documents_to_add.append(chunk)
-        metadatas_to_add.append(chunk_metadata)
+        if chunks_total is not None:
+            meta['chunks_total'] = chunks_total
+        return meta
     
-    # Agregar todos los chunks de una vez (más eficiente)
+    # Pipeline en streaming: páginas → texto del documento en el almacén y
+    # chunks (offsets + texto) → lotes de embeddings → upsert. El primer lote
+    # se retiene hasta confirmar que el documento tiene contenido suficiente.
+    store = get_text_store()
+    chunk_ids = []
+    chunk_spans = []
+    chunk_lengths = []
+    batch = []
+    embed_stats = {"reused": 0, "computed": 0}
+    
+    def flush() -> None:
+        ids = [chunk_id for chunk_id, _, _ in batch]
+        documents = [text for _, _, text in batch]
+        metadatas = [
+            chunk_metadata(len(chunk_ids) - len(batch) + j, span, len(text))
+            for j, (_, span, text) in enumerate(batch)
+        ]
+        # Reutilizar embeddings ya calculados (almacén por contenido)
+        embeddings, stats = embed_with_store(documents, embedding_function)
+        embed_stats["reused"] += stats["reused"]
+        embed_stats["computed"] += stats["computed"]
+        # upsert: los ids son deterministas, así que reingestar sobrescribe
+        collection.upsert(
+            ids=ids,
+            documents=documents,
+            metadatas=metadatas,
+            embeddings=embeddings
+        )
+        if lexical_index is not None:
+            lexical_index.add_chunks(doc_id, ids, documents)
+        batch.clear()
+    
+    staged = None
     try:
-        collection.add(
-            ids=ids_to_add,
-            documents=documents_to_add,
-            metadatas=metadatas_to_add
+        staged = store.stage(doc_id, CHUNK_SIZE, CHUNK_OVERLAP)
+        for i, (span, text) in enumerate(staged.chunks(pages)):
+            chunk_id = f"{doc_id}_chunk_{i}"
+            chunk_ids.append(chunk_id)
+            chunk_spans.append(span)
+            chunk_lengths.append(len(text))
+            batch.append((chunk_id, span, text))
+            if len(batch) >= settings.INGEST_BATCH_SIZE and staged.length >= 50:
+                flush()
+        
+        if staged.length < 50:  # Validar que haya contenido suficiente
+            logger.warning(f"⚠️  Texto demasiado corto para {doc_id}")
+            store.discard(staged)
+            return {
+                "success": False,
+                "document_id": doc_id,
+                "message": "Texto extraído muy corto o vacío"
+            }
+        if batch:
+            flush()
+        
+        # El total de chunks se agrega al final (sin recalcular embeddings)
+        collection.update(
+            ids=chunk_ids,
+            metadatas=[
+                chunk_metadata(i, span, length, chunks_total=len(chunk_ids))
+                for i, (span, length) in enumerate(zip(chunk_spans, chunk_lengths))
+            ]
+        )
+        store.commit(doc_id, staged)
+        logger.info(
+            f"✓ {len(chunk_ids)} chunks agregados exitosamente "
+            f"(embeddings: {embed_stats['reused']} reutilizados, {embed_stats['computed']} calculados)"
         )
-        logger.info(f"✓ {len(chunks)} chunks agregados exitosamente")
+        metrics.INGEST_CHUNKS.inc(len(chunk_ids))
+        metrics.INGEST_PAGES.inc(read_stats["pages"])
         return {
             "success": True,
             "document_id": doc_id,
-            "chunks_count": len(chunks),
+            "chunks_count": len(chunk_ids),
+            "pages_count": read_stats["pages"],
+            "chunk_ids": chunk_ids,
+            "embeddings_reused": embed_stats['reused'],
+            "embeddings_computed": embed_stats['computed'],
             "message": f"Documento ingerido exitosamente"
         }
     except Exception as e:
-        logger.error(f"❌ Error agregando a ChromaDB: {e}")
+        logger.error(f"❌ Error ingiriendo {doc_id}: {e}")
+        if staged is not None:
+            store.discard(staged)
         return {
             "success": False,
             "document_id": doc_id,
@@ -229,14 +268,45 @@ def ingest_single_document(metadata: Dict, collection, loader: FileLoader) -> Di
         }
 
 
-def ingest_all_documents() -> Dict:
+def _existing_chunk_ids(collection, doc_id: str, entry: Optional[Dict]) -> List[str]:
+    """
+    Ids de chunks que el documento tiene actualmente en ChromaDB.
+    Usa el manifiesto si existe; si no, consulta la colección por metadato.
+    """
+    if entry:
+        return entry.get("chunk_ids", [])
+    try:
+        existing = collection.get(where={"id": doc_id}, include=[])
+        return existing.get("ids", []) if existing else []
+    except Exception as e:
+        logger.warning(f"⚠️  No se pudieron consultar chunks previos de {doc_id}: {e}")
+        return []
+
+
+def _delete_chunks(collection, chunk_ids: List[str]) -> int:
+    """Borra chunks huérfanos de la colección."""
+    if not chunk_ids:
+        return 0
+    collection.delete(ids=list(chunk_ids))
+    return len(chunk_ids)
+
+
+def ingest_all_documents(force: bool = False) -> Dict:
     """
     Función principal para ingerir todos los documentos del corpus.
     
+    Solo se procesan documentos nuevos o modificados según el manifiesto de
+    ingesta; los chunks sobrantes de documentos acortados o eliminados del
+    corpus se borran de la colección.
+    
+    Args:
+        force: Reprocesar todos los documentos aunque no hayan cambiado
+    
     Returns:
         Dict con resumen de la ingesta
     """
     logger.info("🚀 Iniciando ingesta del corpus completo...")
+    started = time.perf_counter()
     
     # Cargar metadatos
     metadata_list = load_corpus_metadata()
@@ -250,27 +320,165 @@ def ingest_all_documents() -> Dict:
     # Inicializar componentes
     loader = FileLoader()
     collection = get_or_create_collection(COLLECTION_NAME)
+    manifest = load_manifest(COLLECTION_NAME)
+    
+    # Si la colección fue recreada (vacía) el manifiesto ya no es válido
+    if manifest.doc_ids() and collection.count() == 0:
+        logger.info("Colección vacía: se descarta el manifiesto de ingesta")
+        manifest.reset()
+    
+    # Índice léxico BM25: si no coincide con la colección se reconstruye desde ella
+    lexical = None
+    if settings.LEXICAL_INDEX_ENABLED:
+        lexical = get_lexical_index()
+        lexical.ensure_loaded()
+        if len(lexical) != collection.count():
+            logger.info("Reconstruyendo el índice léxico desde la colección...")
+            lexical.rebuild_from_collection(collection)
+            lexical.save()
     
     # Estadísticas
     results = []
     successful = 0
     failed = 0
+    skipped = 0
+    orphans_deleted = 0
     
-    # Procesar cada documento
+    # Etapa 1: decidir qué documentos requieren procesamiento
+    current_doc_ids = set()
+    to_process = []
     for metadata in metadata_list:
-        result = ingest_single_document(metadata, collection, loader)
-        results.append(result)
+        doc_id = metadata.get("id", "unknown")
+        current_doc_ids.add(doc_id)
+        entry = manifest.get(doc_id)
+        file_path = build_file_path(metadata)
+        plan = {"metadata": metadata, "doc_id": doc_id, "entry": entry, "file_path": file_path}
+        
+        if file_path and file_path.exists():
+            plan["fingerprint"] = file_fingerprint(file_path, previous=entry)
+            plan["metadata_hash"] = metadata_hash(metadata)
+            
+            if not force and IngestManifest.is_unchanged(entry, plan["fingerprint"], plan["metadata_hash"], CHUNKING_PARAMS):
+                skipped += 1
+                successful += 1
+                metrics.INGEST_DOCUMENTS.inc(status="skipped")
+                results.append({
+                    "success": True,
+                    "document_id": doc_id,
+                    "chunks_count": len(entry["chunk_ids"]),
+                    "skipped": True,
+                    "message": "Sin cambios desde la última ingesta"
+                })
+                continue
+        
+        to_process.append(plan)
+    
+    def process(plan: Dict, loaded: Optional[Dict] = None) -> None:
+        nonlocal successful, failed, orphans_deleted
+        doc_id = plan["doc_id"]
+        previous_ids = _existing_chunk_ids(collection, doc_id, plan["entry"])
+        with metrics.INGEST_DOCUMENT_SECONDS.time():
+            result = ingest_single_document(plan["metadata"], collection, loader, loaded=loaded, lexical_index=lexical)
+        metrics.INGEST_DOCUMENTS.inc(status="success" if result.get('success') else "failed")
         
         if result.get('success'):
             successful += 1
+            new_ids = result.pop("chunk_ids")
+            stale_ids = set(previous_ids) - set(new_ids)
+            orphans_deleted += _delete_chunks(collection, stale_ids)
+            if lexical is not None:
+                lexical.remove_chunks(stale_ids)
+            manifest.set(doc_id, {
+                **plan["fingerprint"],
+                "file_path": str(plan["file_path"]),
+                "metadata_hash": plan["metadata_hash"],
+                "chunking": CHUNKING_PARAMS,
+                "chunk_ids": new_ids
+            })
+            manifest.save()
         else:
             failed += 1
+        results.append(result)
+    
+    # Etapa 2: extracción en paralelo (pool de procesos) e ingesta a medida
+    # que cada archivo termina
+    plans_by_path = {}
+    for plan in to_process:
+        if "fingerprint" in plan:
+            plans_by_path.setdefault(str(plan["file_path"]), []).append(plan)
+        else:
+            process(plan)  # Archivo inexistente: se reporta como fallido
+    
+    if plans_by_path:
+        logger.info(
+            f"📑 Extrayendo {len(plans_by_path)} archivos con {settings.INGEST_WORKERS} procesos"
+        )
+    for file_path, loaded in iter_load_files(
+        plans_by_path.keys(),
+        max_workers=settings.INGEST_WORKERS,
+        timeout=settings.EXTRACTION_TIMEOUT,
+        loader=loader,
+        prefetch=True
+    ):
+        for plan in plans_by_path[file_path]:
+            process(plan, loaded)
+    
+    # Documentos que ya no están en el corpus
+    removed = 0
+    for doc_id in manifest.doc_ids():
+        if doc_id not in current_doc_ids:
+            entry = manifest.remove(doc_id)
+            orphans_deleted += _delete_chunks(collection, entry.get("chunk_ids", []))
+            if lexical is not None:
+                lexical.remove_chunks(entry.get("chunk_ids", []))
+            get_text_store().delete(doc_id)
+            removed += 1
+            logger.info(f"🗑️  Documento retirado del corpus: {doc_id}")
+    manifest.save()
+    
+    changed = (successful - skipped) > 0 or removed > 0 or orphans_deleted > 0
+    if lexical is not None and changed:
+        lexical.save()
+    if changed:
+        # Invalida los caches de respuestas de /chat
+        bump_corpus_version()
+    
+    # Catálogo de fuentes para /sources: un registro por documento ingerido
+    if changed or force or not Path(settings.SOURCE_CATALOG_PATH).exists():
+        try:
+            ingested = set(manifest.doc_ids())
+            write_catalog(
+                source_from_metadata(metadata)
+                for metadata in metadata_list
+                if metadata.get("id", "unknown") in ingested
+            )
+        except Exception as e:
+            logger.error(f"❌ Error escribiendo el catálogo de fuentes: {e}")
+    
+    # Snapshot del índice vectorial en proceso (si es el backend activo)
+    vector_index = None
+    if settings.RETRIEVAL_BACKEND == "numpy" and (changed or force or not (Path(settings.VECTOR_INDEX_DIR) / "index.json").exists()):
+        try:
+            from rag.retrieval import export_vector_index
+            vector_index = export_vector_index(COLLECTION_NAME)
+        except Exception as e:
+            logger.error(f"❌ Error exportando el índice vectorial: {e}")
+    
+    # Throughput de la ingesta (solo documentos procesados en esta corrida)
+    elapsed = time.perf_counter() - started
+    chunks_ingested = sum(r.get("chunks_count", 0) for r in results if r.get("success") and not r.get("skipped"))
+    pages_read = sum(r.get("pages_count", 0) for r in results if r.get("success"))
+    metrics.INGEST_LAST_RUN_SECONDS.set(elapsed)
+    metrics.INGEST_LAST_RUN_CHUNKS_RATE.set(chunks_ingested / elapsed if elapsed > 0 else 0.0)
+    metrics.INGEST_LAST_RUN_PAGES_RATE.set(pages_read / elapsed if elapsed > 0 else 0.0)
     
     # Resumen
     logger.info(f"\n{'='*60}")
     logger.info(f"✅ Ingesta completada")
-    logger.info(f"   Exitosos: {successful}/{len(metadata_list)}")
+    logger.info(f"   Exitosos: {successful}/{len(metadata_list)} ({skipped} sin cambios)")
     logger.info(f"   Fallidos: {failed}/{len(metadata_list)}")
+    logger.info(f"   Retirados: {removed} | Chunks huérfanos borrados: {orphans_deleted}")
+    logger.info(f"   Throughput: {chunks_ingested / elapsed if elapsed > 0 else 0:.1f} chunks/s, {pages_read / elapsed if elapsed > 0 else 0:.1f} páginas/s")
     logger.info(f"{'='*60}\n")
     
     return {
@@ -278,6 +486,10 @@ def ingest_all_documents() -> Dict:
         "total_documents": len(metadata_list),
         "successful": successful,
         "failed": failed,
+        "skipped": skipped,
+        "removed": removed,
+        "orphans_deleted": orphans_deleted,
+        "vector_index": vector_index,
         "results": results,
         "collection": COLLECTION_NAME
     }
@@ -0,0 +1,241 @@
+"""
+app/rag/lexical_index.py
+Índice léxico BM25 en proceso sobre los mismos chunks que se ingieren en
+ChromaDB. Tokenización para español (minúsculas, sin tildes, sin stopwords,
+plurales simples). Se persiste en disco como JSON comprimido y se usa para
+búsqueda híbrida y como respaldo cuando el embedding de la consulta tarda.
+"""
+
+import gzip
+import json
+import logging
+import math
+import os
+import re
+import threading
+import unicodedata
+from collections import Counter, defaultdict
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+from config.settings import settings
+from rag.collection_scan import iter_records, log_progress
+
+logger = logging.getLogger(__name__)
+
+INDEX_VERSION = 1
+
+STOPWORDS = frozenset("""
+a al algo algun alguna algunas alguno algunos ante antes asi aun aunque cada
+como con contra cual cuales cuando de del desde donde dos e el ella ellas ello
+ellos en entre era eran es esa esas ese eso esos esta estan estas este esto
+estos fue fueron ha han hasta hay la las le les lo los mas me mi mis mucho
+muy nada ni no nos o otra otras otro otros para pero poco por porque que
+quien se sea ser si sido sin sobre son su sus tambien tan te tiene tienen
+todo todos tu un una unas uno unos y ya the of and to in is for on
+""".split())
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+
+def fold_accents(text: str) -> str:
+    """Elimina tildes y diacríticos (á→a, ñ→n, ü→u)."""
+    decomposed = unicodedata.normalize("NFKD", text)
+    return "".join(ch for ch in decomposed if not unicodedata.combining(ch))
+
+
+def _light_stem(token: str) -> str:
+    """Reducción simple de plurales en español."""
+    if len(token) > 5 and token.endswith("es"):
+        return token[:-2]
+    if len(token) > 3 and token.endswith("s"):
+        return token[:-1]
+    return token
+
+
+def tokenize(text: str) -> List[str]:
+    """Tokeniza texto en español para BM25."""
+    tokens = _TOKEN_RE.findall(fold_accents(text).lower())
+    return [_light_stem(tok) for tok in tokens if len(tok) > 1 and tok not in STOPWORDS]
+
+
+class BM25Index:
+    """
+    Índice invertido BM25.
+
+    Cada chunk guarda el id del documento, su longitud en tokens y las
+    frecuencias de términos; las listas invertidas se construyen en memoria.
+    """
+
+    def __init__(self, path: Path, k1: float = 1.5, b: float = 0.75):
+        self.path = Path(path)
+        self.k1 = k1
+        self.b = b
+        self._lock = threading.RLock()
+        self._chunks: Dict[str, Tuple[str, int, Dict[str, int]]] = {}
+        self._postings: Dict[str, Dict[str, int]] = defaultdict(dict)
+        self._total_length = 0
+        self._loaded_mtime: Optional[float] = None
+
+    def __len__(self) -> int:
+        return len(self._chunks)
+
+    # ------------------------------------------------------------ persistencia
+
+    def ensure_loaded(self) -> bool:
+        """Carga el índice desde disco si cambió desde la última carga."""
+        try:
+            mtime = os.stat(self.path).st_mtime
+        except FileNotFoundError:
+            return len(self._chunks) > 0
+        if mtime == self._loaded_mtime:
+            return True
+
+        with self._lock:
+            if mtime == self._loaded_mtime:
+                return True
+            try:
+                with gzip.open(self.path, "rt", encoding="utf-8") as f:
+                    data = json.load(f)
+            except Exception as e:
+                logger.warning(f"⚠️ No se pudo leer el índice léxico: {e}")
+                return len(self._chunks) > 0
+            if data.get("version") != INDEX_VERSION:
+                logger.info("Índice léxico con versión incompatible, se ignora")
+                return len(self._chunks) > 0
+
+            self._clear()
+            for chunk_id, (doc_id, length, tf) in data["chunks"].items():
+                self._insert(chunk_id, doc_id, length, tf)
+            self._loaded_mtime = mtime
+            logger.info(f"✅ Índice léxico cargado: {len(self._chunks)} chunks, {len(self._postings)} términos")
+            return True
+
+    def save(self) -> None:
+        """Guarda el índice en disco (escritura atómica)."""
+        with self._lock:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = self.path.with_name(self.path.name + ".tmp")
+            with gzip.open(tmp_path, "wt", encoding="utf-8", compresslevel=6) as f:
+                json.dump(
+                    {
+                        "version": INDEX_VERSION,
+                        "chunks": {cid: list(entry) for cid, entry in self._chunks.items()}
+                    },
+                    f,
+                    ensure_ascii=False
+                )
+            os.replace(tmp_path, self.path)
+            self._loaded_mtime = os.stat(self.path).st_mtime
+
+    # --------------------------------------------------------------- escritura
+
+    def _clear(self) -> None:
+        self._chunks = {}
+        self._postings = defaultdict(dict)
+        self._total_length = 0
+
+    def _insert(self, chunk_id: str, doc_id: str, length: int, tf: Dict[str, int]) -> None:
+        self._chunks[chunk_id] = (doc_id, length, tf)
+        self._total_length += length
+        for term, freq in tf.items():
+            self._postings[term][chunk_id] = freq
+
+    def _delete(self, chunk_id: str) -> None:
+        entry = self._chunks.pop(chunk_id, None)
+        if entry is None:
+            return
+        _, length, tf = entry
+        self._total_length -= length
+        for term in tf:
+            postings = self._postings.get(term)
+            if postings is not None:
+                postings.pop(chunk_id, None)
+                if not postings:
+                    del self._postings[term]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._clear()
+
+    def add_chunks(self, doc_id: str, chunk_ids: Iterable[str], texts: Iterable[str]) -> None:
+        """Agrega (o reemplaza) chunks de un documento."""
+        with self._lock:
+            for chunk_id, text in zip(chunk_ids, texts):
+                self._delete(chunk_id)
+                tokens = tokenize(text)
+                self._insert(chunk_id, doc_id, len(tokens), dict(Counter(tokens)))
+
+    def remove_chunks(self, chunk_ids: Iterable[str]) -> None:
+        with self._lock:
+            for chunk_id in chunk_ids:
+                self._delete(chunk_id)
+
+    def remove_document(self, doc_id: str) -> None:
+        """Elimina todos los chunks de un documento."""
+        with self._lock:
+            for chunk_id in [cid for cid, entry in self._chunks.items() if entry[0] == doc_id]:
+                self._delete(chunk_id)
+
+    def rebuild_from_collection(self, collection, page_size: Optional[int] = None) -> int:
+        """Reconstruye el índice completo a partir de los chunks de la colección."""
+        records = iter_records(
+            collection,
+            include=["documents", "metadatas"],
+            page_size=page_size,
+            progress=log_progress("Reconstruyendo índice léxico")
+        )
+        with self._lock:
+            self._clear()
+            for record in records:
+                tokens = tokenize(record["document"] or "")
+                doc_id = (record["metadata"] or {}).get("id", "")
+                self._insert(record["id"], doc_id, len(tokens), dict(Counter(tokens)))
+            return len(self._chunks)
+
+    # ---------------------------------------------------------------- búsqueda
+
+    def search(self, query: str, k: int = 10) -> List[Tuple[str, float]]:
+        """Retorna los k chunks con mayor puntaje BM25: [(chunk_id, score)]."""
+        terms = set(tokenize(query))
+        if not terms:
+            return []
+
+        with self._lock:
+            n_chunks = len(self._chunks)
+            if n_chunks == 0:
+                return []
+            avg_length = self._total_length / n_chunks
+            scores: Dict[str, float] = defaultdict(float)
+            for term in terms:
+                postings = self._postings.get(term)
+                if not postings:
+                    continue
+                idf = math.log(1 + (n_chunks - len(postings) + 0.5) / (len(postings) + 0.5))
+                for chunk_id, freq in postings.items():
+                    length = self._chunks[chunk_id][1]
+                    norm = self.k1 * (1 - self.b + self.b * length / avg_length)
+                    scores[chunk_id] += idf * freq * (self.k1 + 1) / (freq + norm)
+
+        return sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+
+
+def reciprocal_rank_fusion(rankings: List[List[str]], k: int = 60) -> List[Tuple[str, float]]:
+    """Fusiona varias listas ordenadas de ids con Reciprocal Rank Fusion."""
+    scores: Dict[str, float] = defaultdict(float)
+    for ranking in rankings:
+        for rank, item_id in enumerate(ranking, start=1):
+            scores[item_id] += 1.0 / (k + rank)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
+
+
+_index: Optional[BM25Index] = None
+_index_lock = threading.Lock()
+
+
+def get_lexical_index() -> BM25Index:
+    """Retorna el índice léxico compartido del proceso (carga perezosa)."""
+    global _index
+    with _index_lock:
+        if _index is None:
+            _index = BM25Index(settings.LEXICAL_INDEX_PATH)
+        return _index
@@ -0,0 +1,118 @@
+"""
+app/rag/manifest.py
+Manifiesto de ingesta: registra por documento el tamaño, mtime y hash del
+archivo, los parámetros de chunking y los ids de chunks escritos en ChromaDB.
+Permite reingestar solo documentos nuevos o modificados.
+"""
+
+import hashlib
+import json
+import logging
+import os
+from pathlib import Path
+from typing import Dict, List, Optional
+from config.settings import settings
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_VERSION = 1
+
+
+def file_sha256(path: Path) -> str:
+    """Calcula el SHA-256 del contenido de un archivo por bloques."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def metadata_hash(metadata: Dict) -> str:
+    """Hash estable de los metadatos de un documento en corpus_metadata.json."""
+    payload = json.dumps(metadata, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def file_fingerprint(path: Path, previous: Optional[Dict] = None) -> Dict:
+    """
+    Retorna tamaño, mtime y SHA-256 del archivo.
+    Si tamaño y mtime coinciden con la entrada previa se reutiliza su hash
+    para no releer el archivo.
+    """
+    stat = path.stat()
+    fingerprint = {"size": stat.st_size, "mtime": stat.st_mtime}
+    if previous and previous.get("size") == fingerprint["size"] and previous.get("mtime") == fingerprint["mtime"]:
+        fingerprint["sha256"] = previous.get("sha256")
+    else:
+        fingerprint["sha256"] = file_sha256(path)
+    return fingerprint
+
+
+class IngestManifest:
+    """Manifiesto persistido como JSON, escrito de forma atómica."""
+
+    def __init__(self, path: Path, collection_name: str):
+        self.path = Path(path)
+        self.collection_name = collection_name
+        self.documents: Dict[str, Dict] = {}
+        self._load()
+
+    def _load(self) -> None:
+        if not self.path.exists():
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get("version") == MANIFEST_VERSION and data.get("collection") == self.collection_name:
+                self.documents = data.get("documents", {})
+            else:
+                logger.info("Manifiesto de ingesta incompatible, se ignora")
+        except Exception as e:
+            logger.warning(f"⚠️ No se pudo leer el manifiesto de ingesta: {e}")
+
+    def save(self) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_suffix(self.path.suffix + ".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(
+                {
+                    "version": MANIFEST_VERSION,
+                    "collection": self.collection_name,
+                    "documents": self.documents
+                },
+                f,
+                ensure_ascii=False,
+                indent=2
+            )
+        os.replace(tmp_path, self.path)
+
+    def get(self, doc_id: str) -> Optional[Dict]:
+        return self.documents.get(doc_id)
+
+    def set(self, doc_id: str, entry: Dict) -> None:
+        self.documents[doc_id] = entry
+
+    def remove(self, doc_id: str) -> Optional[Dict]:
+        return self.documents.pop(doc_id, None)
+
+    def doc_ids(self) -> List[str]:
+        return list(self.documents.keys())
+
+    def reset(self) -> None:
+        self.documents = {}
+
+    @staticmethod
+    def is_unchanged(entry: Optional[Dict], fingerprint: Dict, meta_hash: str, chunking: Dict) -> bool:
+        """Indica si un documento ya está ingerido con el mismo contenido y parámetros."""
+        return bool(
+            entry
+            and entry.get("sha256") == fingerprint["sha256"]
+            and entry.get("metadata_hash") == meta_hash
+            and entry.get("chunking") == chunking
+            and entry.get("chunk_ids")
+        )
+
+
+def load_manifest(collection_name: str) -> IngestManifest:
+    """Carga el manifiesto de ingesta configurado para una colección."""
+    return IngestManifest(settings.INGEST_MANIFEST_PATH, collection_name)
@@ -0,0 +1,392 @@
+"""
+app/rag/metrics.py
+Métricas de la API en formato de texto de Prometheus, sin dependencias externas.
+Contadores, gauges e histogramas con etiquetas: registrar una observación es
+una suma bajo un lock, así que el costo en el camino de /chat es despreciable.
+GET /metrics expone el registro con REGISTRY.render().
+"""
+
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+# Modelos que se reportan con su nombre en las etiquetas (el resto como "other")
+KNOWN_MODELS = ("gemini", "llama3")
+
+# Límites (segundos) de los histogramas de latencia
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric:
+    """Base de las métricas: nombre, ayuda, etiquetas y valores por combinación de etiquetas."""
+
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], object] = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, object]) -> Tuple[str, ...]:
+        if len(labels) != len(self.labelnames):
+            raise ValueError(f"{self.name} espera las etiquetas {self.labelnames}, recibió {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self._samples())
+        return lines
+
+    def _samples(self) -> Iterable[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            yield f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+
+
+class Counter(_Metric):
+    """Valor que solo crece (requests, errores, chunks ingeridos...)."""
+
+    kind = "counter"
+
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels) -> float:
+        with self._lock:
+            return self._values.get(self._key(labels), 0.0)
+
+
+class Gauge(_Metric):
+    """
+    Valor que sube y baja. Con `callback` el valor se calcula al exponer las
+    métricas: callback() retorna [(valores de etiquetas, valor)].
+    """
+
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 callback: Optional[Callable[[], Iterable[Tuple[Sequence[str], float]]]] = None):
+        super().__init__(name, documentation, labelnames)
+        self.callback = callback
+
+    def set(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def dec(self, amount: float = 1.0, **labels) -> None:
+        self.inc(-amount, **labels)
+
+    def _samples(self) -> Iterable[str]:
+        if self.callback is None:
+            yield from super()._samples()
+            return
+        for values, value in self.callback():
+            yield f"{self.name}{_format_labels(self.labelnames, [str(v) for v in values])} {_format_value(value)}"
+
+
+class Histogram(_Metric):
+    """Distribución de valores (latencias) en buckets acumulativos, con suma y conteo."""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            data = self._values.get(key)
+            if data is None:
+                # [conteo por bucket..., conteo > último bucket, suma]
+                data = self._values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            data[index] += 1
+            data[-1] += value
+
+    @contextmanager
+    def time(self, **labels):
+        """Observa la duración (segundos) del bloque."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def _samples(self) -> Iterable[str]:
+        with self._lock:
+            items = sorted((key, list(data)) for key, data in self._values.items())
+        for key, data in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), data[:-1]):
+                cumulative += count
+                le = f'le="{_format_value(bound)}"'
+                yield f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}"
+            labels = _format_labels(self.labelnames, key)
+            yield f"{self.name}_sum{labels} {_format_value(data[-1])}"
+            yield f"{self.name}_count{labels} {cumulative}"
+
+
+class Registry:
+    """Conjunto de métricas expuestas por /metrics."""
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Métrica duplicada: {metric.name}")
+            self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+              callback=None) -> Gauge:
+        return self.register(Gauge(name, documentation, labelnames, callback))
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self) -> str:
+        """Texto de exposición de Prometheus (versión 0.0.4)."""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+# ------------------------------------------------------------------ /chat
+
+STAGE_SECONDS = REGISTRY.histogram(
+    "chatbot_stage_duration_seconds",
+    "Duración de cada etapa del pipeline de chat",
+    ["stage"]
+)
+REQUEST_SECONDS = REGISTRY.histogram(
+    "chatbot_request_duration_seconds",
+    "Duración total de las requests de chat por endpoint",
+    ["endpoint"]
+)
+CHAT_REQUESTS = REGISTRY.counter(
+    "chatbot_chat_requests_total",
+    "Preguntas respondidas por endpoint, modelo, modo y resultado (ok, cached, error)",
+    ["endpoint", "model", "mode", "status"]
+)
+REQUESTS_IN_FLIGHT = REGISTRY.gauge(
+    "chatbot_requests_in_flight",
+    "Requests de chat en curso por endpoint",
+    ["endpoint"]
+)
+CACHE_LOOKUPS = REGISTRY.counter(
+    "chatbot_cache_lookups_total",
+    "Consultas a los caches (embedding, response, semantic) por resultado",
+    ["cache", "result"]
+)
+PROVIDER_REQUESTS = REGISTRY.counter(
+    "chatbot_provider_requests_total",
+    "Llamadas a los proveedores de modelos",
+    ["model", "operation"]
+)
+PROVIDER_ERRORS = REGISTRY.counter(
+    "chatbot_provider_errors_total",
+    "Llamadas a los proveedores de modelos que terminaron en error",
+    ["model", "operation"]
+)
+ROUTING_EVENTS = REGISTRY.counter(
+    "chatbot_routing_events_total",
+    "Decisiones del router de modelos (failover, hedge, hedge_win, timeout)",
+    ["model", "event"]
+)
+
+
+def _cache_hit_ratios():
+    with CACHE_LOOKUPS._lock:
+        values = dict(CACHE_LOOKUPS._values)
+    for cache in sorted({cache for cache, _ in values}):
+        hits = values.get((cache, "hit"), 0.0)
+        total = hits + values.get((cache, "miss"), 0.0)
+        if total:
+            yield (cache,), hits / total
+
+
+CACHE_HIT_RATIO = REGISTRY.gauge(
+    "chatbot_cache_hit_ratio",
+    "Proporción de aciertos de cada cache desde el arranque",
+    ["cache"],
+    callback=_cache_hit_ratios
+)
+
+# ------------------------------------------------------------------ ingesta
+
+INGEST_DOCUMENTS = REGISTRY.counter(
+    "chatbot_ingest_documents_total",
+    "Documentos procesados por la ingesta por resultado (success, failed, skipped)",
+    ["status"]
+)
+INGEST_CHUNKS = REGISTRY.counter("chatbot_ingest_chunks_total", "Chunks ingeridos")
+INGEST_PAGES = REGISTRY.counter("chatbot_ingest_pages_total", "Páginas leídas por la ingesta")
+INGEST_DOCUMENT_SECONDS = REGISTRY.histogram(
+    "chatbot_ingest_document_duration_seconds",
+    "Duración de la ingesta de cada documento",
+    buckets=(0.1, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+)
+INGEST_IN_PROGRESS = REGISTRY.gauge("chatbot_ingest_in_progress", "1 mientras hay una ingesta en curso")
+INGEST_LAST_RUN_SECONDS = REGISTRY.gauge(
+    "chatbot_ingest_last_run_seconds", "Duración de la última ingesta completa"
+)
+INGEST_LAST_RUN_CHUNKS_RATE = REGISTRY.gauge(
+    "chatbot_ingest_last_run_chunks_per_second", "Chunks por segundo en la última ingesta"
+)
+INGEST_LAST_RUN_PAGES_RATE = REGISTRY.gauge(
+    "chatbot_ingest_last_run_pages_per_second", "Páginas por segundo en la última ingesta"
+)
+
+
+# ------------------------------------------------------------------ por request
+
+class RequestTimings:
+    """
+    Desglose por etapa de una request: se expone en el header Server-Timing y
+    en el campo "timings" de /chat. Las etapas se acumulan en ms; las marcas
+    (p.ej. cache="exact") no tienen duración.
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.stages: Dict[str, float] = {}
+        self.marks: Dict[str, str] = {}
+
+    def add(self, name: str, seconds: float) -> None:
+        self.stages[name] = self.stages.get(name, 0.0) + seconds * 1000
+
+    def mark(self, name: str, description: str = "") -> None:
+        self.marks[name] = description
+
+    def total_ms(self) -> float:
+        return (time.perf_counter() - self.started) * 1000
+
+    def as_dict(self) -> Dict:
+        return {
+            "stages_ms": {name: round(ms, 1) for name, ms in self.stages.items()},
+            "total_ms": round(self.total_ms(), 1),
+            **{name: description or True for name, description in self.marks.items()}
+        }
+
+    def server_timing(self) -> str:
+        """Valor del header Server-Timing (https://www.w3.org/TR/server-timing/)."""
+        entries = [f"{name};dur={ms:.1f}" for name, ms in self.stages.items()]
+        entries.extend(
+            f'{name};desc="{description}"' if description else name
+            for name, description in self.marks.items()
+        )
+        entries.append(f"total;dur={self.total_ms():.1f}")
+        return ", ".join(entries)
+
+
+_request_timings: ContextVar[Optional[RequestTimings]] = ContextVar("request_timings", default=None)
+
+
+def start_request_timings() -> RequestTimings:
+    """
+    Empieza el desglose de la request actual. Se propaga con el contexto a las
+    tareas y a asyncio.to_thread, así que las etapas medidas con stage() se suman.
+    """
+    timings = RequestTimings()
+    _request_timings.set(timings)
+    return timings
+
+
+def _record_stage(name: str, seconds: float) -> None:
+    STAGE_SECONDS.observe(seconds, stage=name)
+    timings = _request_timings.get()
+    if timings is not None:
+        timings.add(name, seconds)
+
+
+@contextmanager
+def stage(name: str):
+    """Observa la duración de una etapa del pipeline de chat."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        _record_stage(name, time.perf_counter() - started)
+
+
+@contextmanager
+def track_request(endpoint: str):
+    """Cuenta la request como en curso y observa su duración total."""
+    REQUESTS_IN_FLIGHT.inc(endpoint=endpoint)
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        REQUESTS_IN_FLIGHT.dec(endpoint=endpoint)
+        REQUEST_SECONDS.observe(time.perf_counter() - started, endpoint=endpoint)
+
+
+@contextmanager
+def provider_call(model_id: str, operation: str):
+    """Cuenta la llamada al proveedor (y sus errores) y observa la etapa de generación."""
+    PROVIDER_REQUESTS.inc(model=model_id, operation=operation)
+    started = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        PROVIDER_ERRORS.inc(model=model_id, operation=operation)
+        raise
+    finally:
+        _record_stage("generation", time.perf_counter() - started)
+
+
+def record_cache_lookup(cache: str, hit: bool) -> None:
+    CACHE_LOOKUPS.inc(cache=cache, result="hit" if hit else "miss")
+
+
+def record_chat_request(endpoint: str, model_id: str, response_mode: str, status: str) -> None:
+    # El modelo llega del cliente: limitar los valores de la etiqueta
+    model = model_id if model_id in KNOWN_MODELS else "other"
+    CHAT_REQUESTS.inc(endpoint=endpoint, model=model, mode=response_mode, status=status)
@@ -4,9 +4,17 @@ Sistema de modelos múltiples para el chatbot.
 Soporta Gemini y LLaMA3 (Groq).
 """
 
+import asyncio
 import logging
-from typing import Dict, Optional, List
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+from typing import Dict, Iterator, Optional, List, Tuple
 from config.settings import settings
+from rag.metrics import REGISTRY, provider_call
+from rag.resilience import (
+    OPEN, AdaptiveLimiter, CircuitBreaker, ProviderOverloadedError, is_rate_limited, retry_after
+)
 
 logger = logging.getLogger(__name__)
 
@@ -25,6 +33,29 @@ class ModelProvider:
             response_mode: 'brief' o 'extended' (usado por LLaMA3, ignorado por Gemini)
         """
         raise NotImplementedError
+    
+    async def agenerate_response(self, prompt: str, response_mode: str = "extended") -> str:
+        """
+        Versión asíncrona de generate_response.
+        
+        Por defecto ejecuta la llamada síncrona en el executor para no
+        bloquear el event loop.
+        """
+        return await asyncio.to_thread(self.generate_response, prompt, response_mode)
+    
+    def stream_response(self, prompt: str, response_mode: str = "extended",
+                        usage: Optional[Dict] = None) -> Iterator[str]:
+        """
+        Genera la respuesta por fragmentos a medida que el modelo los produce.
+        
+        Args:
+            prompt: El prompt para generar la respuesta
+            response_mode: 'brief' o 'extended'
+            usage: Dict que se completa con el uso de tokens al terminar (opcional)
+        
+        Por defecto produce la respuesta completa en un solo fragmento.
+        """
+        yield self.generate_response(prompt, response_mode)
 
 class GeminiProvider(ModelProvider):
     """Proveedor para modelos Gemini."""
@@ -53,6 +84,34 @@ class GeminiProvider(ModelProvider):
         except Exception as e:
             logger.error(f"Error generando respuesta con Gemini: {e}")
             raise
+    
+    async def agenerate_response(self, prompt: str, response_mode: str = "extended") -> str:
+        """Genera respuesta usando la API asíncrona de Gemini."""
+        try:
+            response = await self.model.generate_content_async(prompt)
+            return response.text
+        except Exception as e:
+            logger.error(f"Error generando respuesta con Gemini: {e}")
+            raise
+    
+    def stream_response(self, prompt: str, response_mode: str = "extended",
+                        usage: Optional[Dict] = None) -> Iterator[str]:
+        """Genera la respuesta en streaming usando Gemini."""
+        try:
+            response = self.model.generate_content(prompt, stream=True)
+            for chunk in response:
+                if chunk.text:
+                    yield chunk.text
+            metadata = getattr(response, "usage_metadata", None)
+            if usage is not None and metadata is not None:
+                usage.update({
+                    "prompt_tokens": metadata.prompt_token_count,
+                    "completion_tokens": metadata.candidates_token_count,
+                    "total_tokens": metadata.total_token_count
+                })
+        except Exception as e:
+            logger.error(f"Error generando respuesta en streaming con Gemini: {e}")
+            raise
 
 class GroqProvider(ModelProvider):
     """Proveedor para modelos LLaMA3 via Groq."""
@@ -60,8 +119,9 @@ class GroqProvider(ModelProvider):
     def __init__(self, api_key: str):
         super().__init__(api_key)
         try:
-            from groq import Groq
+            from groq import Groq, AsyncGroq
             self.client = Groq(api_key=api_key)
+            self.async_client = AsyncGroq(api_key=api_key)
             logger.info("✅ Groq provider inicializado")
         except Exception as e:
             logger.error(f"❌ Error inicializando Groq: {e}")
@@ -76,34 +136,73 @@ class GroqProvider(ModelProvider):
             response_mode: 'brief' (200 tokens) o 'extended' (800 tokens)
         """
         try:
-            # Configurar tokens según el modo
-            max_tokens = 200 if response_mode == "brief" else 800
-            
-            response = self.client.chat.completions.create(
-                model="llama-3.1-8b-instant",
-                messages=[
-                    {
-                        "role": "system",
-                        "content": "Eres un asistente académico de la Universidad de Caldas especializado en normativas de Inteligencia Artificial. Responde de manera precisa y académica basándote únicamente en el contexto proporcionado."
-                    },
-                    {
-                        "role": "user", 
-                        "content": prompt
-                    }
-                ],
-                temperature=0.1,
-                max_tokens=max_tokens
-            )
+            response = self.client.chat.completions.create(**self._request_params(prompt, response_mode))
             return response.choices[0].message.content
         except Exception as e:
             logger.error(f"Error generando respuesta con Groq: {e}")
             raise
+    
+    async def agenerate_response(self, prompt: str, response_mode: str = "extended") -> str:
+        """Genera respuesta usando el cliente asíncrono de Groq."""
+        try:
+            response = await self.async_client.chat.completions.create(**self._request_params(prompt, response_mode))
+            return response.choices[0].message.content
+        except Exception as e:
+            logger.error(f"Error generando respuesta con Groq: {e}")
+            raise
+    
+    def stream_response(self, prompt: str, response_mode: str = "extended",
+                        usage: Optional[Dict] = None) -> Iterator[str]:
+        """Genera la respuesta en streaming usando LLaMA3 via Groq."""
+        try:
+            stream = self.client.chat.completions.create(
+                **self._request_params(prompt, response_mode),
+                stream=True
+            )
+            for chunk in stream:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+                # Groq reporta el uso de tokens en el último fragmento
+                x_groq = getattr(chunk, "x_groq", None)
+                if usage is not None and x_groq is not None and getattr(x_groq, "usage", None):
+                    usage.update({
+                        "prompt_tokens": x_groq.usage.prompt_tokens,
+                        "completion_tokens": x_groq.usage.completion_tokens,
+                        "total_tokens": x_groq.usage.total_tokens
+                    })
+        except Exception as e:
+            logger.error(f"Error generando respuesta en streaming con Groq: {e}")
+            raise
+    
+    def _request_params(self, prompt: str, response_mode: str) -> Dict:
+        """Parámetros de la llamada a chat.completions según el modo."""
+        # Configurar tokens según el modo
+        max_tokens = 200 if response_mode == "brief" else 800
+        
+        return {
+            "model": "llama-3.1-8b-instant",
+            "messages": [
+                {
+                    "role": "system",
+                    "content": "Eres un asistente académico de la Universidad de Caldas especializado en normativas de Inteligencia Artificial. Responde de manera precisa y académica basándote únicamente en el contexto proporcionado."
+                },
+                {
+                    "role": "user", 
+                    "content": prompt
+                }
+            ],
+            "temperature": 0.1,
+            "max_tokens": max_tokens
+        }
 
 class ModelManager:
     """Gestor de modelos múltiples."""
     
     def __init__(self):
         self.providers: Dict[str, ModelProvider] = {}
+        # Circuit breaker y límite de concurrencia por proveedor (se crean en la primera llamada)
+        self._protection: Dict[str, Tuple[CircuitBreaker, AdaptiveLimiter]] = {}
+        self._protection_lock = threading.Lock()
         self._initialize_providers()
     
     def _initialize_providers(self):
@@ -166,7 +265,141 @@ class ModelManager:
             raise ValueError(f"Modelo '{model_id}' no disponible. Disponibles: {available}")
         
         provider = self.providers[model_id]
-        return provider.generate_response(prompt, response_mode)
+        with self._guarded(model_id, "generate"), provider_call(model_id, "generate"):
+            return provider.generate_response(prompt, response_mode)
+    
+    async def agenerate_response(self, prompt: str, model_id: str = "gemini", response_mode: str = "extended",
+                                 timeout: Optional[float] = None) -> str:
+        """
+        Versión asíncrona de generate_response.
+        
+        Args:
+            timeout: Segundos máximos de la llamada (None = sin límite). Si se
+                excede se lanza asyncio.TimeoutError y cuenta como fallo del proveedor
+        """
+        if model_id not in self.providers:
+            available = list(self.providers.keys())
+            raise ValueError(f"Modelo '{model_id}' no disponible. Disponibles: {available}")
+        
+        provider = self.providers[model_id]
+        async with self._aguarded(model_id, "generate"):
+            with provider_call(model_id, "generate"):
+                # El timeout se aplica dentro del guard para que _record_outcome vea el
+                # TimeoutError (un proveedor colgado es un fallo, no una cancelación)
+                return await asyncio.wait_for(provider.agenerate_response(prompt, response_mode), timeout)
+    
+    def stream_response(self, prompt: str, model_id: str = "gemini", response_mode: str = "extended",
+                        usage: Optional[Dict] = None) -> Iterator[str]:
+        """
+        Genera la respuesta en streaming usando el modelo especificado.
+        
+        Args:
+            prompt: El prompt para generar la respuesta
+            model_id: ID del modelo a usar ('gemini', 'llama3')
+            response_mode: 'brief' o 'extended'
+            usage: Dict que se completa con el uso de tokens (opcional)
+        """
+        if model_id not in self.providers:
+            available = list(self.providers.keys())
+            raise ValueError(f"Modelo '{model_id}' no disponible. Disponibles: {available}")
+        
+        provider = self.providers[model_id]
+        return self._stream(provider, model_id, prompt, response_mode, usage)
+    
+    def _stream(self, provider: ModelProvider, model_id: str, prompt: str, response_mode: str,
+                usage: Optional[Dict]) -> Iterator[str]:
+        with self._guarded(model_id, "stream"), provider_call(model_id, "stream"):
+            yield from provider.stream_response(prompt, response_mode, usage=usage)
+    
+    def protection(self, model_id: str) -> Tuple[CircuitBreaker, AdaptiveLimiter]:
+        """Retorna (circuit breaker, límite de concurrencia) del proveedor."""
+        with self._protection_lock:
+            if model_id not in self._protection:
+                self._protection[model_id] = (
+                    CircuitBreaker(
+                        failure_threshold=settings.CIRCUIT_FAILURE_THRESHOLD,
+                        reset_timeout=settings.CIRCUIT_RESET_TIMEOUT,
+                        half_open_max_calls=settings.CIRCUIT_HALF_OPEN_MAX_CALLS
+                    ),
+                    AdaptiveLimiter(
+                        initial=settings.PROVIDER_CONCURRENCY_INITIAL,
+                        min_limit=settings.PROVIDER_CONCURRENCY_MIN,
+                        max_limit=settings.PROVIDER_CONCURRENCY_MAX,
+                        increase=settings.PROVIDER_CONCURRENCY_INCREASE,
+                        latency_tolerance=settings.PROVIDER_LATENCY_TOLERANCE
+                    )
+                )
+            return self._protection[model_id]
+    
+    @contextmanager
+    def _guarded(self, model_id: str, operation: str):
+        """
+        Aplica el circuit breaker y el límite de concurrencia del proveedor.
+        
+        Raises:
+            CircuitOpenError / ProviderOverloadedError: Sin llamar al proveedor
+        """
+        breaker, limiter = self.protection(model_id)
+        probe = breaker.acquire()
+        try:
+            limiter.acquire(timeout=settings.PROVIDER_QUEUE_TIMEOUT)
+        except ProviderOverloadedError:
+            breaker.release(probe)
+            raise
+        with self._record_outcome(model_id, operation, breaker, limiter, probe):
+            yield
+    
+    @asynccontextmanager
+    async def _aguarded(self, model_id: str, operation: str):
+        """Versión asíncrona de _guarded (la espera por cupo no bloquea el event loop)."""
+        breaker, limiter = self.protection(model_id)
+        probe = breaker.acquire()
+        try:
+            await limiter.aacquire(timeout=settings.PROVIDER_QUEUE_TIMEOUT)
+        except BaseException:
+            breaker.release(probe)
+            raise
+        with self._record_outcome(model_id, operation, breaker, limiter, probe):
+            yield
+    
+    @contextmanager
+    def _record_outcome(self, model_id: str, operation: str, breaker: CircuitBreaker,
+                        limiter: AdaptiveLimiter, probe: bool):
+        """Libera el cupo y registra el resultado de la llamada en el circuito y el límite."""
+        started = time.perf_counter()
+        try:
+            yield
+        except asyncio.TimeoutError:
+            # Excedió el presupuesto de latencia: fallo del proveedor y señal de congestión
+            limiter.release(timed_out=True)
+            breaker.record_failure(probe)
+            if breaker.state == OPEN:
+                logger.warning(f"⚠️ Circuito de {model_id} abierto tras exceder el tiempo límite")
+            raise
+        except Exception as e:
+            throttled = is_rate_limited(e)
+            limiter.release(throttled=throttled)
+            breaker.record_failure(probe, open_for=retry_after(e) if throttled else None)
+            if breaker.state == OPEN:
+                logger.warning(f"⚠️ Circuito de {model_id} abierto tras: {e}")
+            raise
+        except BaseException:
+            # Cancelada (perdió el hedging, cliente desconectado): no cuenta como éxito ni como fallo
+            limiter.release()
+            breaker.release(probe)
+            raise
+        
+        # La duración de un streaming depende del largo de la respuesta: no se usa como muestra
+        limiter.release(latency=time.perf_counter() - started if operation == "generate" else None)
+        breaker.record_success(probe)
+    
+    def get_provider_status(self) -> Dict[str, Dict]:
+        """Estado del circuito y del límite de concurrencia de cada proveedor."""
+        status = {}
+        for model_id in self.providers:
+            breaker, limiter = self.protection(model_id)
+            status[model_id] = {"circuit": breaker.snapshot(), "concurrency": limiter.snapshot()}
+        return status
     
     def get_default_model(self) -> str:
         """Retorna el modelo por defecto."""
@@ -178,5 +411,52 @@ class ModelManager:
         else:
             return list(self.providers.keys())[0]
 
-# Instancia global del gestor de modelos
-model_manager = ModelManager()
+# Instancia global del gestor de modelos. Se crea en el primer uso (o en el
+# hook de arranque de la API) para que importar este módulo no cargue los SDKs
+# de Gemini/Groq ni falle si faltan las API keys.
+_model_manager: Optional[ModelManager] = None
+_model_manager_lock = threading.Lock()
+
+
+def get_model_manager() -> ModelManager:
+    """Retorna el gestor de modelos compartido del proceso (se crea en el primer uso)."""
+    global _model_manager
+    manager = _model_manager
+    if manager is not None:
+        return manager
+
+    with _model_manager_lock:
+        if _model_manager is None:
+            _model_manager = ModelManager()
+        return _model_manager
+
+
+def _provider_status_samples(key: str, field: str):
+    if _model_manager is None:
+        return
+    for model_id, status in _model_manager.get_provider_status().items():
+        yield (model_id,), status[key][field]
+
+
+REGISTRY.gauge(
+    "chatbot_provider_circuit_open",
+    "1 si el circuito del proveedor está abierto (0.5 en half_open)",
+    ["model"],
+    callback=lambda: [
+        (labels, {"closed": 0, "half_open": 0.5, "open": 1}[state])
+        for labels, state in _provider_status_samples("circuit", "state")
+    ]
+)
+REGISTRY.gauge(
+    "chatbot_provider_concurrency_limit",
+    "Límite adaptativo de llamadas simultáneas por proveedor",
+    ["model"],
+    callback=lambda: _provider_status_samples("concurrency", "limit")
+)
+
+
+def __getattr__(name):
+    # Compatibilidad con `from rag.models import model_manager`
+    if name == "model_manager":
+        return get_model_manager()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
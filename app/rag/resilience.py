@@ -0,0 +1,265 @@
+"""
+app/rag/resilience.py
+Protección de las llamadas a los proveedores de modelos:
+    - CircuitBreaker: tras varios fallos seguidos (o un 429 con Retry-After)
+      deja de llamar al proveedor durante un tiempo y luego lo prueba con
+      pocas llamadas (closed → open → half_open → closed)
+    - AdaptiveLimiter: límite de llamadas simultáneas que se ajusta con AIMD
+      (sube de a poco con respuestas rápidas, baja a la mitad con un 429 y
+      un poco si la latencia se dispara respecto a la habitual)
+
+El circuito abierto rechaza de inmediato y el límite de concurrencia solo
+espera un tiempo acotado: la request falla rápido (o el router pasa al otro
+modelo) en lugar de ocupar un hilo esperando a un proveedor que no responde.
+"""
+
+import asyncio
+import threading
+import time
+from typing import Dict, Optional
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(RuntimeError):
+    """El circuito del proveedor está abierto: no se realiza la llamada."""
+
+
+class ProviderOverloadedError(RuntimeError):
+    """El proveedor alcanzó su límite de llamadas simultáneas."""
+
+
+def is_rate_limited(error: BaseException) -> bool:
+    """True si el error del SDK corresponde a un 429 (Groq RateLimitError, Gemini ResourceExhausted)."""
+    if getattr(error, "status_code", None) == 429 or getattr(error, "code", None) == 429:
+        return True
+    return type(error).__name__ in ("RateLimitError", "ResourceExhausted", "TooManyRequests")
+
+
+def retry_after(error: BaseException) -> Optional[float]:
+    """Segundos indicados por el header Retry-After de la respuesta del error (si existe)."""
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+class CircuitBreaker:
+    """
+    Circuito por proveedor.
+
+    Args:
+        failure_threshold: Fallos consecutivos que abren el circuito
+        reset_timeout: Segundos abierto antes de pasar a half_open
+        half_open_max_calls: Llamadas de prueba simultáneas en half_open
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0, half_open_max_calls: int = 1):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.half_open_max_calls = half_open_max_calls
+        self._state = CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._open_for = reset_timeout
+        self._probes = 0
+        self._lock = threading.Lock()
+        self.rejected = 0
+        self.times_opened = 0
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._current_state()
+
+    def _current_state(self) -> str:
+        if self._state == OPEN and time.monotonic() - self._opened_at >= self._open_for:
+            self._state = HALF_OPEN
+            self._probes = 0
+        return self._state
+
+    def acquire(self) -> bool:
+        """
+        Reserva una llamada. Retorna True si es una llamada de prueba
+        (half_open), que debe liberarse con release(probe=True).
+
+        Raises:
+            CircuitOpenError: Si el circuito está abierto o ya hay pruebas en curso
+        """
+        with self._lock:
+            state = self._current_state()
+            if state == CLOSED:
+                return False
+            if state == HALF_OPEN and self._probes < self.half_open_max_calls:
+                self._probes += 1
+                return True
+            self.rejected += 1
+            remaining = max(0.0, self._open_for - (time.monotonic() - self._opened_at))
+        raise CircuitOpenError(f"Circuito abierto; se reintentará en {remaining:.0f} s")
+
+    def release(self, probe: bool) -> None:
+        """Libera la reserva de una llamada que no terminó (p.ej. cancelada)."""
+        if probe:
+            with self._lock:
+                self._probes = max(0, self._probes - 1)
+
+    def record_success(self, probe: bool = False) -> None:
+        with self._lock:
+            if probe:
+                self._probes = max(0, self._probes - 1)
+            self._failures = 0
+            self._state = CLOSED
+
+    def record_failure(self, probe: bool = False, open_for: Optional[float] = None) -> None:
+        """Registra un fallo; `open_for` abre el circuito de inmediato por esos segundos."""
+        with self._lock:
+            if probe:
+                self._probes = max(0, self._probes - 1)
+            self._failures += 1
+            if probe or open_for is not None or self._failures >= self.failure_threshold:
+                self._open(open_for if open_for is not None else self.reset_timeout)
+
+    def _open(self, seconds: float) -> None:
+        if self._state != OPEN:
+            self.times_opened += 1
+        self._state = OPEN
+        self._opened_at = time.monotonic()
+        self._open_for = seconds
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            state = self._current_state()
+            retry_in = None
+            if state == OPEN:
+                retry_in = round(max(0.0, self._open_for - (time.monotonic() - self._opened_at)), 1)
+            return {
+                "state": state,
+                "consecutive_failures": self._failures,
+                "retry_in_s": retry_in,
+                "times_opened": self.times_opened,
+                "rejected": self.rejected
+            }
+
+
+class AdaptiveLimiter:
+    """
+    Límite adaptativo de llamadas simultáneas (AIMD).
+
+    - Respuesta exitosa con el límite en uso: límite += increase / límite
+      (≈ +increase por cada "ronda" de llamadas)
+    - 429 del proveedor: límite *= backoff
+    - Latencia mayor a `latency_tolerance` veces la habitual (EWMA) o llamada
+      que excedió su tiempo límite: límite *= 0.9
+
+    Args:
+        initial: Límite inicial
+        min_limit: Límite mínimo (nunca se deja de llamar al proveedor)
+        max_limit: Límite máximo
+        increase: Aumento del límite por cada ronda de respuestas exitosas
+        backoff: Factor de reducción ante un 429
+        latency_tolerance: Múltiplo de la latencia habitual que se considera congestión
+    """
+
+    def __init__(self, initial: float = 8, min_limit: float = 1, max_limit: float = 64,
+                 increase: float = 1, backoff: float = 0.5, latency_tolerance: float = 2.0):
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.limit = float(min(max(initial, min_limit), max_limit))
+        self.increase = increase
+        self.backoff = backoff
+        self.latency_tolerance = latency_tolerance
+        self.in_flight = 0
+        self.rejected = 0
+        self.throttled = 0
+        self.timeouts = 0
+        self._latency_ewma: Optional[float] = None
+        self._lock = threading.Lock()
+        self._released = threading.Condition(self._lock)
+
+    def _try_acquire(self) -> bool:
+        if self.in_flight >= int(self.limit):
+            return False
+        self.in_flight += 1
+        return True
+
+    def _reject(self) -> ProviderOverloadedError:
+        self.rejected += 1
+        return ProviderOverloadedError(
+            f"Límite de concurrencia alcanzado ({self.in_flight}/{int(self.limit)} llamadas en curso)"
+        )
+
+    def acquire(self, timeout: float = 0) -> None:
+        """
+        Reserva un lugar para una llamada, esperando hasta `timeout` segundos.
+
+        Raises:
+            ProviderOverloadedError: Si sigue habiendo `limit` llamadas en curso
+        """
+        deadline = time.monotonic() + timeout
+        with self._lock:
+            while not self._try_acquire():
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise self._reject()
+                self._released.wait(remaining)
+
+    async def aacquire(self, timeout: float = 0, poll_interval: float = 0.02) -> None:
+        """Versión asíncrona de acquire (espera sin bloquear el event loop)."""
+        deadline = time.monotonic() + timeout
+        while True:
+            with self._lock:
+                if self._try_acquire():
+                    return
+                if time.monotonic() >= deadline:
+                    raise self._reject()
+            await asyncio.sleep(poll_interval)
+
+    def release(self, latency: Optional[float] = None, throttled: bool = False, timed_out: bool = False) -> None:
+        """
+        Libera el lugar y ajusta el límite.
+
+        Args:
+            latency: Duración de la llamada (None = no aporta muestra)
+            throttled: True si el proveedor respondió 429
+            timed_out: True si la llamada se cortó por exceder su tiempo límite
+        """
+        with self._lock:
+            saturated = self.in_flight >= int(self.limit)
+            self.in_flight = max(0, self.in_flight - 1)
+            self._released.notify()
+            if throttled:
+                self.throttled += 1
+                self.limit = max(self.min_limit, self.limit * self.backoff)
+                return
+            if timed_out:
+                # La duración de una llamada cortada no es su latencia real: no entra en la EWMA
+                self.timeouts += 1
+                self.limit = max(self.min_limit, self.limit * 0.9)
+                return
+            if latency is None:
+                return
+
+            ewma = self._latency_ewma
+            if ewma is not None and latency > ewma * self.latency_tolerance:
+                self.limit = max(self.min_limit, self.limit * 0.9)
+            elif saturated or self.in_flight + 1 >= self.limit / 2:
+                # Solo crecer si el límite se está usando
+                self.limit = min(self.max_limit, self.limit + self.increase / self.limit)
+            self._latency_ewma = latency if ewma is None else 0.9 * ewma + 0.1 * latency
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            return {
+                "limit": round(self.limit, 2),
+                "in_flight": self.in_flight,
+                "latency_ewma_ms": round(self._latency_ewma * 1000, 1) if self._latency_ewma is not None else None,
+                "rejected": self.rejected,
+                "throttled": self.throttled,
+                "timeouts": self.timeouts
+            }
@@ -0,0 +1,159 @@
+"""
+app/rag/response_cache.py
+Cache exacto de respuestas de /chat con dos niveles: memoria (LRU con TTL) y
+disco (SQLite). La clave incluye la pregunta normalizada, top_k, modelo, modo
+y la versión del corpus, así una reingesta invalida las respuestas previas.
+"""
+
+import hashlib
+import json
+import logging
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, Optional
+from config.settings import settings
+from rag.cache import TTLLRUCache, normalize_text
+
+logger = logging.getLogger(__name__)
+
+
+def response_key(question: str, top_k: int, model_id: str, response_mode: str, corpus_version: str) -> str:
+    """Clave del cache: SHA-256 de la pregunta normalizada y los parámetros de la consulta."""
+    payload = json.dumps(
+        [normalize_text(question), top_k, model_id, response_mode, corpus_version],
+        ensure_ascii=False
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """
+    Cache de respuestas en memoria con respaldo opcional en SQLite.
+
+    Args:
+        max_size: Entradas en memoria
+        ttl_seconds: Tiempo de vida de cada respuesta; 0 o None = sin expiración
+        path: Archivo SQLite del nivel en disco (None = solo memoria)
+        disk_max_entries: Límite de entradas en disco (se expulsan las menos usadas)
+    """
+
+    def __init__(self, max_size: int = 512, ttl_seconds: Optional[float] = None,
+                 path: Optional[Path] = None, disk_max_entries: int = 10000):
+        self.memory = TTLLRUCache(max_size=max_size, ttl_seconds=ttl_seconds)
+        self.ttl_seconds = ttl_seconds or None
+        self.disk_max_entries = disk_max_entries
+        self.disk_hits = 0
+        self._lock = threading.Lock()
+        self._conn = None
+        if path:
+            self.path = Path(path)
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS responses (
+                    key TEXT PRIMARY KEY,
+                    corpus_version TEXT NOT NULL,
+                    value TEXT NOT NULL,
+                    created REAL NOT NULL,
+                    last_used REAL NOT NULL
+                )
+                """
+            )
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_responses_last_used ON responses(last_used)"
+            )
+            self._conn.commit()
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Retorna la respuesta cacheada (memoria primero, luego disco) o None."""
+        value = self.memory.get(key)
+        if value is not None or self._conn is None:
+            return value
+
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, created FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            if self.ttl_seconds and row[1] + self.ttl_seconds < now:
+                self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self._conn.commit()
+                return None
+            self._conn.execute("UPDATE responses SET last_used = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+
+        value = json.loads(row[0])
+        self.disk_hits += 1
+        self.memory.set(key, value)
+        return value
+
+    def set(self, key: str, value: Dict[str, Any], corpus_version: str) -> None:
+        """Guarda una respuesta en ambos niveles."""
+        self.memory.set(key, value)
+        if self._conn is None:
+            return
+
+        now = time.time()
+        with self._lock:
+            # Respuestas de versiones anteriores del corpus ya no se pueden servir
+            self._conn.execute("DELETE FROM responses WHERE corpus_version != ?", (corpus_version,))
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, corpus_version, value, created, last_used) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (key, corpus_version, json.dumps(value, ensure_ascii=False), now, now)
+            )
+            self._evict()
+            self._conn.commit()
+
+    def _evict(self) -> None:
+        """Expulsa las entradas menos usadas si se supera disk_max_entries."""
+        if self.disk_max_entries <= 0:
+            return
+        count = self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+        excess = count - self.disk_max_entries
+        if excess > 0:
+            self._conn.execute(
+                """
+                DELETE FROM responses WHERE key IN (
+                    SELECT key FROM responses ORDER BY last_used ASC LIMIT ?
+                )
+                """,
+                (excess,)
+            )
+
+    def stats(self) -> Dict[str, Any]:
+        """Retorna estadísticas de ambos niveles."""
+        stats = {"memory": self.memory.stats(), "disk": None}
+        if self._conn is not None:
+            with self._lock:
+                count = self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+            stats["disk"] = {
+                "entries": count,
+                "max_entries": self.disk_max_entries,
+                "hits": self.disk_hits
+            }
+        return stats
+
+
+_cache: Optional[ResponseCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_response_cache() -> ResponseCache:
+    """Retorna el cache de respuestas compartido del proceso."""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = ResponseCache(
+                max_size=settings.RESPONSE_CACHE_SIZE,
+                ttl_seconds=settings.RESPONSE_CACHE_TTL,
+                path=settings.RESPONSE_CACHE_PATH or None,
+                disk_max_entries=settings.RESPONSE_CACHE_DISK_MAX_ENTRIES
+            )
+        return _cache
@@ -0,0 +1,348 @@
+"""
+app/rag/retrieval.py
+Punto único de recuperación de contexto para el chat.
+El backend se elige con RETRIEVAL_BACKEND:
+    - "chroma": consulta HTTP a la colección de ChromaDB (por defecto)
+    - "numpy":  índice vectorial en proceso (rag.vector_index)
+
+Con HYBRID_SEARCH los resultados vectoriales se fusionan (RRF) con los del
+índice léxico BM25 (rag.lexical_index). Si el embedding de la consulta supera
+EMBEDDING_LATENCY_BUDGET_MS se responde solo con el índice léxico.
+"""
+
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from typing import Dict, List, Optional, Sequence
+from config.settings import settings
+from rag.metrics import stage
+
+logger = logging.getLogger(__name__)
+
+COLLECTION_NAME = "documentos_ucaldas"
+
+# Hilos para el embedding de consultas con presupuesto de latencia. Una llamada
+# que excede el presupuesto sigue en segundo plano y deja el resultado en cache.
+_embed_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="query-embed")
+
+
+def _embed_query(question: str, budget_ms: Optional[float]) -> Optional[List[float]]:
+    """Embedding de la consulta; None si excede el presupuesto de latencia."""
+    from rag.embeddings import embedding_function
+
+    with stage("embedding"):
+        if not budget_ms or budget_ms <= 0:
+            return embedding_function([question])[0]
+        future = _embed_executor.submit(embedding_function, [question])
+        try:
+            return future.result(timeout=budget_ms / 1000)[0]
+        except FutureTimeoutError:
+            logger.warning(f"⚠️ Embedding de la consulta excedió {budget_ms:.0f} ms; usando índice léxico")
+            return None
+
+
+def _lexical_index():
+    """Índice léxico BM25 si está habilitado y tiene contenido."""
+    if not settings.LEXICAL_INDEX_ENABLED:
+        return None
+    from rag.lexical_index import get_lexical_index
+
+    lexical = get_lexical_index()
+    if not lexical.ensure_loaded() or len(lexical) == 0:
+        return None
+    return lexical
+
+
+def embed_query(question: str) -> Optional[List[float]]:
+    """
+    Embedding de la pregunta. Si hay índice léxico de respaldo se aplica
+    EMBEDDING_LATENCY_BUDGET_MS y retorna None cuando se excede.
+    """
+    budget_ms = settings.EMBEDDING_LATENCY_BUDGET_MS if _lexical_index() is not None else None
+    return _embed_query(question, budget_ms)
+
+
+def _numpy_index():
+    """Índice vectorial en proceso si es el backend activo y es compatible."""
+    if settings.RETRIEVAL_BACKEND != "numpy":
+        return None
+    from rag.embeddings import embedding_function
+    from rag.vector_index import get_vector_index
+
+    index = get_vector_index()
+    if not index.ensure_loaded():
+        logger.warning("⚠️ Índice vectorial no disponible, usando ChromaDB")
+        return None
+    if index.info.get("model") != embedding_function.model_name:
+        logger.warning(
+            f"⚠️ El índice vectorial usa '{index.info.get('model')}' y el modelo "
+            f"actual es '{embedding_function.model_name}'; usando ChromaDB"
+        )
+        return None
+    return index
+
+
+def _vector_query(query_embedding: Sequence[float], n_results: int, collection_name: str) -> Dict:
+    index = _numpy_index()
+    if index is not None:
+        with stage("vector_query"):
+            return index.query([query_embedding], n_results=n_results)
+
+    from rag.chroma_manager import get_or_create_collection
+
+    with stage("client"):
+        collection = get_or_create_collection(collection_name)
+    with stage("vector_query"):
+        return collection.query(
+            query_embeddings=[query_embedding],
+            n_results=n_results
+        )
+
+
+def _fetch_chunks(ids: List[str], collection_name: str) -> Dict[str, tuple]:
+    """Documento y metadatos de cada id: {id: (document, metadata)}."""
+    if not ids:
+        return {}
+    index = _numpy_index()
+    if index is not None:
+        with stage("fetch_chunks"):
+            found = index.get(ids)
+    else:
+        from rag.chroma_manager import get_or_create_collection
+
+        with stage("client"):
+            collection = get_or_create_collection(collection_name)
+        with stage("fetch_chunks"):
+            found = collection.get(ids=list(ids), include=["documents", "metadatas"])
+    return _chunks_by_id(found)
+
+
+def _chunks_by_id(found: Dict) -> Dict[str, tuple]:
+    return {
+        chunk_id: (document, metadata)
+        for chunk_id, document, metadata in zip(found["ids"], found["documents"], found["metadatas"])
+    }
+
+
+def _build_results(ranked_ids: List[str], chunks: Dict[str, tuple], distances: Dict[str, float]) -> Dict:
+    """Arma un resultado con el formato de collection.query para una consulta."""
+    ranked_ids = [chunk_id for chunk_id in ranked_ids if chunk_id in chunks]
+    return {
+        "ids": [ranked_ids],
+        "documents": [[chunks[chunk_id][0] for chunk_id in ranked_ids]],
+        "metadatas": [[chunks[chunk_id][1] for chunk_id in ranked_ids]],
+        "distances": [[distances.get(chunk_id) for chunk_id in ranked_ids]]
+    }
+
+
+def _fuse(question: str, top_k: int, vector_results: Dict, lexical) -> tuple:
+    """
+    Fusiona (RRF) los candidatos vectoriales con los del índice léxico.
+
+    Returns:
+        (ids ordenados, chunks ya conocidos, distancias vectoriales, ids faltantes)
+    """
+    from rag.lexical_index import reciprocal_rank_fusion
+
+    vector_ids = vector_results["ids"][0]
+    with stage("lexical_query"):
+        lexical_ids = [chunk_id for chunk_id, _ in lexical.search(question, max(top_k, settings.HYBRID_CANDIDATES))]
+
+    fused = reciprocal_rank_fusion([vector_ids, lexical_ids], k=settings.RRF_K)
+    ranked_ids = [chunk_id for chunk_id, _ in fused[:top_k]]
+
+    chunks = {
+        chunk_id: (document, metadata)
+        for chunk_id, document, metadata in zip(
+            vector_ids, vector_results["documents"][0], vector_results["metadatas"][0]
+        )
+    }
+    missing = [chunk_id for chunk_id in ranked_ids if chunk_id not in chunks]
+    distances = dict(zip(vector_ids, (vector_results.get("distances") or [[]])[0] or []))
+    return ranked_ids, chunks, distances, missing
+
+
+def retrieve(question: str, top_k: int = 3, collection_name: str = COLLECTION_NAME,
+             query_embedding: Optional[Sequence[float]] = None, embedded: bool = False) -> Dict:
+    """
+    Recupera los chunks más relevantes para la pregunta.
+
+    Args:
+        question: Pregunta del usuario
+        top_k: Número de chunks a retornar
+        collection_name: Colección de ChromaDB
+        query_embedding: Embedding ya calculado con embed_query
+        embedded: True si se pasa el resultado de embed_query (None = se
+                  excedió el presupuesto de latencia y se usa el índice léxico)
+
+    Returns:
+        Dict con el formato de collection.query de ChromaDB
+        (ids, documents, metadatas, distances; una lista por consulta).
+        Los chunks que solo aporta el índice léxico no tienen distancia (None).
+    """
+    lexical = _lexical_index()
+    if not embedded or (query_embedding is None and lexical is None):
+        # Sin índice léxico no hay respaldo: esperar el embedding sin límite
+        budget_ms = settings.EMBEDDING_LATENCY_BUDGET_MS if lexical is not None else None
+        query_embedding = _embed_query(question, budget_ms)
+
+    if query_embedding is None:
+        with stage("lexical_query"):
+            hits = lexical.search(question, top_k)
+        ranked_ids = [chunk_id for chunk_id, _ in hits]
+        return _build_results(ranked_ids, _fetch_chunks(ranked_ids, collection_name), {})
+
+    if lexical is None or not settings.HYBRID_SEARCH:
+        return _vector_query(query_embedding, top_k, collection_name)
+
+    # Búsqueda híbrida: candidatos de ambos índices fusionados con RRF
+    n_candidates = max(top_k, settings.HYBRID_CANDIDATES)
+    vector_results = _vector_query(query_embedding, n_candidates, collection_name)
+    ranked_ids, chunks, distances, missing = _fuse(question, top_k, vector_results, lexical)
+    chunks.update(_fetch_chunks(missing, collection_name))
+    return _build_results(ranked_ids, chunks, distances)
+
+
+# ---------------------------------------------------------------- camino async
+
+async def aembed_query(question: str) -> Optional[List[float]]:
+    """Versión asíncrona de embed_query (la llamada al SDK corre en un hilo)."""
+    lexical = await asyncio.to_thread(_lexical_index)
+    budget_ms = settings.EMBEDDING_LATENCY_BUDGET_MS if lexical is not None else None
+    return await _aembed_query(question, budget_ms)
+
+
+async def _aembed_query(question: str, budget_ms: Optional[float]) -> Optional[List[float]]:
+    from rag.embeddings import embedding_function
+
+    call = asyncio.to_thread(embedding_function, [question])
+    with stage("embedding"):
+        if not budget_ms or budget_ms <= 0:
+            return (await call)[0]
+        try:
+            # Si se excede el presupuesto el hilo termina en segundo plano y llena el cache
+            return (await asyncio.wait_for(call, timeout=budget_ms / 1000))[0]
+        except asyncio.TimeoutError:
+            logger.warning(f"⚠️ Embedding de la consulta excedió {budget_ms:.0f} ms; usando índice léxico")
+            return None
+
+
+async def _avector_query(query_embedding: Sequence[float], n_results: int, collection_name: str) -> Dict:
+    return await _avector_query_many([query_embedding], n_results, collection_name)
+
+
+async def _avector_query_many(query_embeddings: List[Sequence[float]], n_results: int,
+                              collection_name: str) -> Dict:
+    """Consulta vectorial de varias preguntas en una sola llamada."""
+    # Cargar o recargar el snapshot del índice lee disco: no en el event loop
+    index = await asyncio.to_thread(_numpy_index)
+    if index is not None:
+        with stage("vector_query"):
+            return await asyncio.to_thread(index.query, query_embeddings, n_results)
+
+    from rag.chroma_manager import aget_or_create_collection
+
+    with stage("client"):
+        collection = await aget_or_create_collection(collection_name)
+    with stage("vector_query"):
+        return await collection.query(
+            query_embeddings=list(query_embeddings),
+            n_results=n_results
+        )
+
+
+async def _afetch_chunks(ids: List[str], collection_name: str) -> Dict[str, tuple]:
+    if not ids:
+        return {}
+    index = await asyncio.to_thread(_numpy_index)
+    if index is not None:
+        with stage("fetch_chunks"):
+            return _chunks_by_id(index.get(ids))
+
+    from rag.chroma_manager import aget_or_create_collection
+
+    with stage("client"):
+        collection = await aget_or_create_collection(collection_name)
+    with stage("fetch_chunks"):
+        return _chunks_by_id(await collection.get(ids=list(ids), include=["documents", "metadatas"]))
+
+
+async def aretrieve(question: str, top_k: int = 3, collection_name: str = COLLECTION_NAME,
+                    query_embedding: Optional[Sequence[float]] = None, embedded: bool = False) -> Dict:
+    """
+    Versión asíncrona de retrieve: ChromaDB se consulta con AsyncHttpClient y
+    el trabajo bloqueante (embedding, carga de los índices, búsqueda BM25,
+    índice NumPy) corre en el executor.
+    """
+    lexical = await asyncio.to_thread(_lexical_index)
+    if not embedded or (query_embedding is None and lexical is None):
+        budget_ms = settings.EMBEDDING_LATENCY_BUDGET_MS if lexical is not None else None
+        query_embedding = await _aembed_query(question, budget_ms)
+
+    if query_embedding is None:
+        with stage("lexical_query"):
+            hits = await asyncio.to_thread(lexical.search, question, top_k)
+        ranked_ids = [chunk_id for chunk_id, _ in hits]
+        return _build_results(ranked_ids, await _afetch_chunks(ranked_ids, collection_name), {})
+
+    if lexical is None or not settings.HYBRID_SEARCH:
+        return await _avector_query(query_embedding, top_k, collection_name)
+
+    n_candidates = max(top_k, settings.HYBRID_CANDIDATES)
+    vector_results = await _avector_query(query_embedding, n_candidates, collection_name)
+    ranked_ids, chunks, distances, missing = await asyncio.to_thread(_fuse, question, top_k, vector_results, lexical)
+    chunks.update(await _afetch_chunks(missing, collection_name))
+    return _build_results(ranked_ids, chunks, distances)
+
+
+async def aretrieve_many(questions: List[str], query_embeddings: List[Sequence[float]], top_k: int = 3,
+                         collection_name: str = COLLECTION_NAME) -> List[Dict]:
+    """
+    Recupera contexto para varias preguntas con una sola consulta vectorial
+    (multi-query) y, si aplica, una sola lectura de los chunks faltantes.
+
+    Returns:
+        Un resultado por pregunta, con el mismo formato que retrieve
+    """
+    if not questions:
+        return []
+    lexical = await asyncio.to_thread(_lexical_index)
+    hybrid = lexical is not None and settings.HYBRID_SEARCH
+    n_results = max(top_k, settings.HYBRID_CANDIDATES) if hybrid else top_k
+
+    vector_results = await _avector_query_many(query_embeddings, n_results, collection_name)
+    per_question = [
+        {
+            key: [vector_results[key][i]] if vector_results.get(key) else None
+            for key in ("ids", "documents", "metadatas", "distances")
+        }
+        for i in range(len(questions))
+    ]
+    if not hybrid:
+        return per_question
+
+    fused = await asyncio.to_thread(
+        lambda: [_fuse(question, top_k, results, lexical) for question, results in zip(questions, per_question)]
+    )
+    missing = sorted({chunk_id for _, _, _, ids in fused for chunk_id in ids})
+    fetched = await _afetch_chunks(missing, collection_name)
+    results = []
+    for ranked_ids, chunks, distances, _ in fused:
+        chunks.update(fetched)
+        results.append(_build_results(ranked_ids, chunks, distances))
+    return results
+
+
+def export_vector_index(collection_name: str = COLLECTION_NAME) -> Dict:
+    """Exporta la colección de ChromaDB a un snapshot del índice NumPy."""
+    from rag.chroma_manager import get_or_create_collection
+    from rag.embeddings import embedding_function
+    from rag.vector_index import export_from_chroma
+
+    collection = get_or_create_collection(collection_name)
+    return export_from_chroma(
+        collection,
+        settings.VECTOR_INDEX_DIR,
+        model_name=embedding_function.model_name,
+        dtype=settings.VECTOR_INDEX_DTYPE
+    )
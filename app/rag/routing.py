@@ -0,0 +1,261 @@
+"""
+app/rag/routing.py
+Política de enrutamiento entre proveedores de modelos para /chat:
+    - Presupuesto de latencia por modelo (MODEL_LATENCY_BUDGETS_MS)
+    - Failover: si el modelo pedido falla o excede su presupuesto se intenta
+      con el siguiente disponible
+    - Hedging (opcional): si el modelo pedido no respondió tras su p95 de
+      latencia reciente se lanza un segundo proveedor y gana el primero que responda
+
+Los prompts dependen del modelo, así que el llamador pasa prompt_for(model_id)
+y el prompt se reconstruye para cada candidato.
+"""
+
+import asyncio
+import logging
+import threading
+import time
+from collections import deque
+from typing import Callable, Deque, Dict, Iterator, List, Optional, Tuple
+from config.settings import settings
+from rag.metrics import ROUTING_EVENTS
+
+logger = logging.getLogger(__name__)
+
+PromptBuilder = Callable[[str], str]
+
+
+class LatencyTracker:
+    """Latencias recientes (segundos) de las respuestas exitosas de un modelo."""
+
+    def __init__(self, window: int = 200):
+        self._samples: Deque[float] = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def observe(self, seconds: float) -> None:
+        with self._lock:
+            self._samples.append(seconds)
+
+    def quantile(self, q: float) -> Optional[float]:
+        with self._lock:
+            samples = sorted(self._samples)
+        if not samples:
+            return None
+        return samples[min(len(samples) - 1, int(q * len(samples)))]
+
+    def __len__(self) -> int:
+        return len(self._samples)
+
+
+class ModelRouter:
+    """
+    Envuelve al ModelManager con presupuestos de latencia, failover y hedging.
+
+    Args:
+        manager: ModelManager con los proveedores disponibles
+        budgets_ms: Presupuesto de latencia por modelo (ms); 0 o ausente = sin límite
+        failover: Intentar con otro proveedor si el pedido falla o excede el presupuesto
+        hedging: Lanzar un segundo proveedor tras el p95 del primero
+        hedge_quantile: Cuantil de latencia que dispara el hedging
+        hedge_min_delay_ms: Espera mínima antes del hedging
+        hedge_min_samples: Muestras necesarias antes de empezar a hacer hedging
+    """
+
+    def __init__(self, manager, budgets_ms: Optional[Dict[str, float]] = None, failover: bool = True,
+                 hedging: bool = False, hedge_quantile: float = 0.95, hedge_min_delay_ms: float = 500,
+                 hedge_min_samples: int = 20):
+        self.manager = manager
+        self.budgets_ms = budgets_ms or {}
+        self.failover = failover
+        self.hedging = hedging
+        self.hedge_quantile = hedge_quantile
+        self.hedge_min_delay_ms = hedge_min_delay_ms
+        self.hedge_min_samples = hedge_min_samples
+        self._latency: Dict[str, LatencyTracker] = {}
+        self._latency_lock = threading.Lock()
+
+    # ------------------------------------------------------------ política
+
+    def latency(self, model_id: str) -> LatencyTracker:
+        with self._latency_lock:
+            tracker = self._latency.get(model_id)
+            if tracker is None:
+                tracker = self._latency[model_id] = LatencyTracker()
+            return tracker
+
+    def candidates(self, model_id: str) -> List[str]:
+        """Modelo pedido primero y, con failover, el resto de los disponibles."""
+        if model_id not in self.manager.providers:
+            available = list(self.manager.providers.keys())
+            raise ValueError(f"Modelo '{model_id}' no disponible. Disponibles: {available}")
+        if not self.failover:
+            return [model_id]
+        return [model_id] + [other for other in self.manager.providers if other != model_id]
+
+    def budget_seconds(self, model_id: str) -> Optional[float]:
+        budget_ms = self.budgets_ms.get(model_id, 0)
+        return budget_ms / 1000 if budget_ms and budget_ms > 0 else None
+
+    def hedge_delay(self, model_id: str) -> Optional[float]:
+        """Segundos de espera antes del hedging (None = no hacer hedging todavía)."""
+        tracker = self.latency(model_id)
+        if not self.hedging or len(tracker) < self.hedge_min_samples:
+            return None
+        delay = max(tracker.quantile(self.hedge_quantile), self.hedge_min_delay_ms / 1000)
+        budget = self.budget_seconds(model_id)
+        if budget is not None and delay >= budget:
+            return None
+        return delay
+
+    def stats(self) -> Dict[str, Dict]:
+        """Latencias observadas por modelo (p50/p95 en ms) y configuración."""
+        models = {}
+        for model_id in self.manager.providers:
+            tracker = self.latency(model_id)
+            p50, p95 = tracker.quantile(0.5), tracker.quantile(0.95)
+            models[model_id] = {
+                "samples": len(tracker),
+                "p50_ms": round(p50 * 1000, 1) if p50 is not None else None,
+                "p95_ms": round(p95 * 1000, 1) if p95 is not None else None,
+                "budget_ms": self.budgets_ms.get(model_id) or None
+            }
+        return {"failover": self.failover, "hedging": self.hedging, "models": models}
+
+    # ------------------------------------------------------------ async
+
+    async def _attempt(self, model_id: str, prompt: str, response_mode: str) -> str:
+        started = time.perf_counter()
+        budget = self.budget_seconds(model_id)
+        try:
+            # El ModelManager aplica el presupuesto y registra el timeout en el circuit breaker
+            answer = await self.manager.agenerate_response(prompt, model_id, response_mode, timeout=budget)
+        except asyncio.TimeoutError:
+            ROUTING_EVENTS.inc(model=model_id, event="timeout")
+            if budget is None:
+                raise
+            raise TimeoutError(f"{model_id} excedió su presupuesto de {budget * 1000:.0f} ms")
+        self.latency(model_id).observe(time.perf_counter() - started)
+        return answer
+
+    async def agenerate(self, model_id: str, prompt_for: PromptBuilder,
+                        response_mode: str = "extended") -> Tuple[str, Dict]:
+        """
+        Genera la respuesta aplicando la política de enrutamiento.
+
+        Returns:
+            (respuesta, info) donde info = {"model_used", "requested_model",
+            "hedged", "failed": [{"model", "error"}]}
+        """
+        candidates = self.candidates(model_id)
+        info = {"model_used": None, "requested_model": model_id, "hedged": False, "failed": []}
+        pending: Dict[asyncio.Task, str] = {}
+        next_candidate = 0
+
+        def launch() -> None:
+            nonlocal next_candidate
+            candidate = candidates[next_candidate]
+            next_candidate += 1
+            task = asyncio.ensure_future(self._attempt(candidate, prompt_for(candidate), response_mode))
+            pending[task] = candidate
+
+        launch()
+        hedge_delay = self.hedge_delay(model_id) if len(candidates) > 1 else None
+        try:
+            while pending:
+                timeout = hedge_delay if not info["hedged"] and next_candidate < len(candidates) else None
+                done, _ = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    # El modelo pedido va más lento que su p95: lanzar el siguiente en paralelo
+                    info["hedged"] = True
+                    ROUTING_EVENTS.inc(model=candidates[next_candidate], event="hedge")
+                    logger.info(f"{model_id} superó {hedge_delay * 1000:.0f} ms; hedging con {candidates[next_candidate]}")
+                    launch()
+                    continue
+
+                for task in done:
+                    candidate = pending.pop(task)
+                    if task.exception() is None:
+                        info["model_used"] = candidate
+                        if candidate != model_id:
+                            ROUTING_EVENTS.inc(model=candidate, event="hedge_win" if info["hedged"] else "failover")
+                        return task.result(), info
+                    logger.warning(f"⚠️ {candidate} falló: {task.exception()}")
+                    info["failed"].append({"model": candidate, "error": str(task.exception())})
+
+                if not pending and next_candidate < len(candidates):
+                    logger.info(f"Failover a {candidates[next_candidate]}")
+                    launch()
+        finally:
+            for task in pending:
+                task.cancel()
+
+        # Todos los candidatos fallaron: propagar los errores de cada uno
+        raise RuntimeError("; ".join(f"{failure['model']}: {failure['error']}" for failure in info["failed"]))
+
+    # ------------------------------------------------------------ streaming
+
+    def stream(self, model_id: str, prompt_for: PromptBuilder, response_mode: str = "extended",
+               usage: Optional[Dict] = None, info: Optional[Dict] = None) -> Iterator[str]:
+        """
+        Respuesta en streaming con failover: si un proveedor falla antes de
+        producir el primer fragmento se intenta con el siguiente. Una vez
+        enviado texto al cliente ya no se cambia de proveedor.
+        """
+        candidates = self.candidates(model_id)
+        info = info if info is not None else {}
+        info.update({"model_used": None, "requested_model": model_id, "hedged": False, "failed": []})
+        for candidate in candidates:
+            started = time.perf_counter()
+            produced = False
+            try:
+                for text in self.manager.stream_response(prompt_for(candidate), candidate, response_mode, usage=usage):
+                    produced = True
+                    yield text
+                info["model_used"] = candidate
+                self.latency(candidate).observe(time.perf_counter() - started)
+                if candidate != model_id:
+                    ROUTING_EVENTS.inc(model=candidate, event="failover")
+                return
+            except Exception as e:
+                if produced:
+                    raise
+                logger.warning(f"⚠️ {candidate} falló antes de responder: {e}")
+                info["failed"].append({"model": candidate, "error": str(e)})
+        raise RuntimeError("; ".join(f"{failure['model']}: {failure['error']}" for failure in info["failed"]))
+
+
+def parse_budgets(value: str) -> Dict[str, float]:
+    """Interpreta "gemini=20000,llama3=15000" como {modelo: ms}."""
+    budgets = {}
+    for item in (value or "").split(","):
+        if "=" in item:
+            model_id, budget = item.split("=", 1)
+            budgets[model_id.strip()] = float(budget)
+    return budgets
+
+
+_router: Optional[ModelRouter] = None
+_router_lock = threading.Lock()
+
+
+def get_model_router() -> ModelRouter:
+    """Retorna el router compartido del proceso (crea el ModelManager si hace falta)."""
+    global _router
+    router = _router
+    if router is not None:
+        return router
+
+    from rag.models import get_model_manager
+
+    with _router_lock:
+        if _router is None:
+            _router = ModelRouter(
+                get_model_manager(),
+                budgets_ms=parse_budgets(settings.MODEL_LATENCY_BUDGETS_MS),
+                failover=settings.ROUTING_FAILOVER,
+                hedging=settings.ROUTING_HEDGING,
+                hedge_quantile=settings.HEDGE_QUANTILE,
+                hedge_min_delay_ms=settings.HEDGE_MIN_DELAY_MS,
+                hedge_min_samples=settings.HEDGE_MIN_SAMPLES
+            )
+        return _router
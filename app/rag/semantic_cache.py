@@ -0,0 +1,154 @@
+"""
+app/rag/semantic_cache.py
+Cache semántico de respuestas de /chat. Guarda el embedding de la pregunta
+junto con la respuesta y las fuentes; una pregunta nueva reutiliza la
+respuesta si su similitud coseno con una pregunta cacheada (mismo modelo,
+modo, top_k y versión del corpus) supera el umbral configurado.
+
+Los embeddings se guardan en una matriz NumPy preasignada, así la búsqueda
+del vecino más cercano es un único producto matriz-vector.
+"""
+
+import threading
+import time
+from typing import Any, Dict, Hashable, Optional, Sequence, Tuple
+
+import numpy as np
+
+from config.settings import settings
+
+
+class SemanticCache:
+    """
+    Cache por similitud con expulsión LRU y expiración (TTL).
+
+    Args:
+        max_size: Número máximo de entradas
+        ttl_seconds: Tiempo de vida de cada entrada; 0 o None = sin expiración
+        threshold: Similitud coseno mínima para considerar un acierto
+    """
+
+    def __init__(self, max_size: int = 1000, ttl_seconds: Optional[float] = None,
+                 threshold: float = 0.95):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds or None
+        self.threshold = threshold
+        self._lock = threading.Lock()
+        self._matrix: Optional[np.ndarray] = None   # (max_size, dim), filas normalizadas
+        self._groups = np.full(max_size, -1, dtype=np.int64)  # -1 = posición libre
+        self._expires_at = np.full(max_size, np.inf)
+        self._last_used = np.zeros(max_size)
+        self._values: list = [None] * max_size
+        self._group_ids: Dict[Hashable, int] = {}
+        self._corpus_version: Optional[str] = None
+        self.hits = 0
+        self.misses = 0
+
+    def _check_version(self, corpus_version: str) -> None:
+        """Descarta todas las entradas si cambió la versión del corpus."""
+        if corpus_version != self._corpus_version:
+            self._groups[:] = -1
+            self._values = [None] * self.max_size
+            self._group_ids.clear()
+            self._corpus_version = corpus_version
+
+    @staticmethod
+    def _normalize(embedding: Sequence[float]) -> np.ndarray:
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def get(self, embedding: Sequence[float], group: Hashable,
+            corpus_version: str) -> Optional[Tuple[Any, float]]:
+        """
+        Busca la entrada más similar dentro del grupo (modelo, modo, top_k).
+
+        Returns:
+            (valor, similitud) si hay un acierto, o None
+        """
+        if self.max_size <= 0:
+            return None
+        query = self._normalize(embedding)
+        now = time.monotonic()
+        with self._lock:
+            self._check_version(corpus_version)
+            group_id = self._group_ids.get(group)
+            if group_id is None or self._matrix is None or self._matrix.shape[1] != query.shape[0]:
+                self.misses += 1
+                return None
+
+            candidates = np.flatnonzero((self._groups == group_id) & (self._expires_at > now))
+            if candidates.size == 0:
+                self.misses += 1
+                return None
+
+            scores = self._matrix[candidates] @ query
+            best = int(np.argmax(scores))
+            similarity = float(scores[best])
+            if similarity < self.threshold:
+                self.misses += 1
+                return None
+
+            slot = int(candidates[best])
+            self._last_used[slot] = now
+            self.hits += 1
+            return self._values[slot], similarity
+
+    def set(self, embedding: Sequence[float], group: Hashable, corpus_version: str, value: Any) -> None:
+        """Guarda una entrada, reutilizando la posición libre, expirada o menos usada."""
+        if self.max_size <= 0:
+            return
+        vector = self._normalize(embedding)
+        now = time.monotonic()
+        with self._lock:
+            self._check_version(corpus_version)
+            if self._matrix is None or self._matrix.shape[1] != vector.shape[0]:
+                self._matrix = np.zeros((self.max_size, vector.shape[0]), dtype=np.float32)
+                self._groups[:] = -1
+
+            free = np.flatnonzero((self._groups == -1) | (self._expires_at <= now))
+            slot = int(free[0]) if free.size else int(np.argmin(self._last_used))
+
+            self._matrix[slot] = vector
+            self._groups[slot] = self._group_ids.setdefault(group, len(self._group_ids))
+            self._expires_at[slot] = now + self.ttl_seconds if self.ttl_seconds else np.inf
+            self._last_used[slot] = now
+            self._values[slot] = value
+
+    def clear(self) -> None:
+        with self._lock:
+            self._groups[:] = -1
+            self._values = [None] * self.max_size
+
+    def __len__(self) -> int:
+        return int(np.count_nonzero(self._groups != -1))
+
+    def stats(self) -> Dict[str, Any]:
+        """Retorna tamaño, umbral, hits, misses y hit ratio."""
+        total = self.hits + self.misses
+        return {
+            "size": len(self),
+            "max_size": self.max_size,
+            "ttl_seconds": self.ttl_seconds,
+            "threshold": self.threshold,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / total, 4) if total else 0.0
+        }
+
+
+_cache: Optional[SemanticCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_semantic_cache() -> SemanticCache:
+    """Retorna el cache semántico compartido del proceso."""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = SemanticCache(
+                max_size=settings.SEMANTIC_CACHE_SIZE,
+                ttl_seconds=settings.SEMANTIC_CACHE_TTL,
+                threshold=settings.SEMANTIC_CACHE_THRESHOLD
+            )
+        return _cache
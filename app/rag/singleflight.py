@@ -0,0 +1,81 @@
+"""
+app/rag/singleflight.py
+Coalescencia de llamadas asíncronas idénticas en curso ("single flight").
+Las requests concurrentes con la misma clave esperan una única tarea
+compartida en lugar de repetir embedding, consulta a ChromaDB y llamada al LLM.
+"""
+
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, Hashable
+
+logger = logging.getLogger(__name__)
+
+
+class _Flight:
+    """Tarea compartida y número de requests que la esperan."""
+
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    Agrupa llamadas concurrentes por clave.
+
+    - Todas las requests con la misma clave reciben el resultado (o la
+      excepción) de una sola ejecución.
+    - Si una request se cancela (p.ej. el cliente se desconecta) la tarea
+      compartida sigue para las demás (asyncio.shield); solo se cancela
+      cuando ya no queda nadie esperándola.
+    - Al terminar, la clave se libera: las llamadas posteriores ejecutan de nuevo.
+    """
+
+    def __init__(self):
+        self._flights: Dict[Hashable, _Flight] = {}
+        self.executions = 0
+        self.coalesced = 0
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        flight = self._flights.get(key)
+        if flight is None:
+            flight = _Flight(asyncio.ensure_future(fn()))
+            self._flights[key] = flight
+            flight.task.add_done_callback(lambda task: self._finish(key, flight))
+            self.executions += 1
+        else:
+            self.coalesced += 1
+            logger.info(f"Request agrupada con otra idéntica en curso ({flight.waiters} esperando)")
+
+        flight.waiters += 1
+        try:
+            return await asyncio.shield(flight.task)
+        finally:
+            flight.waiters -= 1
+            if flight.waiters == 0 and not flight.task.done():
+                # Nadie espera ya el resultado: cancelar la tarea y liberar la clave
+                flight.task.cancel()
+                self._release(key, flight)
+
+    def in_flight(self, key: Hashable) -> bool:
+        """True si hay una ejecución en curso para la clave (la próxima llamada se agruparía)."""
+        return key in self._flights
+
+    def _release(self, key: Hashable, flight: _Flight) -> None:
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+
+    def _finish(self, key: Hashable, flight: _Flight) -> None:
+        self._release(key, flight)
+        # Marcar la excepción como leída aunque todas las requests se hayan ido
+        if not flight.task.cancelled():
+            flight.task.exception()
+
+    def stats(self) -> Dict[str, int]:
+        """Retorna llamadas en curso, ejecuciones y requests agrupadas."""
+        return {
+            "in_flight": len(self._flights),
+            "executions": self.executions,
+            "coalesced": self.coalesced
+        }
@@ -0,0 +1,150 @@
+"""
+app/rag/source_catalog.py
+Catálogo materializado de fuentes para /sources. La ingesta lo escribe en
+disco (un documento por entrada, agrupado por categoría y ordenado) junto con
+un ETag; la API lo sirve desde memoria y lo recarga solo si el archivo cambió.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import threading
+from collections import defaultdict
+from pathlib import Path
+from typing import Dict, Iterable, Optional
+from config.settings import settings
+
+logger = logging.getLogger(__name__)
+
+CATALOG_VERSION = 1
+
+CATEGORY_NAMES = {
+    "colombia": "Colombia",
+    "internacional": "Internacional",
+    "universidad": "Universidad de Caldas",
+    "sin_categoria": "Sin Categoría"
+}
+
+# Orden de categorías (colombia, internacional, universidad, otros)
+CATEGORY_ORDER = ["colombia", "internacional", "universidad"]
+
+
+def source_from_metadata(metadata: Dict) -> Dict:
+    """Campos de una fuente a partir de los metadatos de un documento o chunk."""
+    return {
+        "title": metadata.get("titulo", "Sin título"),
+        "source": metadata.get("organismo", "Sin fuente"),
+        "category": metadata.get("categoria", "sin_categoria"),
+        "year": metadata.get("anio", "N/A"),
+        "file_path": metadata.get("ruta_archivo", "")
+    }
+
+
+def build_catalog(sources: Iterable[Dict]) -> Dict:
+    """
+    Agrupa las fuentes por categoría y las deduplica por título.
+    Retorna el cuerpo de la respuesta de /sources.
+    """
+    sources_by_category = defaultdict(dict)
+    for source in sources:
+        category = source.get("category") or "sin_categoria"
+        title = source["title"]
+
+        # Solo agregar si no existe (deduplicación por título)
+        if title not in sources_by_category[category]:
+            sources_by_category[category][title] = {
+                "title": title,
+                "source": source["source"],
+                "year": source["year"]
+            }
+
+    categories = []
+    total_unique_sources = 0
+    for category, sources_dict in sources_by_category.items():
+        sources_list = list(sources_dict.values())
+        total_unique_sources += len(sources_list)
+        categories.append({
+            "category": category,
+            "category_name": CATEGORY_NAMES.get(category, category.capitalize()),
+            "sources": sources_list,
+            "count": len(sources_list)
+        })
+
+    categories.sort(key=lambda x: CATEGORY_ORDER.index(x["category"]) if x["category"] in CATEGORY_ORDER else 999)
+
+    return {
+        "status": "ok",
+        "total_sources": total_unique_sources,
+        "total_categories": len(categories),
+        "categories": categories
+    }
+
+
+def _etag(catalog: Dict) -> str:
+    payload = json.dumps(catalog, sort_keys=True, ensure_ascii=False)
+    return '"' + hashlib.sha256(payload.encode("utf-8")).hexdigest()[:32] + '"'
+
+
+def write_catalog(sources: Iterable[Dict], path: Optional[Path] = None) -> Dict:
+    """Construye el catálogo y lo guarda en disco (escritura atómica)."""
+    path = Path(path or settings.SOURCE_CATALOG_PATH)
+    catalog = build_catalog(sources)
+    data = {"version": CATALOG_VERSION, "etag": _etag(catalog), "catalog": catalog}
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(path.name + ".tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+    logger.info(f"✅ Catálogo de fuentes actualizado: {catalog['total_sources']} fuentes")
+    return data
+
+
+class SourceCatalog:
+    """Catálogo en memoria, recargado cuando cambia el archivo."""
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self._data: Optional[Dict] = None
+        self._mtime: Optional[float] = None
+
+    def get(self) -> Optional[Dict]:
+        """Retorna {"etag", "catalog"} o None si aún no existe el catálogo."""
+        try:
+            mtime = os.stat(self.path).st_mtime
+        except FileNotFoundError:
+            return self._data
+        if mtime == self._mtime:
+            return self._data
+
+        with self._lock:
+            if mtime != self._mtime:
+                try:
+                    with open(self.path, "r", encoding="utf-8") as f:
+                        data = json.load(f)
+                    if data.get("version") == CATALOG_VERSION:
+                        self._data = data
+                    else:
+                        logger.info("Catálogo de fuentes con versión incompatible, se ignora")
+                    self._mtime = mtime
+                except Exception as e:
+                    logger.warning(f"⚠️ No se pudo leer el catálogo de fuentes: {e}")
+            return self._data
+
+    def set(self, data: Dict) -> None:
+        with self._lock:
+            self._data = data
+
+
+_catalog: Optional[SourceCatalog] = None
+_catalog_lock = threading.Lock()
+
+
+def get_source_catalog() -> SourceCatalog:
+    """Retorna el catálogo compartido del proceso."""
+    global _catalog
+    with _catalog_lock:
+        if _catalog is None:
+            _catalog = SourceCatalog(settings.SOURCE_CATALOG_PATH)
+        return _catalog
@@ -0,0 +1,301 @@
+"""
+app/rag/text_store.py
+Almacén del texto extraído de cada documento, guardado una sola vez como
+UTF-8 y leído con mmap.
+
+Los chunks se representan como offsets (bytes) sobre ese texto: se calculan
+mientras se escribe el texto, página por página (StagedText), y se guardan
+en los metadatos del chunk (text_start / text_end). Fuera de la ingesta el
+texto de un chunk se materializa solo al necesitarlo (prompt), y con los offsets
+unir chunks solapados o ampliar un chunk con el texto vecino es aritmética
+de intervalos.
+"""
+
+import glob
+import hashlib
+import logging
+import mmap
+import os
+import re
+import threading
+import uuid
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+from config.settings import settings
+
+logger = logging.getLogger(__name__)
+
+Span = Tuple[int, int]
+
+_WHITESPACE = b" \t\n\r\x0b\x0c"
+
+
+def _char_boundary(buffer, position: int) -> int:
+    """Retrocede `position` hasta el inicio de un carácter UTF-8."""
+    while 0 < position < len(buffer) and (buffer[position] & 0xC0) == 0x80:
+        position -= 1
+    return position
+
+
+def _strip(buffer, start: int, end: int) -> Span:
+    """Equivalente a .strip() sobre buffer[start:end], sin copiar."""
+    while start < end and buffer[start] in _WHITESPACE:
+        start += 1
+    while end > start and buffer[end - 1] in _WHITESPACE:
+        end -= 1
+    return start, end
+
+
+class StagedText:
+    """
+    Texto de un documento que se está ingiriendo (ver TextStore.stage).
+
+    Cada página se escribe al archivo temporal en cuanto llega y los chunks
+    se calculan a medida que quedan completos, así el primer lote de chunks
+    se puede embeber mientras se siguen extrayendo las páginas siguientes.
+    En memoria solo se mantiene el texto que aún puede formar parte de otro
+    chunk.
+
+    El chunking corta en un salto de párrafo, de línea o un espacio de la
+    segunda mitad del chunk, medido en bytes UTF-8.
+
+    Args:
+        path: Archivo temporal donde se escribe el texto
+        version: Versión del texto (se guarda en los metadatos de los chunks)
+        chunk_size: Tamaño de cada chunk (bytes)
+        overlap: Bytes de solapamiento entre chunks
+    """
+
+    def __init__(self, path: Path, chunk_size: int, overlap: int, version: str):
+        self.path = Path(path)
+        self.version = version
+        self.chunk_size = chunk_size
+        self.overlap = overlap
+        self.size = 0
+        self._file = open(self.path, "wb")
+        self._buffer = bytearray()  # Texto pendiente, desde el offset `_base`
+        self._base = 0
+        self._start = 0             # Offset del próximo chunk
+        self._emitted = False
+        # Caracteres totales y espacios en los extremos (para length)
+        self._chars = 0
+        self._leading: Optional[int] = None
+        self._trailing = 0
+
+    @property
+    def length(self) -> int:
+        """Caracteres del texto escrito hasta ahora, sin espacios en los extremos (len(text.strip()))."""
+        if self._leading is None:
+            return 0
+        return self._chars - self._leading - self._trailing
+
+    def chunks(self, pages: Iterable[str]) -> Iterator[Tuple[Span, str]]:
+        """
+        Escribe las páginas no vacías unidas con "\n\n" y produce cada chunk
+        en cuanto está completo.
+
+        Yields:
+            ((inicio, fin), texto) de cada chunk no vacío, sin espacios en los extremos
+        """
+        for page in pages:
+            if not page:
+                continue
+            text = ("\n\n" + page) if self.size else page
+            self._count(text)
+            data = text.encode("utf-8")
+            self._file.write(data)
+            self._buffer += data
+            self.size += len(data)
+            yield from self._advance(final=False)
+        self._file.close()
+
+        if not self._emitted and self.size <= self.chunk_size:
+            # Texto corto: un único chunk
+            start, end = _strip(self._buffer, 0, len(self._buffer))
+            if start < end:
+                yield (start, end), self._buffer[start:end].decode("utf-8")
+            return
+        yield from self._advance(final=True)
+
+    def _count(self, text: str) -> None:
+        self._chars += len(text)
+        stripped = text.rstrip()
+        if not stripped:
+            self._trailing += len(text)
+            return
+        if self._leading is None:
+            self._leading = self._chars - len(text.lstrip())
+        self._trailing = len(text) - len(stripped)
+
+    def _advance(self, final: bool) -> Iterator[Tuple[Span, str]]:
+        buffer, base = self._buffer, self._base
+        while True:
+            start, length = self._start, self.size
+            # Sin el final del texto, solo se corta si ya hay más de chunk_size
+            # bytes disponibles (así se sabe que end < length)
+            if start >= length or (not final and length - start <= self.chunk_size):
+                break
+
+            end = start + self.chunk_size
+            if end < length:
+                # Intentar cortar en un espacio o salto de línea
+                cut = buffer.rfind(b"\n\n", start - base, end - base)
+                if cut == -1:
+                    cut = buffer.rfind(b"\n", start - base, end - base)
+                if cut == -1:
+                    cut = buffer.rfind(b" ", start - base, end - base)
+
+                if cut != -1 and cut + base - start > self.chunk_size // 2:  # Asegurar que no sea muy corto
+                    end = cut + base
+                else:
+                    end = base + _char_boundary(buffer, end - base)
+
+            span_start, span_end = _strip(buffer, start - base, min(end, length) - base)
+            if span_start < span_end:  # Filtrar chunks vacíos
+                self._emitted = True
+                yield (span_start + base, span_end + base), buffer[span_start:span_end].decode("utf-8")
+            self._start = base + _char_boundary(buffer, end - self.overlap - base)
+
+            # Descartar el texto que ya no puede formar parte de otro chunk
+            if self._start > base:
+                del buffer[:self._start - base]
+                base = self._base = self._start
+
+    def close(self) -> None:
+        self._file.close()
+
+
+class DocumentText:
+    """Texto de un documento mapeado en memoria (solo lectura)."""
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        with open(self.path, "rb") as f:
+            self.size = os.fstat(f.fileno()).st_size
+            # El mmap sigue siendo válido después de cerrar el archivo (y de reemplazarlo)
+            self.buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if self.size else b""
+
+    def text(self, start: int = 0, end: Optional[int] = None) -> str:
+        """Materializa el texto entre dos offsets."""
+        end = self.size if end is None else end
+        return self.buffer[start:end].decode("utf-8")
+
+    def valid(self, span: Span) -> bool:
+        start, end = span
+        return 0 <= start < end <= self.size
+
+    def expand(self, span: Span, chars: int) -> Span:
+        """
+        Amplía un intervalo con hasta `chars` bytes de texto vecino a cada lado,
+        cortando en un espacio para no partir palabras.
+        """
+        start, end = span
+        if chars <= 0:
+            return span
+        new_start = max(0, start - chars)
+        if new_start > 0:
+            space = self.buffer.find(b" ", new_start, start)
+            new_start = space + 1 if space != -1 else _char_boundary(self.buffer, new_start)
+        new_end = min(self.size, end + chars)
+        if new_end < self.size:
+            space = self.buffer.rfind(b" ", end, new_end)
+            new_end = space if space != -1 else _char_boundary(self.buffer, new_end)
+        return _strip(self.buffer, new_start, new_end)
+
+
+class TextStore:
+    """
+    Directorio con un archivo UTF-8 por versión del texto de cada documento.
+
+    Cada ingesta escribe el texto en un archivo temporal (stage) calculando
+    los chunks a medida que llegan las páginas, y cada chunk guarda en sus
+    metadatos la versión del texto sobre la que se calcularon sus offsets
+    (text_version). Al terminar bien, el texto se publica con esa versión en
+    el nombre (commit) y se borran las versiones anteriores.
+
+    Así unos offsets solo se aplican al texto exacto del que salieron: los
+    chunks de una reingesta en curso o fallida apuntan a una versión que no
+    está publicada y quien los lee usa el texto guardado en el chunk.
+    """
+
+    def __init__(self, directory: Path):
+        self.directory = Path(directory)
+        self._open: Dict[Tuple[str, str], DocumentText] = {}
+        self._lock = threading.Lock()
+
+    def _name(self, doc_id: str) -> str:
+        name = re.sub(r"[^\w.-]", "_", doc_id)
+        if name != doc_id:
+            # Evitar colisiones entre ids que difieren solo en caracteres reemplazados
+            name += "-" + hashlib.sha1(doc_id.encode("utf-8")).hexdigest()[:8]
+        return name
+
+    def path(self, doc_id: str, version: str) -> Path:
+        # "@" no aparece en los nombres saneados: separa el documento de la versión
+        return self.directory / f"{self._name(doc_id)}@{version}.txt"
+
+    def _published(self, doc_id: str) -> List[Path]:
+        """Archivos publicados del documento (todas las versiones)."""
+        return list(self.directory.glob(f"{glob.escape(self._name(doc_id))}@*.txt"))
+
+    def stage(self, doc_id: str, chunk_size: int, overlap: int) -> StagedText:
+        """Abre un temporal para escribir una versión nueva del texto (ver StagedText.chunks)."""
+        self.directory.mkdir(parents=True, exist_ok=True)
+        version = uuid.uuid4().hex[:12]
+        return StagedText(self.path(doc_id, version).with_suffix(".txt.tmp"), chunk_size, overlap, version)
+
+    def commit(self, doc_id: str, staged: StagedText) -> DocumentText:
+        """Publica el texto preparado con stage y borra las versiones anteriores."""
+        staged.close()
+        path = self.path(doc_id, staged.version)
+        os.replace(staged.path, path)
+        for old_path in self._published(doc_id):
+            if old_path != path:
+                old_path.unlink(missing_ok=True)
+        document = DocumentText(path)
+        with self._lock:
+            self._open = {key: value for key, value in self._open.items() if key[0] != doc_id}
+            self._open[(doc_id, staged.version)] = document
+        return document
+
+    def discard(self, staged: StagedText) -> None:
+        """Borra un texto preparado con stage que no se publicó."""
+        staged.close()
+        staged.path.unlink(missing_ok=True)
+
+    def open(self, doc_id: str, version: str) -> Optional[DocumentText]:
+        """Texto publicado del documento en esa versión (None si no existe o ya se reemplazó)."""
+        key = (doc_id, version)
+        path = self.path(doc_id, version)
+        if not path.exists():
+            # Reemplazado por otra ingesta (quizás de otro proceso): liberar el mmap
+            with self._lock:
+                self._open.pop(key, None)
+            return None
+
+        with self._lock:
+            document = self._open.get(key)
+            if document is None:
+                # Cada versión se escribe una sola vez: el archivo no cambia mientras exista
+                document = DocumentText(path)
+                self._open[key] = document
+            return document
+
+    def delete(self, doc_id: str) -> None:
+        with self._lock:
+            self._open = {key: value for key, value in self._open.items() if key[0] != doc_id}
+        for path in self._published(doc_id):
+            path.unlink(missing_ok=True)
+
+
+_text_store: Optional[TextStore] = None
+_text_store_lock = threading.Lock()
+
+
+def get_text_store() -> TextStore:
+    """Retorna el almacén de textos compartido del proceso."""
+    global _text_store
+    with _text_store_lock:
+        if _text_store is None:
+            _text_store = TextStore(Path(settings.TEXT_STORE_DIR))
+        return _text_store
@@ -0,0 +1,268 @@
+"""
+app/rag/vector_index.py
+Índice vectorial embebido en el proceso (NumPy) como backend alternativo
+de recuperación. Se construye a partir de un snapshot exportado de ChromaDB:
+
+    embeddings.npy   Matriz (n, d) normalizada, float32 o float16, mapeada en memoria
+    documents.bin    Textos de los chunks en UTF-8, concatenados
+    offsets.npy      Offsets (n + 1) de cada texto dentro de documents.bin
+    table.json       Ids y metadatos (los campos comunes a un documento se
+                     guardan una sola vez)
+    index.json       Versión del snapshot, modelo de embeddings y dimensiones
+"""
+
+import json
+import logging
+import mmap
+import os
+import shutil
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+from config.settings import settings
+from rag.collection_scan import iter_collection, log_progress
+
+logger = logging.getLogger(__name__)
+
+# Campos de metadatos que cambian por chunk; el resto se comparte por documento
+PER_CHUNK_KEYS = ("chunk_index", "chunk_text_length", "text_start", "text_end")
+
+# Filas por bloque al puntuar matrices float16 (evita convertir toda la matriz)
+SCORE_BLOCK_ROWS = 8192
+
+
+def _normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+class _Snapshot:
+    """Datos de un snapshot cargado. Se reemplaza completo al recargar, así las
+    consultas en curso siguen usando el snapshot con el que empezaron."""
+
+    def __init__(self, index_dir: Path, info: Dict):
+        self.info = info
+        self.embeddings = np.load(index_dir / "embeddings.npy", mmap_mode="r")
+        self.offsets = np.load(index_dir / "offsets.npy", mmap_mode="r")
+        with open(index_dir / "documents.bin", "rb") as f:
+            size = os.fstat(f.fileno()).st_size
+            # El mmap sigue siendo válido después de cerrar el archivo
+            self.documents = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if size else b""
+        with open(index_dir / "table.json", "r", encoding="utf-8") as f:
+            table = json.load(f)
+        self.ids: List[str] = table["ids"]
+        self.shared: List[Dict] = table["shared"]
+        self.rows: List[list] = table["rows"]
+        self.row_of: Dict[str, int] = {chunk_id: row for row, chunk_id in enumerate(self.ids)}
+
+    def document(self, row: int) -> str:
+        start, end = int(self.offsets[row]), int(self.offsets[row + 1])
+        return self.documents[start:end].decode("utf-8")
+
+    def metadata(self, row: int) -> Dict:
+        shared_idx, per_chunk = self.rows[row]
+        return {**self.shared[shared_idx], **per_chunk}
+
+    def scores(self, queries: np.ndarray) -> np.ndarray:
+        """Producto punto de todas las filas contra las consultas: (n, m)."""
+        embeddings = self.embeddings
+        if embeddings.dtype == np.float32:
+            return embeddings @ queries.T
+        scores = np.empty((embeddings.shape[0], queries.shape[0]), dtype=np.float32)
+        for start in range(0, embeddings.shape[0], SCORE_BLOCK_ROWS):
+            block = np.asarray(embeddings[start:start + SCORE_BLOCK_ROWS], dtype=np.float32)
+            scores[start:start + len(block)] = block @ queries.T
+        return scores
+
+
+class NumpyVectorIndex:
+    """Índice de solo lectura cargado de forma perezosa desde un snapshot."""
+
+    def __init__(self, index_dir: Path):
+        self.index_dir = Path(index_dir)
+        self._lock = threading.Lock()
+        self._snapshot: Optional[_Snapshot] = None
+
+    @property
+    def info(self) -> Dict:
+        return self._snapshot.info if self._snapshot else {}
+
+    def _read_info(self) -> Optional[Dict]:
+        info_path = self.index_dir / "index.json"
+        try:
+            with open(info_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def ensure_loaded(self) -> bool:
+        """Carga (o recarga si cambió el snapshot) el índice. Retorna si está disponible."""
+        info = self._read_info()
+        if info is None:
+            return self._snapshot is not None
+
+        snapshot = self._snapshot
+        if snapshot is not None and snapshot.info.get("version") == info.get("version"):
+            return True
+
+        with self._lock:
+            snapshot = self._snapshot
+            if snapshot is not None and snapshot.info.get("version") == info.get("version"):
+                return True
+            started = time.perf_counter()
+            try:
+                self._snapshot = _Snapshot(self.index_dir, info)
+            except FileNotFoundError:
+                # Snapshot publicándose en este momento: seguir con el anterior
+                return self._snapshot is not None
+            logger.info(
+                f"✅ Índice vectorial cargado: {info.get('count')} chunks, "
+                f"dim={info.get('dim')}, dtype={info.get('dtype')} "
+                f"({(time.perf_counter() - started) * 1000:.1f} ms)"
+            )
+            return True
+
+    def __len__(self) -> int:
+        return len(self._snapshot.ids) if self._snapshot else 0
+
+    def query(self, query_embeddings: Sequence[Sequence[float]], n_results: int = 3) -> Dict:
+        """
+        Top-k por similitud coseno. Retorna el mismo formato que
+        collection.query de ChromaDB (distances = 1 - coseno).
+        """
+        if not self.ensure_loaded():
+            raise RuntimeError("El índice vectorial no está disponible (falta el snapshot).")
+        snapshot = self._snapshot
+
+        result = {"ids": [], "documents": [], "metadatas": [], "distances": []}
+        total = len(snapshot.ids)
+        if total == 0:
+            for _ in query_embeddings:
+                for key in result:
+                    result[key].append([])
+            return result
+
+        queries = _normalize_rows(np.asarray(query_embeddings, dtype=np.float32))
+        scores = snapshot.scores(queries)
+        k = min(n_results, total)
+
+        for column in range(queries.shape[0]):
+            column_scores = scores[:, column]
+            if k < total:
+                top = np.argpartition(-column_scores, k - 1)[:k]
+            else:
+                top = np.arange(total)
+            top = top[np.argsort(-column_scores[top])]
+
+            result["ids"].append([snapshot.ids[row] for row in top])
+            result["documents"].append([snapshot.document(row) for row in top])
+            result["metadatas"].append([snapshot.metadata(row) for row in top])
+            result["distances"].append([float(1.0 - column_scores[row]) for row in top])
+        return result
+
+
+    def get(self, ids: Sequence[str]) -> Dict:
+        """Retorna documentos y metadatos de los ids dados (formato de collection.get)."""
+        if not self.ensure_loaded():
+            raise RuntimeError("El índice vectorial no está disponible (falta el snapshot).")
+        snapshot = self._snapshot
+        rows = [snapshot.row_of[chunk_id] for chunk_id in ids if chunk_id in snapshot.row_of]
+        return {
+            "ids": [snapshot.ids[row] for row in rows],
+            "documents": [snapshot.document(row) for row in rows],
+            "metadatas": [snapshot.metadata(row) for row in rows]
+        }
+
+
+def export_from_chroma(collection, index_dir: Path, model_name: str,
+                       dtype: str = "float32", page_size: Optional[int] = None) -> Dict:
+    """
+    Exporta la colección de ChromaDB a un snapshot del índice NumPy.
+    El snapshot se escribe en un directorio temporal y se publica al final.
+    """
+    index_dir = Path(index_dir)
+    tmp_dir = index_dir.with_name(index_dir.name + ".tmp")
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    tmp_dir.mkdir(parents=True)
+
+    ids: List[str] = []
+    shared: List[Dict] = []
+    shared_index: Dict[str, int] = {}
+    rows: List[list] = []
+    blocks: List[np.ndarray] = []
+    offsets = [0]
+
+    started = time.perf_counter()
+    with open(tmp_dir / "documents.bin", "wb") as documents_file:
+        pages = iter_collection(
+            collection,
+            include=["embeddings", "documents", "metadatas"],
+            page_size=page_size,
+            progress=log_progress("Exportando índice vectorial")
+        )
+        for page in pages:
+            page_ids = page["ids"]
+            blocks.append(_normalize_rows(np.asarray(page["embeddings"], dtype=np.float32)).astype(dtype))
+            for chunk_id, document, metadata in zip(page_ids, page["documents"], page["metadatas"]):
+                metadata = metadata or {}
+                common = {k: v for k, v in metadata.items() if k not in PER_CHUNK_KEYS}
+                key = json.dumps(common, sort_keys=True, ensure_ascii=False)
+                if key not in shared_index:
+                    shared_index[key] = len(shared)
+                    shared.append(common)
+                per_chunk = {k: metadata[k] for k in PER_CHUNK_KEYS if k in metadata}
+
+                encoded = (document or "").encode("utf-8")
+                documents_file.write(encoded)
+                offsets.append(offsets[-1] + len(encoded))
+                ids.append(chunk_id)
+                rows.append([shared_index[key], per_chunk])
+
+    embeddings = np.concatenate(blocks) if blocks else np.zeros((0, 0), dtype=dtype)
+    np.save(tmp_dir / "embeddings.npy", embeddings)
+    np.save(tmp_dir / "offsets.npy", np.asarray(offsets, dtype=np.int64))
+    with open(tmp_dir / "table.json", "w", encoding="utf-8") as f:
+        json.dump({"ids": ids, "shared": shared, "rows": rows}, f, ensure_ascii=False)
+
+    info = {
+        "version": f"{time.time():.6f}",
+        "collection": collection.name,
+        "model": model_name,
+        "dtype": dtype,
+        "count": len(ids),
+        "dim": int(embeddings.shape[1]) if embeddings.ndim == 2 and len(ids) else 0
+    }
+    with open(tmp_dir / "index.json", "w", encoding="utf-8") as f:
+        json.dump(info, f)
+
+    # Publicar: reemplazar el snapshot anterior
+    old_dir = index_dir.with_name(index_dir.name + ".old")
+    shutil.rmtree(old_dir, ignore_errors=True)
+    if index_dir.exists():
+        os.replace(index_dir, old_dir)
+    os.replace(tmp_dir, index_dir)
+    shutil.rmtree(old_dir, ignore_errors=True)
+
+    logger.info(
+        f"✅ Snapshot del índice vectorial exportado: {len(ids)} chunks "
+        f"({time.perf_counter() - started:.1f}s)"
+    )
+    return info
+
+
+_index: Optional[NumpyVectorIndex] = None
+_index_lock = threading.Lock()
+
+
+def get_vector_index() -> NumpyVectorIndex:
+    """Retorna el índice compartido del proceso (la carga es perezosa)."""
+    global _index
+    with _index_lock:
+        if _index is None:
+            _index = NumpyVectorIndex(settings.VECTOR_INDEX_DIR)
+        return _index
@@ -0,0 +1,132 @@
+"""
+app/utils/text_cache.py
+Cache en disco del texto extraído de PDFs, página por página.
+
+Cada entrada se guarda comprimida (gzip, una página JSON por línea) y se
+identifica por ruta, tamaño, mtime y versión del extractor, de modo que un
+archivo modificado o un cambio en la extracción invalidan la entrada. Junto
+a las páginas se pueden guardar datos del archivo (p.ej. título y número de
+páginas) con la misma clave.
+Lo usan tanto app/rag/file_loader.py como los scripts de /scripts.
+"""
+
+import gzip
+import hashlib
+import json
+import logging
+import os
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Incrementar si cambia la forma de extraer texto de los PDFs
+EXTRACTOR_VERSION = "pdf-pages-v1"
+
+
+class TextCache:
+    """
+    Cache de texto extraído por página.
+
+    Args:
+        cache_dir: Directorio donde se guardan las entradas
+        root: Directorio base; las rutas dentro de él se usan relativas en la
+              clave para que el cache sirva igual dentro y fuera de Docker
+        extractor_version: Versión del extractor incluida en la clave
+    """
+
+    def __init__(self, cache_dir: Path, root: Optional[Path] = None,
+                 extractor_version: str = EXTRACTOR_VERSION):
+        self.cache_dir = Path(cache_dir)
+        self.root = Path(root).resolve() if root else None
+        self.extractor_version = extractor_version
+
+    def key(self, path: Path) -> str:
+        """Clave de la entrada: ruta (relativa a root si aplica), tamaño, mtime y extractor."""
+        path = Path(path).resolve()
+        stat = path.stat()
+        name = str(path)
+        if self.root is not None:
+            try:
+                name = path.relative_to(self.root).as_posix()
+            except ValueError:
+                pass
+        raw = f"{name}|{stat.st_size}|{stat.st_mtime_ns}|{self.extractor_version}"
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def _entry_path(self, key: str) -> Path:
+        return self.cache_dir / key[:2] / f"{key}.jsonl.gz"
+
+    def _info_path(self, key: str) -> Path:
+        return self.cache_dir / key[:2] / f"{key}.info.json"
+
+    def iter_pages(self, path: Path) -> Optional[Iterator[str]]:
+        """Retorna un iterador sobre las páginas cacheadas, o None si no hay entrada."""
+        entry_path = self._entry_path(self.key(path))
+        if not entry_path.exists():
+            return None
+
+        def _read() -> Iterator[str]:
+            with gzip.open(entry_path, "rt", encoding="utf-8") as f:
+                for line in f:
+                    yield json.loads(line)
+
+        return _read()
+
+    def get(self, path: Path) -> Optional[List[str]]:
+        """Retorna la lista de páginas cacheadas, o None si no hay entrada válida."""
+        pages = self.iter_pages(path)
+        if pages is None:
+            return None
+        try:
+            return list(pages)
+        except Exception as e:
+            logger.warning(f"⚠️ Entrada de cache de texto corrupta para {Path(path).name}: {e}")
+            return None
+
+    def get_info(self, path: Path) -> Optional[Dict]:
+        """Retorna los datos guardados con put_info, o None si no hay entrada válida."""
+        info_path = self._info_path(self.key(path))
+        try:
+            with open(info_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            logger.warning(f"⚠️ Entrada de cache de texto corrupta para {Path(path).name}: {e}")
+            return None
+
+    def put_info(self, path: Path, info: Dict) -> None:
+        """Guarda datos del archivo junto a sus páginas (escritura atómica)."""
+        info_path = self._info_path(self.key(path))
+        info_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = info_path.with_name(f"{info_path.name}.{os.getpid()}.tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(info, f, ensure_ascii=False)
+        os.replace(tmp_path, info_path)
+
+    def put(self, path: Path, pages: Iterable[str]) -> None:
+        """Guarda las páginas extraídas de un archivo (escritura atómica)."""
+        for _ in self.write_through(path, pages):
+            pass
+
+    def write_through(self, path: Path, pages: Iterable[str]) -> Iterator[str]:
+        """
+        Produce las páginas a medida que llegan mientras las escribe en el cache.
+        La entrada solo se publica si el iterador se consume completo.
+        """
+        entry_path = self._entry_path(self.key(path))
+        entry_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = entry_path.with_name(f"{entry_path.name}.{os.getpid()}.tmp")
+        completed = False
+        try:
+            with gzip.open(tmp_path, "wt", encoding="utf-8", compresslevel=6) as f:
+                for page in pages:
+                    f.write(json.dumps(page, ensure_ascii=False))
+                    f.write("\n")
+                    yield page
+            os.replace(tmp_path, entry_path)
+            completed = True
+        finally:
+            if not completed:
+                tmp_path.unlink(missing_ok=True)
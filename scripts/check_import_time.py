@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+Script para medir el tiempo de importación de la API (app/main.py) en un
+proceso nuevo, como al arrancar un contenedor en frío. Falla si se supera el
+presupuesto o si al importar se cargan SDKs pesados que deberían ser perezosos.
+
+Uso:
+    python scripts/check_import_time.py [--budget-ms 800] [--top 15]
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import logging
+from pathlib import Path
+
+APP_DIR = Path(__file__).parent.parent / "app"
+
+logging.basicConfig(level=logging.INFO, format='%(levelname)s: %(message)s')
+logger = logging.getLogger(__name__)
+
+# Módulos que no deben cargarse al importar la API (se cargan en el primer uso
+# o en la precarga del hook de arranque)
+LAZY_MODULES = ["chromadb", "google.generativeai", "groq", "pdfplumber", "numpy"]
+
+PROBE = """
+import json, sys, time
+started = time.perf_counter()
+import main
+elapsed = (time.perf_counter() - started) * 1000
+print(json.dumps({
+    "import_ms": elapsed,
+    "loaded": [name for name in %r if name in sys.modules]
+}))
+""" % (LAZY_MODULES,)
+
+
+def parse_importtime(stderr: str):
+    """Retorna [(cumulative_us, modulo)] a partir de la salida de -X importtime."""
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        try:
+            _, cumulative, name = line[len("import time:"):].split("|")
+            rows.append((int(cumulative), name.rstrip()))
+        except ValueError:
+            continue
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Presupuesto de tiempo de importación de la API")
+    parser.add_argument(
+        "--budget-ms", type=float,
+        default=float(os.getenv("IMPORT_TIME_BUDGET_MS", 800)),
+        help="Tiempo máximo de `import main` en ms (default: 800 o IMPORT_TIME_BUDGET_MS)"
+    )
+    parser.add_argument("--top", type=int, default=15, help="Módulos más lentos a mostrar")
+    args = parser.parse_args()
+
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", PROBE],
+        cwd=APP_DIR, capture_output=True, text=True
+    )
+    if result.returncode != 0:
+        logger.error(f"❌ Error importando la API:\n{result.stderr[-2000:]}")
+        return False
+
+    probe = json.loads(result.stdout.strip().splitlines()[-1])
+    rows = parse_importtime(result.stderr)
+
+    logger.info(f"⏱️  import main: {probe['import_ms']:.0f} ms (presupuesto: {args.budget_ms:.0f} ms)")
+    logger.info(f"Top {args.top} importaciones (acumulado):")
+    for cumulative, name in sorted(rows, reverse=True)[:args.top]:
+        logger.info(f"   {cumulative / 1000:8.1f} ms  {name}")
+
+    ok = True
+    if probe["loaded"]:
+        logger.error(f"❌ Módulos pesados cargados al importar: {probe['loaded']}")
+        ok = False
+    if probe["import_ms"] > args.budget_ms:
+        logger.error("❌ Se superó el presupuesto de tiempo de importación")
+        ok = False
+    if ok:
+        logger.info("✅ Importación dentro del presupuesto")
+    return ok
+
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
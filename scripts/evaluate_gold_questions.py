@@ -29,7 +29,8 @@ RESULTS_DIR = Path("data/evaluation/results")
 class ChatbotEvaluator:
     """Evaluador automatizado del chatbot con 6 métricas principales"""
     
-    def __init__(self):
+    def __init__(self, batch: bool = False):
+        self.batch = batch  # Usar /chat/batch (una request por modelo)
         self.results = []
         self.start_time = None
         self.end_time = None
@@ -43,11 +44,11 @@ class ChatbotEvaluator:
         return dataset
     
     def query_chatbot(self, question: str, model: str = "gemini", top_k: int = 3) -> Dict[str, Any]:
-        """Realiza una consulta al chatbot"""
+        """Realiza una consulta al chatbot (pidiendo el desglose de tiempos por etapa)"""
         try:
             response = requests.post(
                 f"{API_BASE_URL}/chat",
-                json={"question": question, "model": model, "top_k": top_k},
+                json={"question": question, "model": model, "top_k": top_k, "timings": True},
                 timeout=60
             )
             response.raise_for_status()
@@ -55,6 +56,34 @@ class ChatbotEvaluator:
         except requests.exceptions.RequestException as e:
             return {"error": str(e)}
     
+    def query_chatbot_batch(self, questions: List[str], model: str = "gemini", top_k: int = 3) -> Dict[int, tuple]:
+        """
+        Consulta todas las preguntas en una sola request a /chat/batch.
+        Retorna {índice: (respuesta, segundos hasta recibirla)}.
+        """
+        results = {}
+        start_time = time.time()
+        try:
+            response = requests.post(
+                f"{API_BASE_URL}/chat/batch",
+                json={"questions": questions, "model": model, "top_k": top_k},
+                stream=True,
+                timeout=60 * max(1, len(questions))
+            )
+            response.raise_for_status()
+            for line in response.iter_lines(decode_unicode=True):
+                if not line:
+                    continue
+                data = json.loads(line)
+                if data.get("status") == "error":
+                    data = {"error": data.get("detail", "Error desconocido")}
+                results[data.get("index")] = (data, time.time() - start_time)
+        except requests.exceptions.RequestException as e:
+            error = {"error": str(e)}
+            for idx in range(len(questions)):
+                results.setdefault(idx, (error, time.time() - start_time))
+        return results
+    
     def calculate_exactitud(self, answer: str, expected_keywords: List[str]) -> int:
         """
         Métrica 1: Exactitud (0-100)
@@ -226,8 +255,12 @@ class ChatbotEvaluator:
         
         return max(0, score)
     
-    def evaluate_question(self, question_data: Dict[str, Any], model: str, index: int, total: int) -> Dict[str, Any]:
-        """Evalúa una pregunta individual con todas las métricas"""
+    def evaluate_question(self, question_data: Dict[str, Any], model: str, index: int, total: int,
+                          batch_result: tuple = None) -> Dict[str, Any]:
+        """
+        Evalúa una pregunta individual con todas las métricas.
+        batch_result: (respuesta, tiempo) ya obtenidos con /chat/batch
+        """
         question_id = question_data['id']
         question = question_data['question']
         category = question_data['category']
@@ -239,9 +272,12 @@ class ChatbotEvaluator:
         print(f"  ❓ {question}")
         
         # 1. Query al chatbot
-        start_time = time.time()
-        response = self.query_chatbot(question, model=model)
-        response_time = time.time() - start_time
+        if batch_result is not None:
+            response, response_time = batch_result
+        else:
+            start_time = time.time()
+            response = self.query_chatbot(question, model=model)
+            response_time = time.time() - start_time
         
         # Verificar error
         if "error" in response:
@@ -254,6 +290,7 @@ class ChatbotEvaluator:
                 "model": model,
                 "error": response['error'],
                 "response_time": response_time,
+                "timings": None,
                 "scores": {
                     "exactitud": 0,
                     "cobertura": 0,
@@ -283,7 +320,12 @@ class ChatbotEvaluator:
         print(f"  📊 Scores: Exactitud={exactitud}, Cobertura={cobertura}, Claridad={claridad}")
         print(f"            Citas={citas}, Alucinación={alucinacion}, Seguridad={seguridad}")
         print(f"  🎯 Total: {total_score}/100")
-        print(f"  ⏱️  Tiempo: {response_time:.2f}s\n")
+        timings = response.get('timings')
+        if timings:
+            stages = ", ".join(f"{name}={ms:.0f}ms" for name, ms in timings['stages_ms'].items())
+            print(f"  ⏱️  Tiempo: {response_time:.2f}s ({stages})\n")
+        else:
+            print(f"  ⏱️  Tiempo: {response_time:.2f}s\n")
         
         return {
             "question_id": question_id,
@@ -296,6 +338,7 @@ class ChatbotEvaluator:
             "expected_keywords": expected_keywords,
             "expected_documents": expected_docs,
             "response_time": response_time,
+            "timings": timings,
             "scores": {
                 "exactitud": exactitud,
                 "cobertura": cobertura,
@@ -342,6 +385,18 @@ class ChatbotEvaluator:
             print(f"🤖 EVALUANDO MODELO: {model.upper()}")
             print(f"{'='*70}\n")
             
+            if self.batch:
+                print(f"📦 Enviando {total_questions} preguntas a /chat/batch...\n")
+                batch_results = self.query_chatbot_batch([q['question'] for q in questions], model=model)
+                missing = ({"error": "Sin respuesta en el lote"}, 0.0)
+                for idx, question_data in enumerate(questions, 1):
+                    result = self.evaluate_question(
+                        question_data, model, idx, total_questions,
+                        batch_result=batch_results.get(idx - 1, missing)
+                    )
+                    self.results.append(result)
+                continue
+            
             for idx, question_data in enumerate(questions, 1):
                 result = self.evaluate_question(question_data, model, idx, total_questions)
                 self.results.append(result)
@@ -431,6 +486,14 @@ class ChatbotEvaluator:
             
             difficulty_avg = {diff: sum(scores) / len(scores) for diff, scores in difficulties.items()}
             
+            # Tiempo promedio por etapa (servidor), solo respuestas con desglose
+            stage_times = {}
+            for result in results:
+                if result.get('timings'):
+                    for stage, ms in result['timings']['stages_ms'].items():
+                        stage_times.setdefault(stage, []).append(ms)
+            stage_avg = {stage: round(sum(values) / len(values), 1) for stage, values in stage_times.items()}
+            
             model_stats[model] = {
                 "total_questions": n,
                 "average_scores": {
@@ -444,7 +507,8 @@ class ChatbotEvaluator:
                 },
                 "by_category": {cat: round(avg, 2) for cat, avg in category_avg.items()},
                 "by_difficulty": {diff: round(avg, 2) for diff, avg in difficulty_avg.items()},
-                "avg_response_time": round(sum(r['response_time'] for r in results) / n, 2)
+                "avg_response_time": round(sum(r['response_time'] for r in results) / n, 2),
+                "avg_stage_ms": stage_avg
             }
         
         # Estadísticas generales
@@ -537,6 +601,18 @@ class ChatbotEvaluator:
             for model, stats in summary['by_model'].items():
                 f.write(f"| {model} | {stats['avg_response_time']} |\n")
             
+            # Desglose por etapa (header Server-Timing / campo timings de /chat)
+            stages = sorted({stage for stats in summary['by_model'].values() for stage in stats['avg_stage_ms']})
+            if stages:
+                f.write("\n### Tiempo Promedio por Etapa (ms)\n\n")
+                f.write("| Etapa | " + " | ".join(summary['by_model'].keys()) + " |\n")
+                f.write("|" + "---|" * (len(summary['by_model']) + 1) + "\n")
+                for stage in stages:
+                    row = f"| {stage} |"
+                    for model_stats in summary['by_model'].values():
+                        row += f" {model_stats['avg_stage_ms'].get(stage, '-')} |"
+                    f.write(row + "\n")
+            
             # Detalles por modelo
             for model, stats in summary['by_model'].items():
                 f.write(f"\n## 📌 Detalles: {model.upper()}\n\n")
@@ -558,5 +634,6 @@ class ChatbotEvaluator:
 
 
 if __name__ == "__main__":
-    evaluator = ChatbotEvaluator()
+    # --batch: enviar todas las preguntas de cada modelo en una request a /chat/batch
+    evaluator = ChatbotEvaluator(batch="--batch" in sys.argv)
     evaluator.run_evaluation()
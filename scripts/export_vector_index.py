@@ -0,0 +1,32 @@
+#!/usr/bin/env python3
+"""
+Script para exportar la colección de ChromaDB a un snapshot del índice
+vectorial en proceso (RETRIEVAL_BACKEND=numpy).
+"""
+
+import sys
+import logging
+from pathlib import Path
+
+# Añadir el directorio app al path
+sys.path.insert(0, str(Path(__file__).parent.parent / "app"))
+
+logging.basicConfig(level=logging.INFO, format='%(levelname)s: %(message)s')
+logger = logging.getLogger(__name__)
+
+def main():
+    try:
+        from rag.retrieval import export_vector_index
+        from config.settings import settings
+        
+        logger.info(f"📦 Exportando índice vectorial a {settings.VECTOR_INDEX_DIR} ({settings.VECTOR_INDEX_DTYPE})...")
+        info = export_vector_index()
+        logger.info(f"✅ Snapshot {info['version']}: {info['count']} chunks, dim={info['dim']}")
+        return True
+    except Exception as e:
+        logger.error(f"❌ Error exportando índice: {e}", exc_info=True)
+        return False
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
@@ -5,6 +5,7 @@ Lee todos los archivos del corpus y extrae información básica.
 """
 
 import os
+import sys
 import json
 from pathlib import Path
 
@@ -25,30 +26,55 @@ BASE_DIR = Path(__file__).parent.parent
 CORPUS_DIR = BASE_DIR / "data" / "corpus"
 OUTPUT_FILE = CORPUS_DIR / "corpus_metadata.json"
 
+# Cache de texto extraído compartido con la ingesta (data/cache/text)
+sys.path.insert(0, str(BASE_DIR / "app"))
+from utils.text_cache import TextCache
+from rag.file_loader import FileLoader
+
+TEXT_CACHE = TextCache(BASE_DIR / "data" / "cache" / "text", root=BASE_DIR / "data")
+# Extrae con el mismo extractor que la ingesta y deja las páginas en el cache
+LOADER = FileLoader(text_cache=TEXT_CACHE)
+
+def read_pdf_info(pdf_path):
+    """
+    Título y páginas de un PDF. Si ya están en el cache no se abre el PDF;
+    si no, se extraen (dejando las páginas en el cache para la ingesta) y se
+    guardan el título y el número de páginas junto a ellas.
+    """
+    info = TEXT_CACHE.get_info(pdf_path)
+    pages = TEXT_CACHE.iter_pages(pdf_path)
+    if info is not None and pages is not None:
+        return info['title'], next(pages, ''), info['total_pages']
+    
+    # Intentar obtener metadata
+    with open(pdf_path, 'rb') as file:
+        metadata = PdfReader(file).metadata
+    title = str(metadata.get('/Title', '') or '') if metadata else ''
+    
+    first_page = None
+    total_pages = 0
+    for page in LOADER.iter_pages(str(pdf_path)):
+        if first_page is None:
+            first_page = page
+        total_pages += 1
+    TEXT_CACHE.put_info(pdf_path, {'title': title, 'total_pages': total_pages})
+    return title, first_page or '', total_pages
+
 def extract_pdf_info(pdf_path):
     """Extrae título y primeras líneas de un PDF"""
     try:
-        with open(pdf_path, 'rb') as file:
-            pdf_reader = PdfReader(file)
-            
-            # Intentar obtener metadata
-            metadata = pdf_reader.metadata
-            title = metadata.get('/Title', '') if metadata else ''
-            
-            # Obtener primeras líneas del texto
-            first_page = pdf_reader.pages[0]
-            text = first_page.extract_text()
-            
-            # Limpiar y obtener primeras líneas
-            lines = [line.strip() for line in text.split('\n') if line.strip()]
-            first_lines = lines[:5] if len(lines) >= 5 else lines
-            
-            return {
-                'title': title,
-                'first_lines': first_lines,
-                'total_pages': len(pdf_reader.pages),
-                'text_preview': ' '.join(first_lines[:2])[:200]
-            }
+        title, text, total_pages = read_pdf_info(pdf_path)
+        
+        # Limpiar y obtener primeras líneas
+        lines = [line.strip() for line in text.split('\n') if line.strip()]
+        first_lines = lines[:5] if len(lines) >= 5 else lines
+        
+        return {
+            'title': title,
+            'first_lines': first_lines,
+            'total_pages': total_pages,
+            'text_preview': ' '.join(first_lines[:2])[:200]
+        }
     except Exception as e:
         print(f"Error leyendo {pdf_path}: {e}")
         return None
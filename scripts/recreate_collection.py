@@ -17,6 +17,7 @@ logger = logging.getLogger(__name__)
 def recreate_collection():
     """Recrea la colección con Gemini embeddings"""
     from rag.chroma_client import get_chroma_client
+    from rag.chroma_manager import invalidate_collection
     from rag.embeddings import embedding_function
     
     client = get_chroma_client()
@@ -38,6 +39,7 @@ def recreate_collection():
         # Borrar colección
         logger.info("🗑️  Borrando colección antigua...")
         client.delete_collection(collection_name)
+        invalidate_collection(collection_name)
         logger.info("✅ Colección borrada")
     else:
         logger.info(f"📦 No existe colección '{collection_name}'")
@@ -84,6 +86,7 @@ def reingest_documents():
 def verify_embeddings():
     """Verifica que la colección esté usando Gemini embeddings"""
     from rag.chroma_manager import get_or_create_collection
+    from rag.collection_scan import iter_records, log_progress
     
     logger.info("🔍 Verificando configuración final...")
     collection = get_or_create_collection("documentos_ucaldas")
@@ -92,6 +95,20 @@ def verify_embeddings():
     logger.info(f"✅ Total chunks: {collection.count()}")
     logger.info(f"✅ Embedding function: {type(collection._embedding_function).__name__}")
     
+    # Recorrer la colección por páginas (solo metadatos) para validar cada chunk
+    document_ids = set()
+    missing_metadata = 0
+    records = iter_records(collection, include=["metadatas"], progress=log_progress("Verificando chunks"))
+    for record in records:
+        doc_id = (record["metadata"] or {}).get("id")
+        if doc_id:
+            document_ids.add(doc_id)
+        else:
+            missing_metadata += 1
+    logger.info(f"✅ Documentos en la colección: {len(document_ids)}")
+    if missing_metadata:
+        logger.warning(f"⚠️  {missing_metadata} chunks sin id de documento en los metadatos")
+    
     # Hacer una prueba de búsqueda
     logger.info("\n🧪 Prueba de búsqueda con Gemini embeddings...")
     test_query = "¿Qué aplicaciones tiene la IA en agricultura?"
@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""
+Prueba del circuit breaker con un proveedor que siempre excede su
+presupuesto de latencia: los timeouts deben contar como fallos y abrir el
+circuito, y el límite de concurrencia debe bajar.
+
+No llama a ningún proveedor real (no requiere API keys ni ChromaDB).
+
+Uso:
+    python scripts/test_provider_resilience.py
+"""
+
+import asyncio
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "app"))
+
+from config.settings import settings  # noqa: E402
+from rag.models import ModelManager, ModelProvider  # noqa: E402
+from rag.resilience import OPEN  # noqa: E402
+from rag.routing import ModelRouter  # noqa: E402
+
+BUDGET_MS = 100
+FAILURE_THRESHOLD = 2
+
+
+class HangingProvider(ModelProvider):
+    """Proveedor que nunca responde dentro del presupuesto."""
+
+    async def agenerate_response(self, prompt: str, response_mode: str = "extended") -> str:
+        await asyncio.sleep(BUDGET_MS / 1000 * 10)
+        return "demasiado tarde"
+
+
+class FakeModelManager(ModelManager):
+    def _initialize_providers(self):
+        self.providers["gemini"] = HangingProvider(api_key="test")
+
+
+async def run() -> bool:
+    settings.CIRCUIT_FAILURE_THRESHOLD = FAILURE_THRESHOLD
+    manager = FakeModelManager()
+    router = ModelRouter(manager, budgets_ms={"gemini": BUDGET_MS}, failover=False)
+    initial_limit = manager.protection("gemini")[1].limit
+
+    errors = []
+    for _ in range(5):
+        try:
+            await router.agenerate("gemini", lambda model_id: "¿pregunta?")
+        except RuntimeError as e:
+            errors.append(str(e))
+
+    status = manager.get_provider_status()["gemini"]
+    print(f"Circuito: {status['circuit']}")
+    print(f"Concurrencia: {status['concurrency']}")
+
+    checks = {
+        "el circuito se abre": status["circuit"]["state"] == OPEN,
+        "los timeouts cuentan como fallos": status["circuit"]["consecutive_failures"] >= FAILURE_THRESHOLD,
+        "con el circuito abierto no se llama al proveedor": status["circuit"]["rejected"] > 0
+            and any("Circuito abierto" in error for error in errors),
+        "el límite de concurrencia baja": status["concurrency"]["limit"] < initial_limit,
+        "se registran los timeouts": status["concurrency"]["timeouts"] == FAILURE_THRESHOLD,
+        "no quedan llamadas en curso": status["concurrency"]["in_flight"] == 0
+    }
+    for name, passed in checks.items():
+        print(f"{'✅' if passed else '❌'} {name}")
+    return all(checks.values())
+
+
+if __name__ == "__main__":
+    sys.exit(0 if asyncio.run(run()) else 1)